@@ -3,10 +3,14 @@ Backend server for Elderly Voice Agent
 Handles messaging, calls, and notifications
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
+import functools
+import io
 import os
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 import json
@@ -14,6 +18,11 @@ import json
 from messaging_service import MessagingService
 from call_service import CallService
 from notification_service import NotificationService
+from message_archive import ARCHIVE_CHECK_INTERVAL, MessageArchive
+from persistence import open_store
+from conversation_feed import OVERFLOW
+from rate_limiter import RateLimiter, retry_after_header
+from records import Message, from_iso
 
 load_dotenv()
 
@@ -28,9 +37,32 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 messaging_service = MessagingService()
 call_service = CallService()
 notification_service = NotificationService()
+# Snapshot + write-ahead log under DATA_DIR; opened by the serving process (see __main__)
+store = None
+# Token buckets per user and route (RATE_LIMITS), and per client address for sends and calls
+# (RATE_LIMITS_PER_CLIENT); protects the backend and the Daily quota
+rate_limiter = RateLimiter()
+
+# Upper bound on /api/messages/search results; matches go into an LLM prompt
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 20))
+
+# Export responses are flushed in chunks of about this many bytes
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', 64 * 1024))
+# Imported messages are stored this many at a time
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+IMPORT_READ_BUFFER = 64 * 1024
+# How many bad import lines are described in the response (all are counted)
+IMPORT_MAX_ERRORS = 20
+
+# Live tail: messages replayed on connect, per-subscriber queue bound, keep-alive interval
+STREAM_BACKLOG = int(os.getenv('STREAM_BACKLOG', 20))
+STREAM_MAX_BACKLOG = 200
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 100))
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', 15))
 
 # Store connected clients (user_id -> session_id)
 connected_clients = {}
+connected_clients_lock = threading.Lock()
 # Simple helper to log function/tool calls
 def log_tool_call(action: str, payload: dict):
     try:
@@ -50,6 +82,51 @@ def log_tool_call(action: str, payload: dict):
     print(f"[BACKEND][{ts}] {marker} from {ip} payload={body}")
 
 
+def request_user(read_body: bool = True) -> str:
+    """Who a request is on behalf of: the sender/caller/user it names, else the
+    X-User-Id header, else the default resident 'user'
+
+    Views act for this user and the rate limiter spends this user's buckets,
+    so voice sessions sharing one frontend host are still limited apart. The
+    client names it, so some routes are limited per address as well.
+    """
+    data = request.get_json(silent=True) if read_body and request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    return str(
+        data.get('sender') or data.get('caller') or data.get('user')
+        or (request.view_args or {}).get('user_id')
+        or request.args.get('user')
+        or request.headers.get('X-User-Id')
+        or 'user'
+    )
+
+
+def rate_limited(route: str, read_body: bool = True):
+    """Refuse with 429 and Retry-After once the caller's bucket for route is empty
+
+    read_body=False for views that stream the request body themselves.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            decision = rate_limiter.check(route, request_user(read_body), request.remote_addr)
+            if not decision.allowed:
+                response = jsonify({
+                    "status": "error",
+                    "message": "Too many requests, please try again shortly",
+                    "retry_after": round(decision.retry_after, 2)
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = retry_after_header(decision.retry_after)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.headers['X-RateLimit-Limit'] = f'{decision.limit.burst:g}'
+            response.headers['X-RateLimit-Remaining'] = str(int(decision.remaining))
+            return response
+        return wrapper
+    return decorator
+
+
 @app.route('/')
 def index():
     return jsonify({
@@ -62,13 +139,14 @@ def index():
 # ============== Messaging API ==============
 
 @app.route('/api/messages/send', methods=['POST'])
+@rate_limited('send_message')
 def send_message():
     """Send a text message to a contact"""
     try:
         data = request.json
         contact = data.get('contact')
         message = data.get('message')
-        sender = data.get('sender', 'user')
+        sender = request_user()
 
         log_tool_call('send_message', {
             'contact': contact,
@@ -83,13 +161,15 @@ def send_message():
         result = messaging_service.send_message(sender, contact, message)
 
         if result['success']:
-            # Notify recipient via WebSocket if they're connected
-            if contact in connected_clients:
-                socketio.emit('new_message', {
-                    'from': sender,
-                    'message': message,
-                    'timestamp': datetime.now().isoformat()
-                }, room=connected_clients[contact])
+            # Notify recipient via WebSocket; the user's room reaches their app
+            # and any voice agent subscribed on their behalf
+            socketio.emit('new_message', {
+                'message_id': result['message_id'],
+                'from': sender,
+                'to': contact,
+                'message': message,
+                'timestamp': datetime.now().isoformat()
+            }, room=contact)
 
             return jsonify({"status": "success", "message_id": result['message_id']}), 200
         else:
@@ -100,24 +180,227 @@ def send_message():
 
 
 @app.route('/api/messages/history', methods=['GET'])
+@rate_limited('get_message_history')
 def get_message_history():
     """Get message history with a contact"""
     try:
         contact = request.args.get('contact')
-        user = request.args.get('user', 'user')
+        user = request_user()
         limit = int(request.args.get('limit', 50))
+        # Paging: the messages before this ISO timestamp (the oldest one of the previous page)
+        before = request.args.get('before') or None
 
         log_tool_call('get_message_history', {
             'contact': contact,
             'user': user,
-            'limit': limit
+            'limit': limit,
+            'before': before
         })
 
         if not contact:
             return jsonify({"status": "error", "message": "Missing contact parameter"}), 400
+        try:
+            before_us = from_iso(before)
+        except ValueError:
+            return jsonify({"status": "error", "message": f"Invalid before timestamp {before!r}"}), 400
+
+        messages = messaging_service.get_history(user, contact, limit, before_us)
+        return jsonify({"status": "success", "messages": [msg.to_dict() for msg in messages]}), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/messages/search', methods=['GET'])
+@rate_limited('search_messages')
+def search_messages():
+    """Full-text search over a user's messages, best matches first"""
+    try:
+        query = request.args.get('q', '').strip()
+        user = request_user()
+        contact = request.args.get('contact') or None
+        limit = min(max(int(request.args.get('limit', 5)), 1), SEARCH_MAX_RESULTS)
+
+        log_tool_call('search_messages', {
+            'q': query,
+            'user': user,
+            'contact': contact,
+            'limit': limit
+        })
+
+        if not query:
+            return jsonify({"status": "error", "message": "Missing q parameter"}), 400
+
+        matches, total = messaging_service.search(user, query, contact, limit)
+        return jsonify({
+            "status": "success",
+            "query": query,
+            "messages": [dict(msg.to_dict(), score=score) for score, msg in matches],
+            "total_matches": total
+        }), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/messages/export', methods=['GET'])
+@rate_limited('export_messages')
+def export_messages():
+    """Stream a user's messages (or one conversation) as NDJSON, one message per line"""
+    user = request_user()
+    contact = request.args.get('contact') or None
+
+    log_tool_call('export_messages', {
+        'user': user,
+        'contact': contact
+    })
 
-        messages = messaging_service.get_history(user, contact, limit)
-        return jsonify({"status": "success", "messages": messages}), 200
+    def generate():
+        # No Content-Length, so the response goes out with chunked transfer encoding
+        chunk, size = [], 0
+        for msg in messaging_service.iter_messages(user, contact, include_archived=True):
+            line = json.dumps(msg.to_dict(), ensure_ascii=False) + '\n'
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield ''.join(chunk)
+
+    filename = f"messages-{user}{'-' + contact if contact else ''}.ndjson"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@app.route('/api/messages/stream', methods=['GET'])
+@rate_limited('stream_messages')
+def stream_messages():
+    """Live tail of a conversation as NDJSON: the last few messages, then each new one as it is sent
+
+    Lines are {"type": "message", ...message fields}, one {"type": "ready"} once
+    the backlog is out, and {"type": "overflow"} before the server hangs up on
+    a client that fell too far behind (reconnect to catch up). Blank lines are
+    keep-alives.
+    """
+    contact = request.args.get('contact')
+    user = request_user()
+    if not contact:
+        return jsonify({"status": "error", "message": "Missing contact parameter"}), 400
+    try:
+        backlog = min(max(int(request.args.get('backlog', STREAM_BACKLOG)), 0), STREAM_MAX_BACKLOG)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid backlog"}), 400
+
+    log_tool_call('stream_messages', {
+        'contact': contact,
+        'user': user,
+        'backlog': backlog
+    })
+
+    # Subscribe before reading the backlog so nothing sent in between is missed
+    feed = messaging_service.feed
+    subscription = feed.subscribe(user, contact, STREAM_QUEUE_SIZE)
+    recent = messaging_service.get_history(user, contact, backlog) if backlog else []
+
+    def line(msg: Message) -> str:
+        return json.dumps(dict(msg.to_dict(), type='message'), ensure_ascii=False) + '\n'
+
+    def generate():
+        replayed = {msg.id for msg in recent}
+        try:
+            yield ''.join(line(msg) for msg in recent) + json.dumps({'type': 'ready'}) + '\n'
+            while True:
+                item = subscription.get(STREAM_HEARTBEAT)
+                if item is None:
+                    # Keeps proxies from timing out, and is how a gone client is noticed
+                    yield '\n'
+                    continue
+                lines = []
+                while item is not None and item is not OVERFLOW:
+                    if item.id not in replayed:
+                        lines.append(line(item))
+                    item = subscription.get(0)
+                if lines:
+                    yield ''.join(lines)
+                if item is OVERFLOW:
+                    yield json.dumps({'type': 'overflow', 'message': 'Too far behind, reconnect to catch up'}) + '\n'
+                    return
+        finally:
+            feed.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/messages/import', methods=['POST'])
+@rate_limited('import_messages', read_body=False)
+def import_messages():
+    """Bulk-load an NDJSON archive (the export format), read and stored in batches"""
+    try:
+        imported = 0
+        skipped = 0
+        errors = []
+        batch = []
+
+        # Read line by line, never holding the archive in memory. The raw request
+        # stream's readline() reads a byte at a time, hence the buffering
+        for line_number, line in enumerate(io.BufferedReader(request.stream, IMPORT_READ_BUFFER), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(Message.from_dict(json.loads(line)))
+            except (ValueError, TypeError) as e:  # json.JSONDecodeError is a ValueError
+                skipped += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({'line': line_number, 'error': str(e)})
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                added = messaging_service.add_messages(batch)
+                imported += added
+                skipped += len(batch) - added  # already stored: a repeated import
+                batch = []
+
+        if batch:
+            added = messaging_service.add_messages(batch)
+            imported += added
+            skipped += len(batch) - added
+
+        log_tool_call('import_messages', {
+            'imported': imported,
+            'skipped': skipped
+        })
+
+        return jsonify({"status": "success", "imported": imported, "skipped": skipped, "errors": errors}), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# ============== User State API ==============
+
+@app.route('/api/users/<user_id>/state', methods=['GET'])
+@rate_limited('get_user_state')
+def get_user_state(user_id):
+    """Everything a voice session needs up front: unread messages, pending calls, notifications"""
+    try:
+        return jsonify({
+            "status": "success",
+            "user_id": user_id,
+            "unread_messages": [msg.to_dict() for msg in messaging_service.get_unread_messages(user_id)],
+            "pending_calls": [call.to_dict() for call in call_service.get_pending_calls(user_id)],
+            "notifications": [
+                notif.to_dict() for notif in notification_service.get_notifications(user_id, unread_only=True)
+            ],
+            "timestamp": datetime.now().isoformat()
+        }), 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -126,13 +409,14 @@ def get_message_history():
 # ============== Call API ==============
 
 @app.route('/api/calls/request', methods=['POST'])
+@rate_limited('request_call')
 def request_call():
     """Request a voice or video call"""
     try:
         data = request.json
         contact = data.get('contact')
         call_type = data.get('type', 'voice')  # 'voice' or 'video'
-        caller = data.get('caller', 'user')
+        caller = request_user()
 
         log_tool_call('request_call', {
             'contact': contact,
@@ -152,14 +436,14 @@ def request_call():
         if result['success']:
             call_id = result['call_id']
 
-            # Notify recipient via WebSocket
-            if contact in connected_clients:
-                socketio.emit('incoming_call', {
-                    'call_id': call_id,
-                    'from': caller,
-                    'type': call_type,
-                    'timestamp': datetime.now().isoformat()
-                }, room=connected_clients[contact])
+            # Notify recipient via WebSocket (app and subscribed voice agents)
+            socketio.emit('incoming_call', {
+                'call_id': call_id,
+                'from': caller,
+                'to': contact,
+                'type': call_type,
+                'timestamp': datetime.now().isoformat()
+            }, room=contact)
 
             return jsonify({
                 "status": "success", 
@@ -174,13 +458,14 @@ def request_call():
 
 
 @app.route('/api/calls/respond', methods=['POST'])
+@rate_limited('respond_to_call')
 def respond_to_call():
     """Accept or reject an incoming call"""
     try:
         data = request.json
         call_id = data.get('call_id')
         accept = data.get('accept', False)
-        user = data.get('user', 'user')
+        user = request_user()
 
         log_tool_call('respond_to_call', {
             'call_id': call_id,
@@ -198,14 +483,15 @@ def respond_to_call():
             if result['success']:
                 # Notify caller that call was accepted
                 call_info = call_service.get_call_info(call_id)
-                caller = call_info['caller']
+                caller = call_info.caller
 
-                if caller in connected_clients:
+                caller_sid = connected_clients.get(caller)
+                if caller_sid:
                     socketio.emit('call_accepted', {
                         'call_id': call_id,
                         'room_url': result['room_url'],
                         'timestamp': datetime.now().isoformat()
-                    }, room=connected_clients[caller])
+                    }, room=caller_sid)
 
                 return jsonify({
                     "status": "success",
@@ -220,13 +506,14 @@ def respond_to_call():
             if result['success']:
                 # Notify caller that call was rejected
                 call_info = call_service.get_call_info(call_id)
-                caller = call_info['caller']
+                caller = call_info.caller
 
-                if caller in connected_clients:
+                caller_sid = connected_clients.get(caller)
+                if caller_sid:
                     socketio.emit('call_rejected', {
                         'call_id': call_id,
                         'timestamp': datetime.now().isoformat()
-                    }, room=connected_clients[caller])
+                    }, room=caller_sid)
 
                 return jsonify({"status": "success"}), 200
             else:
@@ -237,6 +524,7 @@ def respond_to_call():
 
 
 @app.route('/api/calls/end', methods=['POST'])
+@rate_limited('end_call')
 def end_call():
     """End an active call"""
     try:
@@ -261,6 +549,38 @@ def end_call():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# ============== Admin API ==============
+
+@app.route('/api/rate-limits', methods=['GET'])
+def rate_limit_stats():
+    """Configured limits and how many requests each route allowed and throttled"""
+    return jsonify({"status": "success", **rate_limiter.stats()}), 200
+
+
+@app.route('/api/persistence', methods=['GET'])
+def persistence_stats():
+    """Write-ahead log and snapshot counters, what was recovered at startup, and the message archive"""
+    stats = store.stats() if store else {'enabled': False}
+    if messaging_service.archive is not None:
+        stats['archive'] = messaging_service.archive.stats()
+    return jsonify({"status": "success", **stats}), 200
+
+
+def archive_cold_messages():
+    """Move months older than the hot window to ARCHIVE_DIR, at startup and every ARCHIVE_CHECK_INTERVAL"""
+    while True:
+        try:
+            moved = messaging_service.archive_cold()
+            if moved:
+                print(f"Archived {moved} messages to {messaging_service.archive.directory}")
+                if store:
+                    # So a restart doesn't load them back into memory from the last snapshot
+                    store.snapshot()
+        except OSError as e:
+            print(f"Error archiving messages: {e}")
+        time.sleep(ARCHIVE_CHECK_INTERVAL)
+
+
 # ============== WebSocket Events ==============
 
 @socketio.on('connect')
@@ -276,10 +596,11 @@ def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
 
     # Remove from connected clients
-    for user_id, session_id in list(connected_clients.items()):
-        if session_id == request.sid:
-            del connected_clients[user_id]
-            break
+    with connected_clients_lock:
+        for user_id, session_id in list(connected_clients.items()):
+            if session_id == request.sid:
+                del connected_clients[user_id]
+                break
 
 
 @socketio.on('register')
@@ -287,22 +608,41 @@ def handle_register(data):
     """Register a user with their session ID"""
     user_id = data.get('user_id')
     if user_id:
-        connected_clients[user_id] = request.sid
+        with connected_clients_lock:
+            connected_clients[user_id] = request.sid
         join_room(user_id)
         emit('registered', {'status': 'success', 'user_id': user_id})
         print(f"User {user_id} registered with session {request.sid}")
 
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Receive a user's events without becoming their client (used by the voice agents)"""
+    user_id = data.get('user_id')
+    if user_id:
+        join_room(user_id)
+        emit('subscribed', {'status': 'success', 'user_id': user_id})
+
+
 @socketio.on('unregister')
 def handle_unregister(data):
     """Unregister a user"""
     user_id = data.get('user_id')
-    if user_id and user_id in connected_clients:
+    if not user_id:
+        return
+    with connected_clients_lock:
+        registered = connected_clients.pop(user_id, None) is not None
+    if registered:
         leave_room(user_id)
-        del connected_clients[user_id]
         emit('unregistered', {'status': 'success'})
 
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8000))
+    # The debug reloader's parent only watches files; the child it starts serves (and owns DATA_DIR)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        store = open_store(messaging_service, call_service, notification_service, os.getenv('DATA_DIR', ''))
+        if os.getenv('ARCHIVE_DIR'):
+            messaging_service.archive = MessageArchive(os.getenv('ARCHIVE_DIR'))
+            threading.Thread(target=archive_cold_messages, name='archiver', daemon=True).start()
     socketio.run(app, host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,692 @@
+"""
+Backend benchmark suite
+
+Runs the Flask app in-process (Flask test client for REST, the Flask-SocketIO
+test client for Socket.IO) against fresh in-memory services, so no server,
+network or Daily account is needed:
+
+  send_throughput         POST /api/messages/send, requests/s and latency
+  history_vs_store_size   GET /api/messages/history as the store grows (1k -> 1M)
+  search_vs_store_size    GET /api/messages/search as the store grows
+  export_import           NDJSON export then bulk import of the same archive
+  record_memory           bytes per stored message, old dict records vs records.Message
+  notifications_vs_count  NotificationService.get_notifications vs notifications per user
+  call_cycle              request -> accept -> end against a local fake Daily API
+  emit_fanout             POST /api/messages/send with N Socket.IO clients in the room
+  stream_fanout           POST /api/messages/send with N live-tail subscribers, one stalled
+  rate_limit              a runaway sender vs other residents, and the cost of one limiter check
+  persistence             write-ahead log cost per send, write amplification, restart time (1M+ records)
+  archive                 two years of messages with all but 3 months archived: scans, paging, search
+
+Usage:
+  python benchmarks.py                         # everything, default sizes
+  python benchmarks.py --quick                 # smaller sizes, for a smoke run
+  python benchmarks.py --only history_vs_store_size --sizes 1000,1000000
+  python benchmarks.py --out results.json      # machine-readable results
+
+Results are written as JSON (benchmarks.json by default) with the run's
+environment, so successive runs can be compared for regressions.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+import app as backend
+from call_service import CallService
+from conversation_feed import OVERFLOW
+from messaging_service import MessagingService
+from notification_service import NotificationService
+from message_archive import MessageArchive
+from persistence import Store
+from rate_limiter import RateLimiter, parse_limits
+from records import Message, new_id
+
+RESIDENT = 'user'
+
+# Message bodies draw Zipf-distributed words from a 2k vocabulary; the named
+# words sit at ranks 50-73, so each turns up in roughly 1% of messages
+WORDS = (
+    'sunday lunch doctor appointment garden church football birthday cake grandchildren '
+    'weather rain walk tea visit tuesday friday pharmacy medicine photo holiday train'
+).split()
+VOCABULARY = [f'w{rank}' for rank in range(50)] + WORDS + [f'w{rank}' for rank in range(74, 2000)]
+VOCABULARY_WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds for samples in seconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return round(ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': pick(50),
+        'p95_ms': pick(95),
+        'p99_ms': pick(99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn: Callable, n: int) -> List[float]:
+    samples = []
+    for i in range(n):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextlib.contextmanager
+def quiet():
+    """The request logging (log_tool_call, connect/disconnect prints) still runs, just not to the terminal"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def reset_services():
+    backend.messaging_service = MessagingService()
+    backend.call_service = CallService()
+    backend.notification_service = NotificationService()
+    backend.connected_clients.clear()
+    # The benchmarks hammer single users on purpose; bench_rate_limit measures the limiter itself
+    backend.rate_limiter = RateLimiter(enabled=False)
+
+
+def message_bodies(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [' '.join(rng.choices(VOCABULARY, VOCABULARY_WEIGHTS, k=6)) for _ in range(count)]
+
+
+def fill_messages(service: MessagingService, count: int, contacts: int = 100):
+    """``count`` messages between the resident and ``contacts`` contacts, oldest first"""
+    rng = random.Random(count)
+    start = int(datetime(2024, 1, 1).timestamp()) * 1_000_000
+    service.add_messages([
+        Message(
+            new_id(),
+            RESIDENT if i % 2 else f'contact-{c}',
+            f'contact-{c}' if i % 2 else RESIDENT,
+            body,
+            start + i * 1_000_000,
+            'read',
+        )
+        for i, c, body in zip(range(count), (rng.randrange(contacts) for _ in range(count)), message_bodies(count, count))
+    ])
+
+
+# ============== Benchmarks ==============
+
+def bench_send_throughput(requests: int) -> Dict:
+    reset_services()
+    client = backend.app.test_client()
+
+    def send(i):
+        resp = client.post('/api/messages/send', json={'contact': f'contact-{i % 50}', 'message': f'hello {i}'})
+        assert resp.status_code == 200, resp.get_json()
+
+    started = time.perf_counter()
+    samples = timed(send, requests)
+    elapsed = time.perf_counter() - started
+    return {'requests': requests, 'requests_per_s': round(requests / elapsed, 1), 'latency': summarize(samples)}
+
+
+def bench_history_vs_store_size(sizes: List[int], requests: int) -> Dict:
+    client = backend.app.test_client()
+    results = []
+    for size in sizes:
+        reset_services()
+        fill_messages(backend.messaging_service, size)
+
+        def history(i):
+            resp = client.get(f'/api/messages/history?contact=contact-{i % 100}&user={RESIDENT}&limit=50')
+            assert resp.status_code == 200, resp.get_json()
+
+        results.append({'store_size': size, 'latency': summarize(timed(history, requests))})
+        backend.messaging_service = MessagingService()
+    return {'requests_per_size': requests, 'results': results}
+
+
+def bench_search_vs_store_size(sizes: List[int], requests: int) -> Dict:
+    client = backend.app.test_client()
+    queries = ['sunday lunch', 'doctor appointment tuesday', 'birthday cake', 'pharmacy']
+    results = []
+    for size in sizes:
+        reset_services()
+        fill_messages(backend.messaging_service, size)
+
+        def search_all(i):
+            resp = client.get(f'/api/messages/search?q={queries[i % len(queries)]}&user={RESIDENT}&limit=5')
+            assert resp.status_code == 200, resp.get_json()
+
+        def search_contact(i):
+            resp = client.get(
+                f'/api/messages/search?q={queries[i % len(queries)]}&user={RESIDENT}&contact=contact-{i % 100}&limit=5'
+            )
+            assert resp.status_code == 200, resp.get_json()
+
+        results.append({
+            'store_size': size,
+            'all_conversations': summarize(timed(search_all, requests)),
+            'one_conversation': summarize(timed(search_contact, requests)),
+        })
+        backend.messaging_service = MessagingService()
+    return {'requests_per_size': requests, 'results': results}
+
+
+def traced_bytes(build: Callable[[], object]) -> int:
+    """Bytes still allocated once ``build()`` returns, i.e. what its result holds on to"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return held
+
+
+def bench_record_memory(count: int, contacts: int = 100) -> Dict:
+    """Per-message memory: the old dict records vs records.Message, message text excluded"""
+    bodies = message_bodies(count)
+    start = datetime(2024, 1, 1)
+
+    def dicts():
+        # What send_message used to store; names arrive as new strings with every request
+        return [
+            {
+                'id': str(uuid.uuid4()),
+                'sender': f'contact-{i % contacts}',
+                'recipient': ''.join(RESIDENT),
+                'message': body,
+                'timestamp': (start + timedelta(seconds=i)).isoformat(),
+                'status': 'sent',
+            }
+            for i, body in enumerate(bodies)
+        ]
+
+    def records():
+        base = int(start.timestamp()) * 1_000_000
+        return [
+            Message(new_id(), f'contact-{i % contacts}', ''.join(RESIDENT), body, base + i * 1_000_000)
+            for i, body in enumerate(bodies)
+        ]
+
+    before = traced_bytes(dicts)
+    after = traced_bytes(records)
+    return {
+        'messages': count,
+        'avg_text_bytes': round(sum(sys.getsizeof(body) for body in bodies) / count, 1),
+        'dict_bytes_per_message': round(before / count, 1),
+        'record_bytes_per_message': round(after / count, 1),
+        'saved_mb': round((before - after) / 1e6, 1),
+    }
+
+
+class CountingMessagingService(MessagingService):
+    """Counts imported batches instead of storing them, so only the request's own memory remains"""
+
+    def __init__(self):
+        super().__init__()
+        self.added = 0
+
+    def add_messages(self, batch):
+        self.added += len(batch)
+
+
+def bench_export_import(size: int) -> Dict:
+    """GET /api/messages/export then POST /api/messages/import of the same archive"""
+    reset_services()
+    fill_messages(backend.messaging_service, size)
+    client = backend.app.test_client()
+
+    started = time.perf_counter()
+    archive = client.get(f'/api/messages/export?user={RESIDENT}').get_data()
+    export_s = time.perf_counter() - started
+
+    reset_services()
+    started = time.perf_counter()
+    result = client.post('/api/messages/import', data=archive, content_type='application/x-ndjson').get_json()
+    import_s = time.perf_counter() - started
+    assert result['imported'] == size, result
+
+    # Again with nothing kept, traced: the peak is the import's working set, whatever the archive size
+    backend.messaging_service = CountingMessagingService()
+    gc.collect()
+    tracemalloc.start()
+    client.post('/api/messages/import', data=archive, content_type='application/x-ndjson')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    reset_services()
+
+    return {
+        'messages': size,
+        'archive_mb': round(len(archive) / 1e6, 1),
+        'export_s': round(export_s, 3),
+        'export_messages_per_s': round(size / export_s),
+        'import_s': round(import_s, 3),
+        'import_messages_per_s': round(size / import_s),
+        'import_peak_mb': round(peak / 1e6, 2),
+    }
+
+
+def bench_notifications_vs_count(counts: List[int], requests: int, other_users: int = 20) -> Dict:
+    results = []
+    for count in counts:
+        service = NotificationService()
+        # The resident's notifications plus as many for each of the other users
+        for user in [RESIDENT] + [f'contact-{u}' for u in range(other_users)]:
+            for i in range(count):
+                service.create_notification(user, 'message', f'Message {i}', 'hello', {'i': i})
+
+        all_samples = timed(lambda i: service.get_notifications(RESIDENT), requests)
+        unread_samples = timed(lambda i: service.get_notifications(RESIDENT, unread_only=True), requests)
+        results.append({
+            'per_user': count,
+            'total': count * (other_users + 1),
+            'all': summarize(all_samples),
+            'unread_only': summarize(unread_samples),
+        })
+    return {'requests_per_count': requests, 'other_users': other_users, 'results': results}
+
+
+class FakeDaily:
+    """Minimal Daily REST API: POST /rooms and DELETE /rooms/<name>, with optional latency"""
+
+    def __init__(self, latency_ms: float = 0):
+        latency = latency_ms / 1000
+        calls = self.calls = {'create': 0, 'delete': 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, body: Dict):
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                time.sleep(latency)
+                calls['create'] += 1
+                self._reply({'name': data.get('name'), 'url': f"https://bench.daily.co/{data.get('name')}"})
+
+            def do_DELETE(self):
+                time.sleep(latency)
+                calls['delete'] += 1
+                self._reply({'deleted': True, 'name': self.path.rsplit('/', 1)[-1]})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bench_call_cycle(cycles: int, daily_latency_ms: float) -> Dict:
+    reset_services()
+    client = backend.app.test_client()
+    steps = {'request': [], 'accept': [], 'end': []}
+
+    with FakeDaily(daily_latency_ms) as daily:
+        call_service = backend.call_service
+        call_service.daily_api_key = 'bench'
+        call_service.daily_domain = 'bench'
+        call_service.daily_api_url = daily.url
+
+        def cycle(i):
+            t0 = time.perf_counter()
+            resp = client.post('/api/calls/request', json={'contact': RESIDENT, 'caller': f'contact-{i % 20}', 'type': 'video'})
+            call_id = resp.get_json()['call_id']
+            t1 = time.perf_counter()
+            resp = client.post('/api/calls/respond', json={'call_id': call_id, 'accept': True, 'user': RESIDENT})
+            assert resp.status_code == 200, resp.get_json()
+            t2 = time.perf_counter()
+            resp = client.post('/api/calls/end', json={'call_id': call_id})
+            assert resp.status_code == 200, resp.get_json()
+            t3 = time.perf_counter()
+            steps['request'].append(t1 - t0)
+            steps['accept'].append(t2 - t1)
+            steps['end'].append(t3 - t2)
+
+        started = time.perf_counter()
+        samples = timed(cycle, cycles)
+        elapsed = time.perf_counter() - started
+        daily_calls = dict(daily.calls)
+
+    return {
+        'cycles': cycles,
+        'daily_latency_ms': daily_latency_ms,
+        'cycles_per_s': round(cycles / elapsed, 1),
+        'cycle': summarize(samples),
+        'steps': {name: summarize(values) for name, values in steps.items()},
+        'daily_api_calls': daily_calls,
+    }
+
+
+def bench_emit_fanout(client_counts: List[int], requests: int) -> Dict:
+    results = []
+    for count in client_counts:
+        reset_services()
+        rest = backend.app.test_client()
+        clients = [backend.socketio.test_client(backend.app) for _ in range(count)]
+        for sio in clients:
+            sio.emit('subscribe', {'user_id': RESIDENT})
+            sio.get_received()
+
+        def send(i):
+            resp = rest.post('/api/messages/send', json={'contact': RESIDENT, 'sender': 'contact-1', 'message': f'hi {i}'})
+            assert resp.status_code == 200, resp.get_json()
+
+        samples = timed(send, requests)
+        delivered = sum(
+            sum(1 for event in sio.get_received() if event['name'] == 'new_message') for sio in clients
+        )
+        for sio in clients:
+            sio.disconnect()
+        results.append({
+            'clients': count,
+            'latency': summarize(samples),
+            'delivered': delivered,
+            'expected': count * requests,
+        })
+    return {'requests_per_count': requests, 'results': results}
+
+
+def bench_stream_fanout(subscriber_counts: List[int], requests: int) -> Dict:
+    """POST /api/messages/send with N live-tail subscribers on the conversation, one of them stalled"""
+    results = []
+    for count in subscriber_counts:
+        reset_services()
+        rest = backend.app.test_client()
+        feed = backend.messaging_service.feed
+        readers = [feed.subscribe(RESIDENT, 'contact-1', backend.STREAM_QUEUE_SIZE) for _ in range(count)]
+        stalled = readers[0]  # never read: it overflows and is dropped, nobody else waits for it
+
+        received = [0] * count
+
+        def read(i):
+            while True:
+                item = readers[i].get(1)
+                if item is None or item is OVERFLOW:
+                    return
+                received[i] += 1
+
+        threads = [threading.Thread(target=read, args=(i,), daemon=True) for i in range(1, count)]
+        for thread in threads:
+            thread.start()
+
+        def send(i):
+            resp = rest.post('/api/messages/send', json={'contact': RESIDENT, 'sender': 'contact-1', 'message': f'hi {i}'})
+            assert resp.status_code == 200, resp.get_json()
+
+        samples = timed(send, requests)
+        for thread in threads:
+            thread.join()
+        results.append({
+            'subscribers': count,
+            'latency': summarize(samples),
+            'delivered': sum(received),
+            'expected': (count - 1) * requests,
+            'stalled_dropped': stalled.dropped,
+        })
+    return {'requests_per_count': requests, 'queue_size': backend.STREAM_QUEUE_SIZE, 'results': results}
+
+
+def bench_rate_limit(requests: int, users: int = 50) -> Dict:
+    """A runaway client bursting POST /api/messages/send while other residents send normally"""
+    reset_services()
+    limiter = backend.rate_limiter = RateLimiter(parse_limits('default=120/60:30,send_message=20/60:10'), redis_url='')
+    client = backend.app.test_client()
+    statuses = {'runaway': {}, 'others': {}}
+
+    def send(i):
+        # Every other request is the runaway client; the rest are spread over `users` residents
+        who = 'runaway' if i % 2 else 'others'
+        sender = 'runaway-client' if i % 2 else f'resident-{i % users}'
+        resp = client.post('/api/messages/send', json={'contact': 'contact-1', 'sender': sender, 'message': f'hi {i}'})
+        statuses[who][resp.status_code] = statuses[who].get(resp.status_code, 0) + 1
+
+    samples = timed(send, requests)
+
+    # The limiter on its own, uncontended and with every check a different user
+    bare = RateLimiter(parse_limits('default=1000/1:1000'), redis_url='')
+    check_samples = timed(lambda i: bare.check('send_message', f'user-{i % 10_000}'), requests * 10)
+    backend.rate_limiter = RateLimiter(enabled=False)
+
+    return {
+        'requests': requests,
+        'latency': summarize(samples),
+        'status_codes': {who: {str(code): n for code, n in codes.items()} for who, codes in statuses.items()},
+        'throttled': limiter.stats()['throttled'],
+        'check_us': round(sum(check_samples) / len(check_samples) * 1e6, 2),
+    }
+
+
+def bench_persistence(size: int, sends: int) -> Dict:
+    """WAL overhead on send_message, bytes written per byte stored, and restart time from the log and from a snapshot"""
+
+    def services():
+        calls = CallService()
+        calls.daily_api_key = ''
+        return MessagingService(), calls, NotificationService()
+
+    def reopen(directory):
+        started = time.perf_counter()
+        store = Store(directory, *services(), snapshot_interval=float('inf'), snapshot_wal_bytes=2 ** 62)
+        return store, time.perf_counter() - started
+
+    plain = MessagingService()
+    plain_samples = timed(lambda i: plain.send_message(f'contact-{i % 50}', RESIDENT, f'hello {i}'), sends)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store, _ = reopen(directory)
+        messaging, notifications = store.messaging, store.notifications
+        logged_samples = timed(lambda i: messaging.send_message(f'contact-{i % 50}', RESIDENT, f'hello {i}'), sends)
+
+        # Then the bulk of the store: messages plus a notification for every tenth
+        fill_messages(messaging, size)
+        for i in range(size // 10):
+            notifications.create_notification(RESIDENT, 'message', 'New message', f'From contact-{i % 100}')
+        store.close()
+        stored = sum(len(m.sender) + len(m.recipient) + len(m.message.encode()) + 16 + 8 for m in messaging.iter_messages())
+        stored += sum(len(n.user_id) + len(n.type) + len(n.title) + len(n.message) + 16 + 8
+                      for n in notifications.by_id.values())
+        wal_bytes, records, fsyncs = store.wal.bytes, store.wal.records, store.wal.fsyncs
+        del store, messaging, notifications
+        gc.collect()
+
+        store, from_wal_s = reopen(directory)
+        snapshot = store.snapshot()
+        store.close()
+        del store
+        gc.collect()
+
+        store, from_snapshot_s = reopen(directory)
+        recovered = store.recovery['snapshot_records']
+        store.close()
+
+    return {
+        'records': records,
+        'send_us': {'in_memory': summarize(plain_samples)['mean_ms'] * 1000,
+                    'with_wal': summarize(logged_samples)['mean_ms'] * 1000},
+        'wal_bytes_per_record': round(wal_bytes / records, 1),
+        'records_per_fsync': round(records / max(fsyncs, 1)),
+        'write_amplification': {
+            'wal': round(wal_bytes / stored, 2),
+            'wal_plus_snapshot': round((wal_bytes + snapshot['bytes']) / stored, 2),
+        },
+        'snapshot': snapshot,
+        'restart_s': {'from_wal': round(from_wal_s, 2), 'from_snapshot': round(from_snapshot_s, 2)},
+        'recovered_records': recovered,
+    }
+
+
+def bench_archive(size: int, requests: int, months: int = 24) -> Dict:
+    """``size`` messages spread evenly over ``months`` months, before and after archiving all but the hot window"""
+    service = MessagingService()
+    start = int(datetime(2024, 1, 1).timestamp()) * 1_000_000
+    step = months * 30 * 86400 * 1_000_000 // size
+    rng = random.Random(size)
+    contacts = [rng.randrange(100) for _ in range(size)]
+    service.add_messages([
+        Message(new_id(), RESIDENT if i % 2 else f'contact-{c}', f'contact-{c}' if i % 2 else RESIDENT,
+                body, start + i * step, 'read')
+        for i, c, body in zip(range(size), contacts, message_bodies(size, size))
+    ])
+    now = start + size * step
+    missing = str(uuid.uuid4())
+
+    def measure() -> Dict:
+        return {
+            # A full scan: mark_as_read of an id that isn't there
+            'scan': summarize(timed(lambda i: service.mark_as_read(missing), max(requests // 10, 3))),
+            'recent_page': summarize(timed(lambda i: service.get_history(RESIDENT, f'contact-{i % 100}', 50), requests)),
+            'search': summarize(timed(lambda i: service.search(RESIDENT, WORDS[i % len(WORDS)], limit=5), requests)),
+        }
+
+    before = measure()
+    gc.collect()
+    with tempfile.TemporaryDirectory() as directory:
+        service.archive = MessageArchive(directory)
+        started = time.perf_counter()
+        moved = service.archive_cold(now)
+        archive_s = time.perf_counter() - started
+        gc.collect()
+        after = measure()
+
+        # Paging back a year: reads only that conversation's block of each month it reaches
+        year_ago = now - 365 * 86400 * 1_000_000
+        cold_page = timed(lambda i: service.get_history(RESIDENT, f'contact-{i % 100}', 50, year_ago), requests)
+        rare = timed(lambda i: service.search(RESIDENT, f'w{1990 + i % 10} w{1980 + i % 10}', limit=5), max(requests // 10, 3))
+        # Words no message has: every month is a candidate until the manifests rule it out
+        loads = service.archive.stats()['segment_loads']
+        no_hit = timed(lambda i: service.search(RESIDENT, f'nowhere{i}', limit=5), max(requests // 10, 3))
+        no_hit_loads = service.archive.stats()['segment_loads'] - loads
+        stats = service.archive.stats()
+        ndjson_bytes = sum(len(json.dumps(msg.to_dict(), ensure_ascii=False)) + 1 for msg in service.archive.iter_messages())
+
+    return {
+        'messages': size,
+        'months': months,
+        'hot_months': service.hot_months,
+        'archived': moved,
+        'archive_s': round(archive_s, 2),
+        'segments': stats['segments'],
+        'compression': stats['compression'],
+        'compression_ratio': round(ndjson_bytes / stats['bytes'], 1),
+        'all_in_memory': before,
+        'hot_only': after,
+        'cold_page': summarize(cold_page),
+        'search_into_archive': summarize(rare),
+        'search_no_hit': summarize(no_hit),
+        'no_hit_segment_loads': no_hit_loads,
+        'block_reads': stats['block_reads'],
+        'segment_loads': stats['segment_loads'],
+    }
+
+
+# ============== Runner ==============
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the backend REST and Socket.IO paths')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--quick', action='store_true', help='small sizes for a smoke run')
+    parser.add_argument('--sizes', type=_ints, help='message store sizes for history_vs_store_size')
+    parser.add_argument('--requests', type=int, help='base request count (each benchmark scales it)')
+    parser.add_argument('--daily-latency-ms', type=float, default=20, help='fake Daily API latency')
+    parser.add_argument('--out', default='benchmarks.json')
+    args = parser.parse_args(argv)
+
+    n = args.requests or (50 if args.quick else 500)
+    sizes = args.sizes or ([1_000, 10_000] if args.quick else [1_000, 10_000, 100_000, 1_000_000])
+    counts = [10, 100] if args.quick else [10, 100, 1_000, 5_000]
+    fanout = [1, 10] if args.quick else [1, 10, 100, 500]
+
+    benchmarks = {
+        'send_throughput': lambda: bench_send_throughput(n * 4),
+        'history_vs_store_size': lambda: bench_history_vs_store_size(sizes, max(n // 10, 5)),
+        'search_vs_store_size': lambda: bench_search_vs_store_size(sizes, max(n // 10, 5)),
+        'export_import': lambda: bench_export_import(max(sizes) // 10),
+        'record_memory': lambda: bench_record_memory(max(sizes)),
+        'notifications_vs_count': lambda: bench_notifications_vs_count(counts, n),
+        'call_cycle': lambda: bench_call_cycle(max(n // 5, 10), args.daily_latency_ms),
+        'emit_fanout': lambda: bench_emit_fanout(fanout, max(n // 10, 5)),
+        'stream_fanout': lambda: bench_stream_fanout(fanout, n),
+        'rate_limit': lambda: bench_rate_limit(n),
+        'persistence': lambda: bench_persistence(max(sizes), n * 20),
+        'archive': lambda: bench_archive(max(sizes), max(n // 5, 10)),
+    }
+    selected = args.only.split(',') if args.only else list(benchmarks)
+    unknown = [name for name in selected if name not in benchmarks]
+    if unknown:
+        parser.error(f"unknown benchmark(s) {unknown}; choose from {sorted(benchmarks)}")
+
+    report = {'environment': environment(), 'benchmarks': {}}
+    for name in selected:
+        started = time.perf_counter()
+        with quiet():
+            result = benchmarks[name]()
+        result['wall_s'] = round(time.perf_counter() - started, 3)
+        report['benchmarks'][name] = result
+        print(f"{name}: {json.dumps(result)}", file=sys.stderr)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,45 +3,51 @@ Call Service
 Handles voice and video calls
 """
 
-import uuid
-from datetime import datetime
-from typing import Dict
+from operator import attrgetter
+from typing import Dict, List, Optional
 import os
 import requests
 
+from persistence import Journal
+from records import Call, id_str, new_id, now_us, parse_id
+from striped_lock import StripedLock
+
+# Overridable so tests and benchmarks can point calls at a local fake
+DAILY_API_URL = os.getenv('DAILY_API_URL', 'https://api.daily.co/v1').rstrip('/')
+DAILY_API_TIMEOUT = float(os.getenv('DAILY_API_TIMEOUT', '5'))
+
 
 class CallService:
-    """Service for managing voice and video calls"""
+    """Service for managing voice and video calls
+
+    Status changes check and set under the call's stripe of a StripedLock,
+    so two racing accepts (or an accept racing a reject) can't both win.
+    Daily.co requests are made outside the lock.
+    """
 
     def __init__(self):
         # In-memory storage (replace with database in production)
-        self.calls = {}
+        self.calls: Dict[bytes, Call] = {}
+        self._locks = StripedLock()
+        # Change log for persistence; records nothing unless DATA_DIR is set
+        self.journal = Journal()
 
         # Daily.co API credentials (for WebRTC rooms)
         self.daily_api_key = os.getenv('DAILY_API_KEY', '')
         self.daily_domain = os.getenv('DAILY_DOMAIN', '')
+        self.daily_api_url = DAILY_API_URL
 
     def create_call(self, caller: str, recipient: str, call_type: str) -> Dict:
         """Create a new call request"""
         try:
-            call_id = str(uuid.uuid4())
+            raw_id = new_id()
+            call_id = id_str(raw_id)
 
             # Create a Daily.co room for the call
             room_url = self._create_daily_room(call_id, call_type)
 
-            call_data = {
-                'id': call_id,
-                'caller': caller,
-                'recipient': recipient,
-                'type': call_type,  # 'voice' or 'video'
-                'status': 'pending',
-                'room_url': room_url,
-                'created_at': datetime.now().isoformat(),
-                'accepted_at': None,
-                'ended_at': None
-            }
-
-            self.calls[call_id] = call_data
+            call = self.calls[raw_id] = Call(raw_id, caller, recipient, call_type, room_url, now_us())
+            self.journal.call_changed(call)
 
             return {
                 'success': True,
@@ -57,32 +63,34 @@ class CallService:
     def accept_call(self, call_id: str, user: str) -> Dict:
         """Accept an incoming call"""
         try:
-            if call_id not in self.calls:
-                return {
-                    'success': False,
-                    'error': 'Call not found'
-                }
-
-            call = self.calls[call_id]
-
-            if call['recipient'] != user:
-                return {
-                    'success': False,
-                    'error': 'Unauthorized'
-                }
-
-            if call['status'] != 'pending':
-                return {
-                    'success': False,
-                    'error': 'Call is not pending'
-                }
-
-            call['status'] = 'active'
-            call['accepted_at'] = datetime.now().isoformat()
+            raw_id = parse_id(call_id)
+            with self._locks.for_key(raw_id):
+                call = self.calls.get(raw_id)
+                if call is None:
+                    return {
+                        'success': False,
+                        'error': 'Call not found'
+                    }
+
+                if call.recipient != user:
+                    return {
+                        'success': False,
+                        'error': 'Unauthorized'
+                    }
+
+                if call.status != 'pending':
+                    return {
+                        'success': False,
+                        'error': 'Call is not pending'
+                    }
+
+                call.status = 'active'
+                call.accepted_at = now_us()
+                self.journal.call_changed(call)
 
             return {
                 'success': True,
-                'room_url': call['room_url']
+                'room_url': call.room_url
             }
         except Exception as e:
             return {
@@ -93,25 +101,33 @@ class CallService:
     def reject_call(self, call_id: str, user: str) -> Dict:
         """Reject an incoming call"""
         try:
-            if call_id not in self.calls:
-                return {
-                    'success': False,
-                    'error': 'Call not found'
-                }
-
-            call = self.calls[call_id]
-
-            if call['recipient'] != user:
-                return {
-                    'success': False,
-                    'error': 'Unauthorized'
-                }
-
-            call['status'] = 'rejected'
-            call['ended_at'] = datetime.now().isoformat()
+            raw_id = parse_id(call_id)
+            with self._locks.for_key(raw_id):
+                call = self.calls.get(raw_id)
+                if call is None:
+                    return {
+                        'success': False,
+                        'error': 'Call not found'
+                    }
+
+                if call.recipient != user:
+                    return {
+                        'success': False,
+                        'error': 'Unauthorized'
+                    }
+
+                if call.status != 'pending':
+                    return {
+                        'success': False,
+                        'error': 'Call is not pending'
+                    }
+
+                call.status = 'rejected'
+                call.ended_at = now_us()
+                self.journal.call_changed(call)
 
             # Delete the Daily.co room
-            self._delete_daily_room(call['room_url'])
+            self._delete_daily_room(call.room_url)
 
             return {
                 'success': True
@@ -125,18 +141,27 @@ class CallService:
     def end_call(self, call_id: str) -> Dict:
         """End an active call"""
         try:
-            if call_id not in self.calls:
-                return {
-                    'success': False,
-                    'error': 'Call not found'
-                }
-
-            call = self.calls[call_id]
-            call['status'] = 'ended'
-            call['ended_at'] = datetime.now().isoformat()
+            raw_id = parse_id(call_id)
+            with self._locks.for_key(raw_id):
+                call = self.calls.get(raw_id)
+                if call is None:
+                    return {
+                        'success': False,
+                        'error': 'Call not found'
+                    }
+
+                if call.status in ('ended', 'rejected'):
+                    # Already over (the other side got there first); its room is already gone
+                    return {
+                        'success': True
+                    }
+
+                call.status = 'ended'
+                call.ended_at = now_us()
+                self.journal.call_changed(call)
 
             # Delete the Daily.co room
-            self._delete_daily_room(call['room_url'])
+            self._delete_daily_room(call.room_url)
 
             return {
                 'success': True
@@ -147,9 +172,23 @@ class CallService:
                 'error': str(e)
             }
 
-    def get_call_info(self, call_id: str) -> Dict:
+    def add_call(self, call: Call):
+        """Store an existing call record (recovered from disk), replacing any with its id"""
+        with self._locks.for_key(call.id):
+            self.calls[call.id] = call
+
+    def get_call_info(self, call_id: str) -> Optional[Call]:
         """Get information about a call"""
-        return self.calls.get(call_id, {})
+        return self.calls.get(parse_id(call_id))
+
+    def get_pending_calls(self, user: str) -> List[Call]:
+        """Get calls waiting for a user to answer"""
+        pending = [
+            call for call in list(self.calls.values())
+            if call.recipient == user and call.status == 'pending'
+        ]
+        pending.sort(key=attrgetter('created_at'))
+        return pending
 
     def _create_daily_room(self, call_id: str, call_type: str) -> str:
         """Create a Daily.co room for the call"""
@@ -176,9 +215,10 @@ class CallService:
             }
 
             response = requests.post(
-                'https://api.daily.co/v1/rooms',
+                f'{self.daily_api_url}/rooms',
                 headers=headers,
-                json=data
+                json=data,
+                timeout=DAILY_API_TIMEOUT
             )
 
             if response.status_code == 200:
@@ -205,8 +245,9 @@ class CallService:
             }
 
             requests.delete(
-                f'https://api.daily.co/v1/rooms/{room_name}',
-                headers=headers
+                f'{self.daily_api_url}/rooms/{room_name}',
+                headers=headers,
+                timeout=DAILY_API_TIMEOUT
             )
         except Exception as e:
             print(f"Error deleting Daily.co room: {e}")
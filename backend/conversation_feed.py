@@ -0,0 +1,92 @@
+"""
+Conversation Feed
+Live fan-out of new messages to per-conversation subscribers
+
+Each subscriber (an open GET /api/messages/stream) gets a bounded queue.
+Publishing never blocks: a subscriber whose queue is full has fallen too
+far behind, so it is dropped and its stream ends with an "overflow" line;
+the client reconnects and catches up from the backlog. One slow reader
+can't hold up send_message or the other readers.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from records import Message, conversation_key
+
+# Overflow marker put on a dropped subscriber's queue
+OVERFLOW = object()
+
+
+class Subscription:
+    """One reader's view of one conversation"""
+
+    def __init__(self, key: Tuple[str, str], max_queue: int):
+        self.key = key
+        # One slot more than max_queue keeps room for the overflow marker
+        self.queue: 'queue.Queue' = queue.Queue(max_queue + 1)
+        self.max_queue = max_queue
+        self.dropped = False
+
+    def get(self, timeout: float):
+        """Next Message, OVERFLOW, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return OVERFLOW if self.dropped else None
+
+
+class ConversationFeed:
+    """conversation -> subscribers, with non-blocking publish"""
+
+    def __init__(self):
+        self._subscribers: Dict[Tuple[str, str], Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, user: str, contact: str, max_queue: int = 100) -> Subscription:
+        subscription = Subscription(conversation_key(user, contact), max_queue)
+        with self._lock:
+            self._subscribers[subscription.key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def publish(self, message: Message):
+        key = conversation_key(message.sender, message.recipient)
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            if subscription.dropped:
+                continue
+            try:
+                if subscription.queue.qsize() >= subscription.max_queue:
+                    raise queue.Full
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except queue.Full:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        subscription.dropped = True
+        try:
+            subscription.queue.put_nowait(OVERFLOW)
+        except queue.Full:
+            pass  # the reader still sees `dropped` once it has drained the queue
+        self.overflows += 1
+        self.unsubscribe(subscription)
+
+    def subscriber_count(self, key: Optional[Tuple[str, str]] = None) -> int:
+        with self._lock:
+            if key is not None:
+                return len(self._subscribers.get(key, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
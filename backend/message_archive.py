@@ -0,0 +1,305 @@
+"""
+Message Archive
+Compressed month segments of old messages, read back on demand
+
+With ARCHIVE_DIR set, MessagingService keeps only the last HOT_MONTHS
+calendar months (UTC) of messages in memory. Each older month is written
+to one segment, messages-YYYY-MM.ndjson.zst (or .ndjson.gz when the
+zstandard package isn't installed), in the same NDJSON form as the export.
+Each conversation's messages are compressed as a block of their own (a
+zstd frame or gzip member, so the file is still one valid stream), and a
+small JSON manifest records where each block starts and every search term
+the month contains. History paging reads just that conversation's blocks,
+and only once it reaches past the hot window; a search that runs out of
+hot matches skips months whose terms miss the query and reads the rest
+whole, newest first and at most ARCHIVE_SEARCH_SEGMENTS of them (by
+default as many as the ARCHIVE_CACHE_SEGMENTS kept in memory).
+
+Archived messages are read-only: mark_as_read and the unread list only
+see the hot window.
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # optional: segments are gzip-compressed without it
+    zstandard = None  # type: ignore
+
+from records import Message, conversation_key
+from search_index import MessageIndex, tokenize
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+HOT_MONTHS = int(os.getenv('HOT_MONTHS', 3))
+ARCHIVE_CACHE_SEGMENTS = int(os.getenv('ARCHIVE_CACHE_SEGMENTS', 3))
+# A search reads at most this many segments once the hot window runs out of matches;
+# more than are cached means every such search evicts what the next one needs
+ARCHIVE_SEARCH_SEGMENTS = int(os.getenv('ARCHIVE_SEARCH_SEGMENTS', ARCHIVE_CACHE_SEGMENTS))
+ARCHIVE_CHECK_INTERVAL = float(os.getenv('ARCHIVE_CHECK_INTERVAL', 3600))
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+_MANIFEST = re.compile(r'^messages-(\d{4}-\d{2})\.json$')
+
+
+def month_of(us: int) -> str:
+    """'YYYY-MM' (UTC) of a microsecond timestamp"""
+    moment = time.gmtime(us // 1_000_000)
+    return f'{moment.tm_year:04d}-{moment.tm_mon:02d}'
+
+
+def hot_start(now: int, hot_months: int = HOT_MONTHS) -> str:
+    """Oldest month kept in memory at time now (microseconds)"""
+    moment = time.gmtime(now // 1_000_000)
+    index = moment.tm_year * 12 + moment.tm_mon - 1 - (max(hot_months, 1) - 1)
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+class Segment:
+    """One archived month read into memory, with a search index over it"""
+
+    def __init__(self, month: str, messages: List[Message]):
+        self.month = month
+        self.index = MessageIndex()
+        self.index.rebuild(messages)
+
+
+class MessageArchive:
+    """Month segments in a directory, with their manifests held in memory"""
+
+    def __init__(self, directory: str, cache_segments: int = ARCHIVE_CACHE_SEGMENTS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.extension = 'zst' if zstandard is not None else 'gz'
+        self.cache_segments = cache_segments
+        self.manifests: Dict[str, Dict] = {}
+        # conversation -> (month, file, offset, length) of its blocks, oldest month first
+        self.blocks: Dict[Tuple[str, str], List[Tuple[str, str, int, int]]] = {}
+        self.conversations_by_user: Dict[str, Set[Tuple[str, str]]] = {}
+        # month -> every search term in it; None for a manifest written before terms were kept
+        self.terms: Dict[str, Optional[frozenset]] = {}
+        self._cache: 'OrderedDict[str, Segment]' = OrderedDict()
+        self._lock = threading.Lock()  # manifests, blocks and cache
+        self._write_lock = threading.Lock()
+        self.segment_loads = 0
+        self.segments_skipped = 0
+        self.block_reads = 0
+
+        for name in sorted(os.listdir(directory)):
+            match = _MANIFEST.match(name)
+            if match:
+                with open(os.path.join(directory, name)) as f:
+                    manifest = json.load(f)
+                if os.path.exists(os.path.join(directory, manifest['file'])):
+                    self._register(match.group(1), manifest)
+
+    def _register(self, month: str, manifest: Dict):
+        # Caller holds _lock, or is __init__
+        self.manifests[month] = manifest
+        terms = manifest.get('terms')
+        self.terms[month] = frozenset(terms) if terms is not None else None
+        for sender, recipient, _, offset, length in manifest['conversations']:
+            key = (sender, recipient)
+            blocks = [block for block in self.blocks.get(key, ()) if block[0] != month]
+            blocks.append((month, manifest['file'], offset, length))
+            blocks.sort()
+            self.blocks[key] = blocks
+            for user in key:
+                self.conversations_by_user.setdefault(user, set()).add(key)
+
+    def months(self) -> List[str]:
+        with self._lock:
+            return sorted(self.manifests)
+
+    def blocks_of(self, key: Tuple[str, str]) -> List[Tuple[str, str, int, int]]:
+        with self._lock:
+            return list(self.blocks.get(key, ()))
+
+    def conversations_of(self, user: str) -> Set[Tuple[str, str]]:
+        with self._lock:
+            return set(self.conversations_by_user.get(user, ()))
+
+    def may_match(self, month: str, terms: Set[str]) -> bool:
+        """Whether month has any of terms, going by its manifest"""
+        with self._lock:
+            present = self.terms.get(month)
+        return present is None or not present.isdisjoint(terms)
+
+    # ----- files -----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.extension == 'zst':
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+    @staticmethod
+    def _decompress(name: str, data: bytes) -> bytes:
+        if name.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError(f'{name} is zstd-compressed but the zstandard package is not installed')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _read_blocks(self, name: str, blocks: List[Tuple[int, int]]) -> List[Message]:
+        messages = []
+        with open(self._path(name), 'rb') as f:
+            for offset, length in blocks:
+                f.seek(offset)
+                for line in self._decompress(name, f.read(length)).decode().splitlines():
+                    if line:
+                        messages.append(Message.from_dict(json.loads(line)))
+        self.block_reads += len(blocks)
+        return messages
+
+    def _read(self, month: str) -> List[Message]:
+        with self._lock:
+            manifest = self.manifests[month]
+        return self._read_blocks(manifest['file'], [(offset, length) for *_, offset, length in manifest['conversations']])
+
+    def write(self, month: str, messages: List[Message]):
+        """Archive messages into month's segment, merging with what it already holds"""
+        with self._write_lock:
+            existing = self._read(month) if month in self.manifests else []
+            seen = {msg.id for msg in messages}
+            by_conversation: Dict[Tuple[str, str], List[Message]] = {}
+            for msg in [msg for msg in existing if msg.id not in seen] + list(messages):
+                by_conversation.setdefault(conversation_key(msg.sender, msg.recipient), []).append(msg)
+
+            name = f'messages-{month}.ndjson.{self.extension}'
+            conversations = []
+            terms: Set[str] = set()
+            offset = 0
+            with open(self._path(name + '.tmp'), 'wb') as f:
+                for key in sorted(by_conversation):
+                    block_messages = sorted(by_conversation[key], key=lambda msg: msg.timestamp)
+                    for msg in block_messages:
+                        terms.update(tokenize(msg.message or ''))
+                    block = self._compress(''.join(
+                        json.dumps(msg.to_dict(), ensure_ascii=False) + '\n' for msg in block_messages
+                    ).encode())
+                    f.write(block)
+                    conversations.append([key[0], key[1], len(block_messages), offset, len(block)])
+                    offset += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self._path(name + '.tmp'), self._path(name))
+
+            manifest = {
+                'file': name,
+                'count': sum(entry[2] for entry in conversations),
+                'bytes': offset,
+                'conversations': conversations,
+                'terms': sorted(terms),
+            }
+            # The manifest goes last: a segment without one is ignored at startup
+            manifest_path = self._path(f'messages-{month}.json')
+            with open(manifest_path + '.tmp', 'w') as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(manifest_path + '.tmp', manifest_path)
+
+            previous = self.manifests.get(month)
+            if previous and previous['file'] != name:
+                os.remove(self._path(previous['file']))
+            with self._lock:
+                self._register(month, manifest)
+                self._cache.pop(month, None)
+
+    # ----- reads -----
+
+    def segment(self, month: str) -> Segment:
+        with self._lock:
+            segment = self._cache.get(month)
+            if segment is not None:
+                self._cache.move_to_end(month)
+                return segment
+        segment = Segment(month, self._read(month))
+        with self._lock:
+            self.segment_loads += 1
+            self._cache[month] = segment
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        return segment
+
+    def history(self, key: Tuple[str, str], before: int, limit: int) -> List[Message]:
+        """Up to the last ``limit`` archived messages of a conversation older than ``before``, oldest first"""
+        found: List[Message] = []
+        last_month = month_of(before)
+        for month, name, offset, length in reversed(self.blocks_of(key)):
+            if len(found) >= limit:
+                break
+            if month > last_month:
+                continue
+            older = [msg for msg in self._read_blocks(name, [(offset, length)]) if msg.timestamp < before]
+            found = older + found
+        return found[-limit:] if limit > 0 else []
+
+    def search(
+        self, query: str, user: str, contact: Optional[str], limit: int, segments: Optional[int] = None
+    ) -> Tuple[List[Tuple[float, Message]], int]:
+        """Matches in the user's archived conversations, newest month first, reading at most ``segments`` months
+        (by default ARCHIVE_SEARCH_SEGMENTS, but no more than the cache holds).
+
+        Months whose manifest has none of the query's terms are skipped unread
+        and don't count towards ``segments``.
+        """
+        if segments is None:
+            segments = min(ARCHIVE_SEARCH_SEGMENTS, self.cache_segments)
+        terms = set(tokenize(query))
+        if not terms:
+            return [], 0
+        if contact is not None:
+            months = [block[0] for block in self.blocks_of(conversation_key(user, contact))]
+        else:
+            months = sorted({block[0] for key in self.conversations_of(user) for block in self.blocks_of(key)})
+        matches: List[Tuple[float, Message]] = []
+        total = 0
+        read = 0
+        for month in reversed(months):
+            if len(matches) >= limit or read >= segments:
+                break
+            if not self.may_match(month, terms):
+                with self._lock:
+                    self.segments_skipped += 1
+                continue
+            read += 1
+            found, count = self.segment(month).index.search(query, user, contact, limit - len(matches))
+            matches.extend(found)
+            total += count
+        return matches, total
+
+    def conversation(self, key: Tuple[str, str]) -> Iterator[Message]:
+        """One conversation's archived messages, oldest month first, read a block at a time"""
+        for month, name, offset, length in self.blocks_of(key):
+            yield from self._read_blocks(name, [(offset, length)])
+
+    def iter_messages(self) -> Iterator[Message]:
+        """Every archived message, oldest month first, read a month at a time"""
+        for month in self.months():
+            yield from self._read(month)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'compression': self.extension,
+                'segments': len(self.manifests),
+                'messages': sum(manifest['count'] for manifest in self.manifests.values()),
+                'bytes': sum(manifest['bytes'] for manifest in self.manifests.values()),
+                'cached_segments': list(self._cache),
+                'segment_loads': self.segment_loads,
+                'segments_skipped': self.segments_skipped,
+                'block_reads': self.block_reads,
+            }
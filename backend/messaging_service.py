@@ -3,36 +3,81 @@ Messaging Service
 Handles sending and receiving text messages
 """
 
-import uuid
-from datetime import datetime
-from typing import Dict, List
+import itertools
+import threading
+from bisect import bisect_left, insort
+from operator import attrgetter
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from conversation_feed import ConversationFeed
+from message_archive import HOT_MONTHS, MessageArchive, hot_start, month_of
+from persistence import Journal
+from records import Message, conversation_key, id_str, new_id, now_us, parse_id
+from search_index import MessageIndex
+from striped_lock import StripedLock
+
+_by_timestamp = attrgetter('timestamp')
 
 
 class MessagingService:
-    """Service for managing text messages between users"""
+    """Service for managing text messages between users
+
+    Messages are partitioned by month (UTC) in the order stored, and also
+    kept per conversation in timestamp order, each conversation guarded by
+    its stripe of a StripedLock: sends to different conversations don't
+    wait for each other, and a history read never sees a conversation
+    half-written. With an archive attached, archive_cold() moves months
+    older than the hot window out to it, and history and search read them
+    back only when they reach past what is in memory.
+    """
 
     def __init__(self):
         # In-memory storage (replace with database in production)
-        self.messages = []
+        self.partitions: Dict[str, List[Message]] = {}  # 'YYYY-MM' -> messages, in the order stored
+        self._partitions_lock = threading.Lock()
+        self.conversations: Dict[Tuple[str, str], List[Message]] = {}
+        self.user_conversations: Dict[str, Set[Tuple[str, str]]] = {}
+        self._locks = StripedLock()
+        # Full-text index over message bodies, kept in step by send_message
+        self.index = MessageIndex()
+        # Live subscribers per conversation (GET /api/messages/stream)
+        self.feed = ConversationFeed()
+        # Change log for persistence; records nothing unless DATA_DIR is set
+        self.journal = Journal()
+        # Month segments older than hot_months (ARCHIVE_DIR); None keeps everything in memory
+        self.archive: Optional[MessageArchive] = None
+        self.hot_months = HOT_MONTHS
+
+    def _store(self, key: Tuple[str, str], message: Message):
+        # Caller holds the conversation's lock
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            conversation = self.conversations[key] = []
+            self.user_conversations.setdefault(message.sender, set()).add(key)
+            self.user_conversations.setdefault(message.recipient, set()).add(key)
+        if conversation and conversation[-1].timestamp > message.timestamp:
+            insort(conversation, message, key=_by_timestamp)  # an imported older message
+        else:
+            conversation.append(message)
+        with self._partitions_lock:
+            self.partitions.setdefault(month_of(message.timestamp), []).append(message)
 
     def send_message(self, sender: str, recipient: str, message: str) -> Dict:
         """Send a message from sender to recipient"""
         try:
-            message_id = str(uuid.uuid4())
-            message_data = {
-                'id': message_id,
-                'sender': sender,
-                'recipient': recipient,
-                'message': message,
-                'timestamp': datetime.now().isoformat(),
-                'status': 'sent'
-            }
+            key = conversation_key(sender, recipient)
+            with self._locks.for_key(key):
+                # Stamped under the lock, so each conversation is stored in time order
+                message_data = Message(new_id(), sender, recipient, message, now_us())
+                self._store(key, message_data)
+                self.journal.message_added(message_data)
 
-            self.messages.append(message_data)
+            self.index.add(message_data)
+            self.feed.publish(message_data)
 
             return {
                 'success': True,
-                'message_id': message_id
+                'message_id': id_str(message_data.id)
             }
         except Exception as e:
             return {
@@ -40,33 +85,181 @@ class MessagingService:
                 'error': str(e)
             }
 
-    def get_history(self, user1: str, user2: str, limit: int = 50) -> List[Dict]:
-        """Get message history between two users"""
-        # Filter messages between the two users
-        conversation = [
-            msg for msg in self.messages
-            if (msg['sender'] == user1 and msg['recipient'] == user2) or
-               (msg['sender'] == user2 and msg['recipient'] == user1)
-        ]
+    def get_history(self, user1: str, user2: str, limit: int = 50, before: Optional[int] = None) -> List[Message]:
+        """Get message history between two users (the page before `before`, if given)"""
+        if limit <= 0:
+            return []
+        key = conversation_key(user1, user2)
+        with self._locks.for_key(key):
+            conversation = self.conversations.get(key, [])
+            end = len(conversation) if before is None else bisect_left(conversation, before, key=_by_timestamp)
+            # Return last 'limit' messages
+            page = conversation[max(end - limit, 0):end]
+
+        if len(page) < limit and self.archive is not None:
+            # Reached past the hot window
+            oldest = page[0].timestamp if page else (before if before is not None else now_us() + 1)
+            page = self.archive.history(key, oldest, limit - len(page)) + page
+        return page
+
+    def _find(self, key: Tuple[str, str], timestamp: int, raw_id: bytes) -> Optional[Message]:
+        # Caller holds the conversation's lock
+        conversation = self.conversations.get(key, [])
+        i = bisect_left(conversation, timestamp, key=_by_timestamp)
+        while i < len(conversation) and conversation[i].timestamp == timestamp:
+            if conversation[i].id == raw_id:
+                return conversation[i]
+            i += 1
+        return None
+
+    def find_message(self, sender: str, recipient: str, timestamp: int, raw_id: bytes) -> Optional[Message]:
+        """The stored message with this id, looked up by its conversation and timestamp"""
+        key = conversation_key(sender, recipient)
+        with self._locks.for_key(key):
+            return self._find(key, timestamp, raw_id)
+
+    def search(
+        self, user: str, query: str, contact: Optional[str] = None, limit: int = 5
+    ) -> Tuple[List[Tuple[float, Message]], int]:
+        """Best (score, message) matches for query among the user's messages (with contact,
+        only that conversation), and how many matched in all"""
+        matches, total = self.index.search(query, user, contact, limit)
+        if len(matches) < limit and self.archive is not None:
+            # Too few in the hot window; carry on into archived months, newest first
+            older, older_total = self.archive.search(query, user, contact, limit - len(matches))
+            matches += older
+            total += older_total
+        return matches, total
 
-        # Sort by timestamp
-        conversation.sort(key=lambda x: x['timestamp'])
+    def _hot_messages(self) -> Iterator[Message]:
+        for month in sorted(list(self.partitions)):
+            with self._partitions_lock:
+                partition = list(self.partitions.get(month, ()))
+            yield from partition
 
-        # Return last 'limit' messages
-        return conversation[-limit:]
+    def iter_messages(
+        self, user: Optional[str] = None, contact: Optional[str] = None, include_archived: bool = False
+    ) -> Iterator[Message]:
+        """Stored messages, optionally only the user's (or their conversation with contact);
+        archived ones too if include_archived.
 
-    def get_unread_messages(self, user: str) -> List[Dict]:
+        Without a user: month by month in the order they were added, archived
+        months first. With one: conversation by conversation, oldest first, each
+        copied under its lock and read from just its own archive blocks, so
+        nobody else's messages are walked or decompressed.
+
+        Messages sent while the iterator is running may or may not be included.
+        """
+        if user is not None:
+            yield from self._iter_user_messages(user, contact, include_archived)
+            return
+        messages = self._hot_messages()
+        if include_archived and self.archive is not None:
+            messages = itertools.chain(self.archive.iter_messages(), messages)
+        for msg in messages:
+            if contact is not None and contact not in (msg.sender, msg.recipient):
+                continue
+            yield msg
+
+    def _iter_user_messages(self, user: str, contact: Optional[str], include_archived: bool) -> Iterator[Message]:
+        archive = self.archive if include_archived else None
+        if contact is not None:
+            keys = [conversation_key(user, contact)]
+        else:
+            keys = set(self.user_conversations.get(user, ()))
+            if archive is not None:
+                keys |= archive.conversations_of(user)
+            keys = sorted(keys)
+        for key in keys:
+            if archive is not None:
+                yield from archive.conversation(key)
+            with self._locks.for_key(key):
+                hot = list(self.conversations.get(key, ()))
+            yield from hot
+
+    def add_messages(self, batch: List[Message]) -> int:
+        """Store already-built messages (a bulk import batch) and index them; how many were new.
+
+        A message whose id is already stored is skipped, so importing the same
+        archive again (a retried migration) adds nothing.
+        """
+        by_conversation: Dict[Tuple[str, str], List[Message]] = {}
+        for msg in batch:
+            by_conversation.setdefault(conversation_key(msg.sender, msg.recipient), []).append(msg)
+        added = []
+        for key, messages in by_conversation.items():
+            with self._locks.for_key(key):
+                for msg in messages:
+                    if self._find(key, msg.timestamp, msg.id) is not None:
+                        continue
+                    self._store(key, msg)
+                    self.journal.message_added(msg)
+                    added.append(msg)
+        self.index.add_many(added)
+        return len(added)
+
+    def get_unread_messages(self, user: str) -> List[Message]:
         """Get all unread messages for a user"""
-        unread = [
-            msg for msg in self.messages
-            if msg['recipient'] == user and msg['status'] == 'sent'
-        ]
+        unread = []
+        for key in list(self.user_conversations.get(user, ())):
+            with self._locks.for_key(key):
+                unread.extend(
+                    msg for msg in self.conversations.get(key, ())
+                    if msg.recipient == user and msg.status == 'sent'
+                )
+        unread.sort(key=_by_timestamp)
         return unread
 
     def mark_as_read(self, message_id: str) -> bool:
         """Mark a message as read"""
-        for msg in self.messages:
-            if msg['id'] == message_id:
-                msg['status'] = 'read'
-                return True
+        raw_id = parse_id(message_id)
+        # Newest month first: it's nearly always a recent message
+        for month in sorted(list(self.partitions), reverse=True):
+            for msg in self.partitions.get(month, ()):
+                if msg.id == raw_id:
+                    # Under the conversation's lock, so this is journaled after the message itself
+                    with self._locks.for_key(conversation_key(msg.sender, msg.recipient)):
+                        msg.status = 'read'
+                        self.journal.message_read(msg)
+                    return True
         return False
+
+    def archive_cold(self, now: Optional[int] = None) -> int:
+        """Move months older than the hot window to the archive; how many messages moved"""
+        if self.archive is None:
+            return 0
+        cutoff = hot_start(now or now_us(), self.hot_months)
+        moved = 0
+        for month in sorted(month for month in list(self.partitions) if month < cutoff):
+            with self._partitions_lock:
+                messages = list(self.partitions.get(month, ()))
+            if not messages:
+                continue
+            # Written (and fsynced) before anything is dropped from memory
+            self.archive.write(month, messages)
+            self._evict(month, messages)
+            moved += len(messages)
+        return moved
+
+    def _evict(self, month: str, messages: List[Message]):
+        with self._partitions_lock:
+            partition = self.partitions.get(month, [])
+            # Partitions only grow at the end, so what was archived is still the front
+            del partition[:len(messages)]
+            if not partition:
+                self.partitions.pop(month, None)
+
+        by_conversation: Dict[Tuple[str, str], Set[int]] = {}
+        for msg in messages:
+            by_conversation.setdefault(conversation_key(msg.sender, msg.recipient), set()).add(id(msg))
+        for key, targets in by_conversation.items():
+            with self._locks.for_key(key):
+                conversation = self.conversations.get(key)
+                if conversation is None:
+                    continue
+                conversation[:] = [msg for msg in conversation if id(msg) not in targets]
+                if not conversation:
+                    del self.conversations[key]
+                    for user in key:
+                        self.user_conversations.get(user, set()).discard(key)
+        self.index.remove(messages)
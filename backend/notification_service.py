@@ -3,17 +3,29 @@ Notification Service
 Handles notifications for new messages and incoming calls
 """
 
+from operator import attrgetter
 from typing import Dict, List
-from datetime import datetime
-import uuid
+
+from persistence import Journal
+from records import Notification, id_str, new_id, now_us, parse_id
+from striped_lock import StripedLock
 
 
 class NotificationService:
-    """Service for managing notifications"""
+    """Service for managing notifications
+
+    Notifications are kept per user, each user's list guarded by its
+    stripe of a StripedLock, with an id -> notification map for the
+    single-notification operations.
+    """
 
     def __init__(self):
         # In-memory storage (replace with database in production)
-        self.notifications = []
+        self.notifications: Dict[str, List[Notification]] = {}  # user -> notifications, oldest first
+        self.by_id: Dict[bytes, Notification] = {}
+        self._locks = StripedLock()
+        # Change log for persistence; records nothing unless DATA_DIR is set
+        self.journal = Journal()
 
     def create_notification(
         self, 
@@ -25,23 +37,12 @@ class NotificationService:
     ) -> Dict:
         """Create a new notification"""
         try:
-            notification_id = str(uuid.uuid4())
-            notification = {
-                'id': notification_id,
-                'user_id': user_id,
-                'type': notification_type,  # 'message', 'call', 'system'
-                'title': title,
-                'message': message,
-                'data': data or {},
-                'read': False,
-                'created_at': datetime.now().isoformat()
-            }
-
-            self.notifications.append(notification)
+            notification = Notification(new_id(), user_id, notification_type, title, message, data, now_us())
+            self.add_notification(notification)
 
             return {
                 'success': True,
-                'notification_id': notification_id
+                'notification_id': id_str(notification.id)
             }
         except Exception as e:
             return {
@@ -49,45 +50,62 @@ class NotificationService:
                 'error': str(e)
             }
 
-    def get_notifications(self, user_id: str, unread_only: bool = False) -> List[Dict]:
-        """Get notifications for a user"""
-        user_notifications = [
-            notif for notif in self.notifications
-            if notif['user_id'] == user_id
-        ]
+    def add_notification(self, notification: Notification) -> bool:
+        """Store a notification record (new, or recovered from disk); False if its id is already stored"""
+        with self._locks.for_key(notification.user_id):
+            if notification.id in self.by_id:
+                return False
+            self.notifications.setdefault(notification.user_id, []).append(notification)
+            self.by_id[notification.id] = notification
+            self.journal.notification_added(notification)
+        return True
 
-        if unread_only:
+    def get_notifications(self, user_id: str, unread_only: bool = False) -> List[Notification]:
+        """Get notifications for a user"""
+        with self._locks.for_key(user_id):
             user_notifications = [
-                notif for notif in user_notifications
-                if not notif['read']
+                notif for notif in self.notifications.get(user_id, ())
+                if not (unread_only and notif.read)
             ]
 
         # Sort by creation time (newest first)
-        user_notifications.sort(key=lambda x: x['created_at'], reverse=True)
+        user_notifications.sort(key=attrgetter('created_at'), reverse=True)
 
         return user_notifications
 
     def mark_as_read(self, notification_id: str) -> bool:
         """Mark a notification as read"""
-        for notif in self.notifications:
-            if notif['id'] == notification_id:
-                notif['read'] = True
-                return True
-        return False
+        notif = self.by_id.get(parse_id(notification_id))
+        if notif is None:
+            return False
+        with self._locks.for_key(notif.user_id):
+            notif.read = True
+            self.journal.notification_read(notif)
+        return True
 
     def mark_all_as_read(self, user_id: str) -> int:
         """Mark all notifications as read for a user"""
-        count = 0
-        for notif in self.notifications:
-            if notif['user_id'] == user_id and not notif['read']:
-                notif['read'] = True
-                count += 1
-        return count
+        marked = []
+        with self._locks.for_key(user_id):
+            for notif in self.notifications.get(user_id, ()):
+                if not notif.read:
+                    notif.read = True
+                    marked.append(notif)
+            if marked:
+                self.journal.notifications_read(user_id, marked)
+        return len(marked)
 
     def delete_notification(self, notification_id: str) -> bool:
         """Delete a notification"""
-        for i, notif in enumerate(self.notifications):
-            if notif['id'] == notification_id:
-                del self.notifications[i]
-                return True
-        return False
+        notif = self.by_id.get(parse_id(notification_id))
+        if notif is None:
+            return False
+        with self._locks.for_key(notif.user_id):
+            if self.by_id.pop(notif.id, None) is None:
+                return False  # deleted by a concurrent request
+            user_notifications = self.notifications[notif.user_id]
+            user_notifications.remove(notif)
+            if not user_notifications:
+                del self.notifications[notif.user_id]
+            self.journal.notification_deleted(notif)
+        return True
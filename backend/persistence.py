@@ -0,0 +1,558 @@
+"""
+Persistence
+Snapshot plus write-ahead log for the in-memory services
+
+With DATA_DIR set, every change to messages, calls and notifications is
+appended to a write-ahead log as a compact binary record. Appending only
+buffers: a background thread writes and fsyncs the buffer every
+WAL_FSYNC_INTERVAL seconds, so one fsync covers every change made in that
+window and a crash loses at most that window. Every SNAPSHOT_INTERVAL
+seconds (or SNAPSHOT_WAL_BYTES of log) the whole state is written out as
+a binary snapshot and older logs are deleted; on startup the latest
+snapshot is loaded and the logs written since are replayed.
+
+Files in DATA_DIR:
+  wal-<gen>.log        changes, generation <gen>
+  snapshot-<gen>.bin   the state, taken just after wal-<gen>.log was started
+
+A snapshot is taken while requests keep coming, so changes made during
+it can be in both the snapshot and wal-<gen>.log. Replay is idempotent
+for exactly that overlap: records are full upserts or set-style changes
+naming the ids they touch (a "mark all read" lists the notifications it
+marked), and messages already in the snapshot are skipped.
+
+Messages moved to the archive (ARCHIVE_DIR, see message_archive) are
+not in snapshots; their segments are already on disk.
+
+Record framing: payload length (u32), crc32 (u32), payload. A payload is
+a type byte, fixed fields, then length-prefixed UTF-8 strings.
+"""
+
+import atexit
+import gc
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # not on Windows: no guard against two processes sharing DATA_DIR
+    fcntl = None  # type: ignore
+
+from records import Call, Message, Notification, id_str
+
+DATA_DIR = os.getenv('DATA_DIR', '')
+WAL_FSYNC_INTERVAL = float(os.getenv('WAL_FSYNC_INTERVAL', 0.05))
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 900))
+SNAPSHOT_WAL_BYTES = int(os.getenv('SNAPSHOT_WAL_BYTES', 64 * 1024 * 1024))
+
+WAL_MAGIC = b'WAL1'
+SNAPSHOT_MAGIC = b'SNAP1'
+# Recovered messages are stored (and indexed) this many at a time
+LOAD_BATCH_SIZE = 10_000
+FILE_BUFFER = 1024 * 1024
+
+_FRAME = struct.Struct('<II')  # payload length, crc32
+_LEN = struct.Struct('<I')
+_MESSAGE = struct.Struct('<c16sqB')  # type, id, timestamp, read
+_MESSAGE_READ = struct.Struct('<c16sq')  # type, id, timestamp (+ sender, recipient)
+_CALL = struct.Struct('<c16sqqq')  # type, id, created, accepted, ended (-1 for none)
+_NOTIFICATION = struct.Struct('<c16sqB')  # type, id, created, read
+_ID = struct.Struct('<c16s')
+
+MESSAGE = b'M'
+MESSAGE_READ = b'R'
+CALL = b'C'
+NOTIFICATION = b'N'
+NOTIFICATION_READ = b'n'
+NOTIFICATIONS_READ = b'A'
+NOTIFICATION_DELETED = b'D'
+
+_FILE_NAME = re.compile(r'^(wal|snapshot)-(\d+)\.(log|bin)$')
+
+
+# ============== Encoding ==============
+
+def _pack(header: bytes, *strings: str) -> bytes:
+    parts = [header]
+    for value in strings:
+        data = value.encode()
+        parts.append(_LEN.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def _unpack_strings(payload: bytes, offset: int, count: int) -> List[str]:
+    values = []
+    for _ in range(count):
+        (size,) = _LEN.unpack_from(payload, offset)
+        offset += _LEN.size
+        values.append(payload[offset:offset + size].decode())
+        offset += size
+    return values
+
+
+def _optional(us: Optional[int]) -> int:
+    return -1 if us is None else us
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_message(msg: Message) -> bytes:
+    return _pack(_MESSAGE.pack(MESSAGE, msg.id, msg.timestamp, msg.status == 'read'),
+                 msg.sender, msg.recipient, msg.message)
+
+
+def encode_call(call: Call) -> bytes:
+    header = _CALL.pack(CALL, call.id, call.created_at, _optional(call.accepted_at), _optional(call.ended_at))
+    return _pack(header, call.caller, call.recipient, call.type, call.status, call.room_url)
+
+
+def encode_notification(notification: Notification) -> bytes:
+    header = _NOTIFICATION.pack(NOTIFICATION, notification.id, notification.created_at, notification.read)
+    data = json.dumps(notification.data) if notification.data else ''
+    return _pack(header, notification.user_id, notification.type, notification.title, notification.message, data)
+
+
+def decode(payload: bytes):
+    """(type, record or fields) for one payload"""
+    kind = payload[:1]
+    if kind == MESSAGE:
+        _, raw_id, timestamp, read = _MESSAGE.unpack_from(payload)
+        sender, recipient, text = _unpack_strings(payload, _MESSAGE.size, 3)
+        return kind, Message(raw_id, sender, recipient, text, timestamp, 'read' if read else 'sent')
+    if kind == MESSAGE_READ:
+        _, raw_id, timestamp = _MESSAGE_READ.unpack_from(payload)
+        sender, recipient = _unpack_strings(payload, _MESSAGE_READ.size, 2)
+        return kind, (raw_id, timestamp, sender, recipient)
+    if kind == CALL:
+        _, raw_id, created, accepted, ended = _CALL.unpack_from(payload)
+        caller, recipient, call_type, status, room_url = _unpack_strings(payload, _CALL.size, 5)
+        return kind, Call(raw_id, caller, recipient, call_type, room_url, created, status,
+                          None if accepted < 0 else accepted, None if ended < 0 else ended)
+    if kind == NOTIFICATION:
+        _, raw_id, created, read = _NOTIFICATION.unpack_from(payload)
+        user_id, notification_type, title, message, data = _unpack_strings(payload, _NOTIFICATION.size, 5)
+        return kind, Notification(raw_id, user_id, notification_type, title, message,
+                                  json.loads(data) if data else None, created, bool(read))
+    if kind in (NOTIFICATION_READ, NOTIFICATION_DELETED):
+        return kind, _ID.unpack_from(payload)[1]
+    if kind == NOTIFICATIONS_READ:
+        (size,) = _LEN.unpack_from(payload, 1)
+        offset = 1 + _LEN.size + size
+        user_id = payload[1 + _LEN.size:offset].decode()
+        if offset == len(payload):
+            return kind, (user_id, None)  # written before the ids were recorded: all of the user's
+        (count,) = _LEN.unpack_from(payload, offset)
+        offset += _LEN.size
+        return kind, (user_id, [payload[offset + 16 * i:offset + 16 * (i + 1)] for i in range(count)])
+    raise ValueError(f'unknown record type {kind!r}')
+
+
+# ============== Journal ==============
+
+class Journal:
+    """Where the services report their changes; this one records nothing (no DATA_DIR)"""
+
+    def message_added(self, msg: Message):
+        pass
+
+    def message_read(self, msg: Message):
+        pass
+
+    def call_changed(self, call: Call):
+        pass
+
+    def notification_added(self, notification: Notification):
+        pass
+
+    def notification_read(self, notification: Notification):
+        pass
+
+    def notifications_read(self, user_id: str, notifications: List[Notification]):
+        pass
+
+    def notification_deleted(self, notification: Notification):
+        pass
+
+
+class WriteAheadLog(Journal):
+    """Buffers framed records; flush() writes and fsyncs everything buffered so far"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()  # the buffer
+        self._write_lock = threading.Lock()  # the file: flushes and rotations
+        self._buffer: List[bytes] = []
+        self._file = self._open(path)
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self.fsyncs = 0
+        self.bytes_since_rotate = 0
+
+    @staticmethod
+    def _open(path: str):
+        f = open(path, 'ab', buffering=0)
+        if f.tell() == 0:
+            f.write(WAL_MAGIC)
+        return f
+
+    def append(self, payload: bytes):
+        frame = _frame(payload)
+        with self._lock:
+            self._buffer.append(frame)
+            self.records += 1
+            self.bytes += len(frame)
+            self.bytes_since_rotate += len(frame)
+
+    def flush(self):
+        with self._write_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+        if buffer:
+            self._file.write(b''.join(buffer))
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+
+    def rotate(self, path: str):
+        """Flush, then continue in a new file"""
+        with self._write_lock:
+            self._flush_locked()
+            self._file.close()
+            self._file = self._open(path)
+            self.path = path
+            self.bytes_since_rotate = 0
+
+    def close(self):
+        with self._write_lock:
+            self._flush_locked()
+            self._file.close()
+
+    def message_added(self, msg: Message):
+        self.append(encode_message(msg))
+
+    def message_read(self, msg: Message):
+        self.append(_pack(_MESSAGE_READ.pack(MESSAGE_READ, msg.id, msg.timestamp), msg.sender, msg.recipient))
+
+    def call_changed(self, call: Call):
+        self.append(encode_call(call))
+
+    def notification_added(self, notification: Notification):
+        self.append(encode_notification(notification))
+
+    def notification_read(self, notification: Notification):
+        self.append(_ID.pack(NOTIFICATION_READ, notification.id))
+
+    def notifications_read(self, user_id: str, notifications: List[Notification]):
+        # The ids, not just the user: replayed over a snapshot taken meanwhile, "all" would
+        # also take in notifications created after this
+        ids = b''.join(notification.id for notification in notifications)
+        self.append(_pack(NOTIFICATIONS_READ, user_id) + _LEN.pack(len(notifications)) + ids)
+
+    def notification_deleted(self, notification: Notification):
+        self.append(_ID.pack(NOTIFICATION_DELETED, notification.id))
+
+
+# ============== Store ==============
+
+def _read_frames(path: str, magic: bytes, report: Dict) -> Iterator[bytes]:
+    """Payloads in a log or snapshot file. Stops at a torn or corrupt record,
+    setting report['torn'] to its offset (a crash mid-write leaves one at the end of a log)."""
+    with open(path, 'rb', buffering=FILE_BUFFER) as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f'{path} is not a {magic.decode()} file')
+        offset = len(magic)
+        while True:
+            header = f.read(_FRAME.size)
+            if not header:
+                return
+            if len(header) == _FRAME.size:
+                size, crc = _FRAME.unpack(header)
+                payload = f.read(size)
+                if len(payload) == size and zlib.crc32(payload) == crc:
+                    offset += _FRAME.size + size
+                    yield payload
+                    continue
+            report['torn'] = offset
+            return
+
+
+class Store:
+    """DATA_DIR for one set of services: recovers them, journals them, snapshots them"""
+
+    def __init__(
+        self,
+        directory: str,
+        messaging,
+        calls,
+        notifications,
+        fsync_interval: float = WAL_FSYNC_INTERVAL,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+        snapshot_wal_bytes: int = SNAPSHOT_WAL_BYTES,
+    ):
+        self.directory = directory
+        self.messaging = messaging
+        self.calls = calls
+        self.notifications = notifications
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_wal_bytes = snapshot_wal_bytes
+        self.snapshots = 0
+        self.snapshot_bytes = 0
+        self.last_snapshot: Optional[Dict] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, 'lock'), 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f'{directory} is in use by another process')
+
+        self.recovery = self.recover()
+        self.generation = max(self._generations('wal') + self._generations('snapshot') + [0]) + 1
+        self.wal = WriteAheadLog(self._path('wal', self.generation))
+        for service in (messaging, calls, notifications):
+            service.journal = self.wal
+
+        self._snapshot_lock = threading.Lock()
+        self._last_snapshot_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='persistence', daemon=True)
+        self._thread.start()
+
+    def _path(self, kind: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{kind}-{generation:08d}.{'log' if kind == 'wal' else 'bin'}")
+
+    def _generations(self, kind: str) -> List[int]:
+        found = (_FILE_NAME.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(2)) for match in found if match and match.group(1) == kind)
+
+    # ----- recovery -----
+
+    def recover(self) -> Dict:
+        """Load the latest snapshot, then replay the logs written since"""
+        started = time.perf_counter()
+        # Millions of new long-lived objects would otherwise set off full collections over and over
+        gc.disable()
+        try:
+            report = self._recover()
+        finally:
+            gc.enable()
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        return report
+
+    def _recover(self) -> Dict:
+        snapshots = self._generations('snapshot')
+        base = snapshots[-1] if snapshots else 0
+        report = {'snapshot': None, 'snapshot_records': 0, 'wal_records': 0, 'torn': []}
+
+        if snapshots:
+            path = self._path('snapshot', base)
+            frames: Dict = {}
+            report['snapshot'] = os.path.basename(path)
+            report['snapshot_records'] = self._restore(_read_frames(path, SNAPSHOT_MAGIC, frames), overlap=False)
+            if 'torn' in frames:
+                # Snapshots are renamed into place once complete, so this is damage, not a crash
+                raise RuntimeError(f'{path} is corrupt at byte {frames["torn"]}')
+
+        for generation in self._generations('wal'):
+            if generation < base:
+                continue
+            path = self._path('wal', generation)
+            frames = {}
+            report['wal_records'] += self._restore(_read_frames(path, WAL_MAGIC, frames), overlap=generation == base)
+            if 'torn' in frames:
+                print(f"Persistence: {os.path.basename(path)} ends in a torn record at byte {frames['torn']}; "
+                      f"replayed up to it")
+                report['torn'].append(os.path.basename(path))
+        return report
+
+    def _restore(self, payloads: Iterator[bytes], overlap: bool) -> int:
+        """Apply records in order, storing (and indexing) runs of messages a batch at a time"""
+        count = 0
+        batch: List[Message] = []
+        for payload in payloads:
+            kind, record = decode(payload)
+            count += 1
+            if kind == MESSAGE:
+                # Only the log begun with the snapshot can repeat a message the snapshot has
+                stored = overlap and self.messaging.find_message(
+                    record.sender, record.recipient, record.timestamp, record.id)
+                if stored:
+                    stored.status = record.status
+                    continue
+                batch.append(record)
+                if len(batch) >= LOAD_BATCH_SIZE:
+                    self.messaging.add_messages(batch)
+                    batch = []
+                continue
+            if batch:
+                # What follows may refer to these messages
+                self.messaging.add_messages(batch)
+                batch = []
+            self._apply(kind, record)
+        if batch:
+            self.messaging.add_messages(batch)
+        return count
+
+    def _apply(self, kind: bytes, record):
+        if kind == MESSAGE_READ:
+            raw_id, timestamp, sender, recipient = record
+            stored = self.messaging.find_message(sender, recipient, timestamp, raw_id)
+            if stored is not None:
+                stored.status = 'read'
+        elif kind == CALL:
+            self.calls.add_call(record)
+        elif kind == NOTIFICATION:
+            self.notifications.add_notification(record)
+        elif kind == NOTIFICATION_READ:
+            self.notifications.mark_as_read(id_str(record))
+        elif kind == NOTIFICATIONS_READ:
+            user_id, ids = record
+            if ids is None:
+                self.notifications.mark_all_as_read(user_id)
+            else:
+                for raw_id in ids:
+                    self.notifications.mark_as_read(id_str(raw_id))
+        elif kind == NOTIFICATION_DELETED:
+            self.notifications.delete_notification(id_str(record))
+
+    # ----- snapshots -----
+
+    def _records(self) -> Iterator[bytes]:
+        for msg in self.messaging.iter_messages():
+            yield encode_message(msg)
+        for call in list(self.calls.calls.values()):
+            yield encode_call(call)
+        for notification in list(self.notifications.by_id.values()):
+            yield encode_notification(notification)
+
+    def snapshot(self) -> Optional[Dict]:
+        """Write the current state and drop the logs it covers; None if one is already being written"""
+        if not self._snapshot_lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.perf_counter()
+            self.generation += 1
+            generation = self.generation
+            # Every change from here on goes to the new log, so the snapshot plus it is complete
+            self.wal.rotate(self._path('wal', generation))
+            self._last_snapshot_at = time.monotonic()
+
+            path = self._path('snapshot', generation)
+            records = size = 0
+            with open(path + '.tmp', 'wb', buffering=FILE_BUFFER) as f:
+                f.write(SNAPSHOT_MAGIC)
+                size = len(SNAPSHOT_MAGIC)
+                chunk: List[bytes] = []
+                for payload in self._records():
+                    chunk.append(_frame(payload))
+                    if len(chunk) >= LOAD_BATCH_SIZE:
+                        data = b''.join(chunk)
+                        f.write(data)
+                        size += len(data)
+                        records += len(chunk)
+                        chunk = []
+                data = b''.join(chunk)
+                f.write(data)
+                size += len(data)
+                records += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            self._sync_directory()
+
+            for kind in ('wal', 'snapshot'):
+                for old in self._generations(kind):
+                    if old < generation:
+                        os.remove(self._path(kind, old))
+
+            self.snapshots += 1
+            self.snapshot_bytes += size
+            self.last_snapshot = {
+                'file': os.path.basename(path),
+                'records': records,
+                'bytes': size,
+                'seconds': round(time.perf_counter() - started, 3),
+            }
+            return self.last_snapshot
+        finally:
+            self._snapshot_lock.release()
+
+    def _sync_directory(self):
+        # Make the rename itself durable
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _snapshot_due(self) -> bool:
+        if self.wal.bytes_since_rotate >= self.snapshot_wal_bytes:
+            return True
+        return (self.wal.bytes_since_rotate > 0
+                and time.monotonic() - self._last_snapshot_at >= self.snapshot_interval)
+
+    # ----- background -----
+
+    def _run(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.wal.flush()
+                if self._snapshot_due() and not self._snapshot_lock.locked():
+                    # Its own thread: a large snapshot must not hold up the log's fsyncs
+                    threading.Thread(target=self._snapshot_quietly, name='snapshot', daemon=True).start()
+            except OSError as e:
+                print(f"Persistence: write failed: {e}")
+
+    def _snapshot_quietly(self):
+        try:
+            self.snapshot()
+        except OSError as e:
+            print(f"Persistence: snapshot failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        with self._snapshot_lock:  # let a running snapshot finish
+            self.wal.close()
+        self._lock_file.close()
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': True,
+            'directory': self.directory,
+            'wal': {
+                'file': os.path.basename(self.wal.path),
+                'records': self.wal.records,
+                'bytes': self.wal.bytes,
+                'fsyncs': self.wal.fsyncs,
+            },
+            'snapshots': self.snapshots,
+            'last_snapshot': self.last_snapshot,
+            'recovery': self.recovery,
+        }
+
+
+def open_store(messaging, calls, notifications, directory: str = DATA_DIR) -> Optional[Store]:
+    """Recover the services from directory and journal them there; None (in-memory only) without one"""
+    if not directory:
+        return None
+    store = Store(directory, messaging, calls, notifications)
+    atexit.register(store.close)
+    print(f"Persistence: recovered {store.recovery['snapshot_records']} snapshot and "
+          f"{store.recovery['wal_records']} log records from {directory} in {store.recovery['seconds']}s")
+    return store
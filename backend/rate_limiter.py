@@ -0,0 +1,205 @@
+"""
+Rate Limiter
+Token-bucket limits per user and per route
+
+Each (route, user) pair has a bucket of `burst` tokens refilled at
+`rate` tokens/second; a request spends one token or is refused with the
+number of seconds until one is available. In-process buckets live in a
+dict guarded by striped locks, so unrelated users rarely contend.
+
+Limits come from RATE_LIMITS, e.g. "send_message=20/60:10,request_call=5/60:3"
+(name=requests/seconds[:burst]); routes without an entry use the
+"default" one. The user is whoever the request says it acts for, so the
+routes in RATE_LIMITS_PER_CLIENT (same form, no default) also spend a token
+from a bucket per client address: a client naming a new user on every
+request still can't send or start calls without limit. With RATE_LIMIT_REDIS_URL set (and the redis package
+installed) buckets are kept in Redis instead, shared by every backend
+process; if Redis is unreachable requests are allowed rather than failed.
+"""
+
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from striped_lock import StripedLock
+
+try:
+    import redis  # type: ignore
+except ImportError:  # optional: only needed for RATE_LIMIT_REDIS_URL
+    redis = None  # type: ignore
+
+DEFAULT_LIMITS = 'default=120/60:30,send_message=20/60:10,request_call=5/60:3,respond_to_call=30/60:10'
+RATE_LIMITS = os.getenv('RATE_LIMITS', DEFAULT_LIMITS)
+# One frontend host speaks for all its sessions' users, so these are well above the per-user ones
+DEFAULT_CLIENT_LIMITS = 'send_message=200/60:50,request_call=30/60:10'
+RATE_LIMITS_PER_CLIENT = os.getenv('RATE_LIMITS_PER_CLIENT', DEFAULT_CLIENT_LIMITS)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', '')
+
+LOCK_STRIPES = 64
+# Every PRUNE_EVERY checks, buckets untouched for BUCKET_IDLE_SECONDS are dropped
+PRUNE_EVERY = 10_000
+BUCKET_IDLE_SECONDS = 3600
+
+
+class Limit:
+    """`burst` requests at once, refilled at `rate` per second"""
+
+    __slots__ = ('rate', 'burst')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Limit':
+        """'20/60:10' -> 20 requests per 60 s with bursts of 10 (burst defaults to the request count)"""
+        amount, _, rest = spec.partition('/')
+        period, _, burst = rest.partition(':')
+        requests = float(amount)
+        return cls(requests / float(period or 1), float(burst) if burst else requests)
+
+    def __repr__(self):
+        return f'Limit(rate={self.rate:g}/s, burst={self.burst:g})'
+
+
+def parse_limits(spec: str, default: Optional[str] = '120/60:30') -> Dict[str, Limit]:
+    limits = {name: Limit.parse(value) for name, value in (
+        entry.strip().split('=', 1) for entry in spec.split(',') if entry.strip()
+    )}
+    if default is not None:
+        limits.setdefault('default', Limit.parse(default))
+    return limits
+
+
+class Decision:
+    __slots__ = ('allowed', 'remaining', 'retry_after', 'limit')
+
+    def __init__(self, allowed: bool, remaining: float, retry_after: float, limit: Limit):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
+        self.limit = limit
+
+
+class LocalBuckets:
+    """In-process buckets: (route, user) -> [tokens, last refill], with striped locks"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}
+        self._locks = StripedLock(LOCK_STRIPES)
+        self._checks = 0
+
+    def take(self, route: str, user: str, limit: Limit, now: float) -> Tuple[bool, float]:
+        key = (route, user)
+        with self._locks.for_key(key):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.burst, now]
+            tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+            allowed = tokens >= 1
+            remaining = bucket[0] = tokens - 1 if allowed else tokens
+
+        self._checks += 1
+        if self._checks % PRUNE_EVERY == 0:
+            self.prune(now)
+        return allowed, remaining
+
+    def prune(self, now: float, idle: float = BUCKET_IDLE_SECONDS):
+        # A bucket idle this long has refilled under any sane limit; forgetting it changes nothing
+        for key, (tokens, last) in list(self._buckets.items()):
+            if now - last > idle:
+                self._buckets.pop(key, None)
+
+
+# KEYS[1] bucket; ARGV: rate, burst, now. Returns {allowed, tokens * 1000}
+_REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, math.floor(tokens * 1000)}
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every backend process, updated atomically by a Lua script"""
+
+    def __init__(self, url: str, prefix: str = 'ratelimit'):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_REDIS_URL is set but the redis package is not installed')
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.prefix = prefix
+        self._take = self.client.register_script(_REDIS_TAKE)
+
+    def take(self, route: str, user: str, limit: Limit, now: float) -> Tuple[bool, float]:
+        try:
+            allowed, tokens = self._take(keys=[f'{self.prefix}:{route}:{user}'], args=[limit.rate, limit.burst, now])
+        except redis.RedisError as e:
+            print(f"Rate limiter: Redis unavailable, allowing request: {e}")
+            return True, limit.burst
+        return bool(allowed), tokens / 1000
+
+
+class RateLimiter:
+    """Per-route, per-user token buckets, per-client ones for some routes, and counts of what was throttled"""
+
+    def __init__(self, limits: Optional[Dict[str, Limit]] = None, redis_url: str = RATE_LIMIT_REDIS_URL,
+                 enabled: bool = RATE_LIMIT_ENABLED, client_limits: Optional[Dict[str, Limit]] = None):
+        self.limits = limits if limits is not None else parse_limits(RATE_LIMITS)
+        self.client_limits = (
+            client_limits if client_limits is not None else parse_limits(RATE_LIMITS_PER_CLIENT, default=None)
+        )
+        self.enabled = enabled
+        self.buckets = RedisBuckets(redis_url) if redis_url else LocalBuckets()
+        self.allowed: Dict[str, int] = defaultdict(int)
+        self.throttled: Dict[str, int] = defaultdict(int)
+
+    def limit_for(self, route: str) -> Limit:
+        return self.limits.get(route) or self.limits['default']
+
+    def check(self, route: str, user: str, client: Optional[str] = None) -> Decision:
+        """Spend a token of user's bucket for route, and first of client's if route has a per-client limit"""
+        limit = self.limit_for(route)
+        if not self.enabled:
+            return Decision(True, limit.burst, 0.0, limit)
+        now = time.time()
+        client_limit = self.client_limits.get(route) if client else None
+        if client_limit is not None:
+            allowed, tokens = self.buckets.take(f'{route}@client', client, client_limit, now)
+            if not allowed:
+                self.throttled[route] += 1
+                return Decision(False, tokens, (1 - tokens) / client_limit.rate, client_limit)
+        allowed, tokens = self.buckets.take(route, user, limit, now)
+        if allowed:
+            self.allowed[route] += 1
+            return Decision(True, tokens, 0.0, limit)
+        self.throttled[route] += 1
+        return Decision(False, tokens, (1 - tokens) / limit.rate, limit)
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'shared': isinstance(self.buckets, RedisBuckets),
+            'limits': {name: {'rate_per_s': limit.rate, 'burst': limit.burst} for name, limit in self.limits.items()},
+            'client_limits': {
+                name: {'rate_per_s': limit.rate, 'burst': limit.burst} for name, limit in self.client_limits.items()
+            },
+            'allowed': dict(self.allowed),
+            'throttled': dict(self.throttled),
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
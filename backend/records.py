@@ -0,0 +1,180 @@
+"""
+Records
+Compact storage types for messages, calls and notifications
+
+The services keep one of these per record instead of a dict: fixed
+__slots__, integer epoch-microsecond timestamps and 16-byte binary ids.
+to_dict() turns a record into the JSON shape the API has always returned
+(ISO timestamps, UUID strings); only the API layer should call it.
+"""
+
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+
+def now_us() -> int:
+    """Current local time as integer microseconds since the epoch"""
+    return time.time_ns() // 1_000
+
+
+def to_iso(us: Optional[int]) -> Optional[str]:
+    """Microsecond timestamp -> naive local ISO string, as datetime.now().isoformat() gives"""
+    if us is None:
+        return None
+    return datetime.fromtimestamp(us // 1_000_000).replace(microsecond=us % 1_000_000).isoformat()
+
+
+def from_iso(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000 + moment.microsecond
+
+
+def new_id() -> bytes:
+    return uuid.uuid4().bytes
+
+
+def id_str(raw: bytes) -> str:
+    return str(uuid.UUID(bytes=raw))
+
+
+def parse_id(value) -> Optional[bytes]:
+    """16-byte id for a UUID string from a request, or None if it isn't one"""
+    try:
+        return uuid.UUID(str(value)).bytes
+    except (ValueError, TypeError):
+        return None
+
+
+def intern_name(value: str) -> str:
+    # User and contact names repeat across every record; keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def conversation_key(user1: str, user2: str) -> Tuple[str, str]:
+    """The same key for a conversation whichever side is asking"""
+    return (user1, user2) if user1 <= user2 else (user2, user1)
+
+
+class Message:
+    """One text message"""
+
+    __slots__ = ('id', 'sender', 'recipient', 'message', 'timestamp', 'status')
+
+    def __init__(self, id: bytes, sender: str, recipient: str, message: str, timestamp: int, status: str = 'sent'):
+        self.id = id
+        self.sender = intern_name(sender)
+        self.recipient = intern_name(recipient)
+        self.message = message
+        self.timestamp = timestamp
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Message':
+        """A message in to_dict() form (e.g. an export line); raises ValueError if it isn't one"""
+        if not isinstance(data, dict):
+            raise ValueError('expected a JSON object')
+        sender, recipient, message = data.get('sender'), data.get('recipient'), data.get('message')
+        if not all(isinstance(value, str) and value for value in (sender, recipient, message)):
+            raise ValueError('sender, recipient and message are required')
+        raw_id = parse_id(data['id']) if data.get('id') is not None else new_id()
+        if raw_id is None:
+            raise ValueError(f"invalid id {data['id']!r}")
+        timestamp = from_iso(data['timestamp']) if data.get('timestamp') else now_us()
+        status = data.get('status') or 'sent'
+        if status not in ('sent', 'read'):
+            raise ValueError(f'invalid status {status!r}')
+        return cls(raw_id, sender, recipient, message, timestamp, 'read' if status == 'read' else 'sent')
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': id_str(self.id),
+            'sender': self.sender,
+            'recipient': self.recipient,
+            'message': self.message,
+            'timestamp': to_iso(self.timestamp),
+            'status': self.status
+        }
+
+
+class Call:
+    """One voice or video call and where it is in its lifecycle"""
+
+    __slots__ = ('id', 'caller', 'recipient', 'type', 'status', 'room_url', 'created_at', 'accepted_at', 'ended_at')
+
+    def __init__(
+        self,
+        id: bytes,
+        caller: str,
+        recipient: str,
+        type: str,
+        room_url: str,
+        created_at: int,
+        status: str = 'pending',
+        accepted_at: Optional[int] = None,
+        ended_at: Optional[int] = None,
+    ):
+        self.id = id
+        self.caller = intern_name(caller)
+        self.recipient = intern_name(recipient)
+        self.type = type  # 'voice' or 'video'
+        self.status = status
+        self.room_url = room_url
+        self.created_at = created_at
+        self.accepted_at = accepted_at
+        self.ended_at = ended_at
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': id_str(self.id),
+            'caller': self.caller,
+            'recipient': self.recipient,
+            'type': self.type,
+            'status': self.status,
+            'room_url': self.room_url,
+            'created_at': to_iso(self.created_at),
+            'accepted_at': to_iso(self.accepted_at),
+            'ended_at': to_iso(self.ended_at)
+        }
+
+
+class Notification:
+    """One notification for a user"""
+
+    __slots__ = ('id', 'user_id', 'type', 'title', 'message', 'data', 'read', 'created_at')
+
+    def __init__(
+        self,
+        id: bytes,
+        user_id: str,
+        type: str,
+        title: str,
+        message: str,
+        data: Optional[Dict],
+        created_at: int,
+        read: bool = False,
+    ):
+        self.id = id
+        self.user_id = intern_name(user_id)
+        self.type = type  # 'message', 'call', 'system'
+        self.title = title
+        self.message = message
+        self.data = data or None  # most notifications carry none; don't keep an empty dict each
+        self.read = read
+        self.created_at = created_at
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': id_str(self.id),
+            'user_id': self.user_id,
+            'type': self.type,
+            'title': self.title,
+            'message': self.message,
+            'data': dict(self.data) if self.data else {},
+            'read': self.read,
+            'created_at': to_iso(self.created_at)
+        }
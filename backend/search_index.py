@@ -0,0 +1,189 @@
+"""
+Search Index
+In-memory inverted index over message text for full-text search
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from records import Message, conversation_key
+from striped_lock import StripedLock
+
+# Words that match nearly every message and say nothing about what was asked
+STOPWORDS = frozenset(
+    'a an and are as at be but by did do does for from had has have he her him his i if in is it '
+    'me my of on or our she so that the their them they this to was we were what when where which '
+    'who will with you your about say said'.split()
+)
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+# word -> term ('' for a stopword), for the words seen so far up to a cap
+_TERMS: Dict[str, str] = {}
+_TERMS_MAX = 200_000
+
+
+def _term(word: str) -> str:
+    if word.endswith("'s"):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    return '' if word in STOPWORDS else word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms with stopwords dropped and a light plural/possessive strip"""
+    terms = []
+    cache = _TERMS
+    for word in _WORD.findall(text.lower()):
+        term = cache.get(word)
+        if term is None:
+            term = _term(word)
+            if len(cache) < _TERMS_MAX:
+                cache[word] = term
+        if term:
+            terms.append(term)
+    return terms
+
+
+class MessageIndex:
+    """Term -> postings over messages, ranked with BM25, newest first on ties
+
+    Postings are kept per conversation, so a search scoped to a user or to
+    one conversation only touches that conversation's messages. Each
+    conversation's postings are guarded by its stripe of a StripedLock; the
+    document table and term counts shared by all conversations take a
+    short lock of their own.
+    """
+
+    def __init__(self):
+        # conversation -> term -> {doc: term count}
+        self.postings: Dict[Tuple[str, str], Dict[str, Dict[int, int]]] = {}
+        self.conversations: Dict[str, Set[Tuple[str, str]]] = {}  # user -> conversations they are in
+        self.doc_freq: Dict[str, int] = defaultdict(int)
+        self.docs: List[Optional[Message]] = []
+        self.lengths: List[int] = []
+        self.total_length = 0
+        self.removed = 0  # docs dropped by remove(); their slots in docs are None
+        self._locks = StripedLock()
+        self._docs_lock = threading.Lock()
+
+    def add(self, message: Message):
+        self.add_many([message])
+
+    def add_many(self, messages: List[Message]):
+        """Index a batch, taking the shared lock once and each conversation's lock once"""
+        counted = []
+        for message in messages:
+            terms = tokenize(message.message or '')
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            counted.append((message, len(terms), counts))
+
+        by_conversation: Dict[Tuple[str, str], List[Tuple[int, Dict[str, int]]]] = {}
+        with self._docs_lock:
+            doc_freq = self.doc_freq
+            doc = len(self.docs)
+            for message, length, counts in counted:
+                self.docs.append(message)
+                self.lengths.append(length)
+                self.total_length += length
+                for term in counts:
+                    doc_freq[term] += 1
+                key = conversation_key(message.sender, message.recipient)
+                by_conversation.setdefault(key, []).append((doc, counts))
+                doc += 1
+
+        for key, entries in by_conversation.items():
+            # setdefault is atomic, so concurrent first messages can't lose a conversation
+            for user in key:
+                self.conversations.setdefault(user, set()).add(key)
+            with self._locks.for_key(key):
+                postings = self.postings.setdefault(key, {})
+                for doc, counts in entries:
+                    for term, tf in counts.items():
+                        postings.setdefault(term, {})[doc] = tf
+
+    def remove(self, messages: List[Message]):
+        """Drop messages from the index (archived ones); their postings go, the doc numbers aren't reused"""
+        by_conversation: Dict[Tuple[str, str], Set[int]] = {}
+        for message in messages:
+            by_conversation.setdefault(conversation_key(message.sender, message.recipient), set()).add(id(message))
+
+        for key, targets in by_conversation.items():
+            dropped: Dict[str, int] = {}  # term -> docs dropped
+            gone: Set[int] = set()
+            with self._locks.for_key(key):
+                postings = self.postings.get(key, {})
+                for term in list(postings):
+                    docs = postings[term]
+                    for doc in [doc for doc in docs if id(self.docs[doc]) in targets]:
+                        del docs[doc]
+                        dropped[term] = dropped.get(term, 0) + 1
+                        gone.add(doc)
+                    if not docs:
+                        del postings[term]
+            with self._docs_lock:
+                for term, count in dropped.items():
+                    self.doc_freq[term] -= count
+                    if self.doc_freq[term] <= 0:
+                        del self.doc_freq[term]
+                for doc in gone:
+                    self.total_length -= self.lengths[doc]
+                    self.lengths[doc] = 0
+                    self.docs[doc] = None
+                self.removed += len(gone)
+
+    def rebuild(self, messages: List[Message]):
+        self.__init__()
+        for start in range(0, len(messages), 10_000):
+            self.add_many(messages[start:start + 10_000])
+
+    def search(
+        self, query: str, user: Optional[str] = None, contact: Optional[str] = None, limit: int = 5
+    ) -> Tuple[List[Tuple[float, Message]], int]:
+        """Top ``limit`` (score, message) for ``query`` and how many messages matched in all.
+
+        With ``user`` only messages they sent or received are considered, and
+        with ``contact`` as well only their conversation with that contact.
+        """
+        terms = set(tokenize(query))
+        count = len(self.docs) - self.removed
+        if not terms or not count:
+            return [], 0
+
+        if user is None:
+            conversations = list(self.postings)
+        elif contact is None:
+            conversations = list(self.conversations.get(user, ()))
+        else:
+            conversations = [conversation_key(user, contact)]
+
+        avg_length = self.total_length / count or 1
+        idf = {
+            term: math.log(1 + (count - self.doc_freq[term] + 0.5) / (self.doc_freq[term] + 0.5))
+            for term in terms if term in self.doc_freq
+        }
+        lengths = self.lengths
+        scores: Dict[int, float] = defaultdict(float)
+        for key in conversations:
+            postings = self.postings.get(key)
+            if not postings:
+                continue
+            with self._locks.for_key(key):
+                for term, weight in idf.items():
+                    for doc, tf in postings.get(term, {}).items():
+                        norm = K1 * (1 - B + B * lengths[doc] / avg_length)
+                        scores[doc] += weight * tf * (K1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(round(score, 3), self.docs[doc]) for doc, score in top], len(scores)
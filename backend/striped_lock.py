@@ -0,0 +1,31 @@
+"""
+Striped Lock
+A fixed set of locks shared out by key hash
+
+Flask-SocketIO runs in threading mode, so request handlers touch the
+services concurrently. One lock per service would serialize everyone;
+one lock per key would grow without bound. A key (conversation, call id,
+user) always maps to the same one of `stripes` locks, so work on the same
+record is serialized and work on unrelated records almost never waits.
+"""
+
+import threading
+from typing import Hashable, List
+
+DEFAULT_STRIPES = 64
+
+
+class StripedLock:
+    """key -> one of a fixed pool of re-entrant locks"""
+
+    def __init__(self, stripes: int = DEFAULT_STRIPES):
+        self._locks: List[threading.RLock] = [threading.RLock() for _ in range(stripes)]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def stripe(self, key: Hashable) -> int:
+        return hash(key) % len(self._locks)
+
+    def for_key(self, key: Hashable) -> threading.RLock:
+        return self._locks[self.stripe(key)]
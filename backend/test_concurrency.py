@@ -0,0 +1,93 @@
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from call_service import CallService
+from messaging_service import MessagingService
+from notification_service import NotificationService
+
+RESIDENT = 'user'
+OPERATIONS = 2000
+THREADS = 32
+CONVERSATIONS = 50
+RACERS = 4  # concurrent answers per call
+
+
+@pytest.fixture
+def fast_switching():
+    # Threads switch every microsecond, so they interleave inside the services' check-and-set steps
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_racing_sends_answers_ends_and_deletes_keep_the_invariants(fast_switching):
+    messaging, calls, notifications = MessagingService(), CallService(), NotificationService()
+    calls.daily_api_key = ''  # mock rooms: this is about the services' locking, not Daily's latency
+    call_count = OPERATIONS // 10
+    call_ids = [calls.create_call(f'contact-{i % 20}', RESIDENT, 'voice')['call_id'] for i in range(call_count)]
+    existing = [
+        notifications.create_notification(f'contact-{i % CONVERSATIONS}', 'message', 'New message', f'n {i}')
+        ['notification_id'] for i in range(OPERATIONS // 2)
+    ]
+    doomed = existing[::2]
+
+    def send(i):
+        return messaging.send_message(f'contact-{i % CONVERSATIONS}', RESIDENT, f'message {i}')['success']
+
+    def answer(i):
+        # One racer in four rejects; the rest accept
+        if i % RACERS == 0:
+            return calls.reject_call(call_ids[i // RACERS], RESIDENT)['success']
+        return calls.accept_call(call_ids[i // RACERS], RESIDENT)['success']
+
+    def notify(i):
+        return notifications.create_notification(
+            f'contact-{i % CONVERSATIONS}', 'message', 'New message', f'new {i}')['success']
+
+    # Everything in one shuffled batch: sends, answers, ends, creates and double deletes all overlap
+    batch = (
+        [('send', i, send) for i in range(OPERATIONS)]
+        + [('answer', i, answer) for i in range(call_count * RACERS)]
+        + [('end', i, lambda i: calls.end_call(call_ids[i])['success']) for i in range(call_count)]
+        + [('notify', i, notify) for i in range(OPERATIONS // 2)]
+        + [('delete', i, lambda i: notifications.delete_notification(doomed[i])) for i in range(len(doomed))] * 2
+    )
+    random.Random(OPERATIONS).shuffle(batch)
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(lambda op: (op[0], op[1], op[2](op[1])), batch))
+
+    outcomes = {}
+    for kind, i, result in results:
+        outcomes.setdefault(kind, []).append((i, result))
+
+    assert all(ok for _, ok in outcomes['send'])
+    histories = [messaging.get_history(f'contact-{c}', RESIDENT, limit=OPERATIONS) for c in range(CONVERSATIONS)]
+    assert sum(len(history) for history in histories) == OPERATIONS == sum(1 for _ in messaging.iter_messages())
+    assert len(messaging.index.docs) == OPERATIONS
+    for history in histories:
+        assert all(a.timestamp <= b.timestamp for a, b in zip(history, history[1:]))
+
+    # An answer wins only while the call is pending: at most one per call, none once it was ended
+    winners = [0] * call_count
+    for i, won in outcomes['answer']:
+        winners[i // RACERS] += won
+    assert all(ok for _, ok in outcomes['end'])
+    for call_id, won in zip(call_ids, winners):
+        call = calls.get_call_info(call_id)
+        assert won <= 1
+        if call.status == 'rejected':
+            assert won == 1 and call.accepted_at is None
+        else:
+            assert call.status == 'ended'
+            assert (call.accepted_at is not None) == (won == 1)
+            assert call.accepted_at is None or call.accepted_at <= call.ended_at
+
+    # Each doomed notification deleted twice at once: exactly one delete wins
+    assert all(ok for _, ok in outcomes['notify'])
+    assert sum(deleted for _, deleted in outcomes['delete']) == len(doomed)
+    remaining = sum(len(notifications.get_notifications(f'contact-{c}')) for c in range(CONVERSATIONS))
+    assert remaining == len(existing) + OPERATIONS // 2 - len(doomed)
@@ -0,0 +1,66 @@
+import json
+import uuid
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, 'messaging_service', backend.MessagingService())
+    monkeypatch.setattr(backend.rate_limiter, 'enabled', False)
+    return backend.app.test_client()
+
+
+def _export(client, user, contact=None):
+    query = {'user': user, **({'contact': contact} if contact else {})}
+    response = client.get('/api/messages/export', query_string=query)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_importing_the_same_archive_twice_adds_nothing(client, monkeypatch):
+    user = f'resident-{uuid.uuid4().hex[:8]}'
+    for i in range(3):
+        client.post('/api/messages/send', json={'sender': user, 'contact': 'tom', 'message': f'goodnight {i}'})
+    archive = ''.join(json.dumps(msg) + '\n' for msg in _export(client, user))
+
+    monkeypatch.setattr(backend, 'messaging_service', backend.MessagingService())
+    first = client.post('/api/messages/import', data=archive, content_type='application/x-ndjson').get_json()
+    again = client.post('/api/messages/import', data=archive, content_type='application/x-ndjson').get_json()
+    assert (first['imported'], first['skipped']) == (3, 0)
+    assert (again['imported'], again['skipped']) == (0, 3)
+
+    history = client.get('/api/messages/history', query_string={'user': user, 'contact': 'tom'}).get_json()
+    assert len(history['messages']) == 3
+    assert len({msg['id'] for msg in history['messages']}) == 3
+    search = client.get('/api/messages/search', query_string={'user': user, 'q': 'goodnight'}).get_json()
+    assert search['total_matches'] == 3
+
+
+def test_export_reads_only_the_users_conversations(client, monkeypatch, tmp_path):
+    from message_archive import MessageArchive
+    from records import Message, new_id
+
+    service = backend.MessagingService()
+    monkeypatch.setattr(backend, 'messaging_service', service)
+    start = 1_700_000_000 * 1_000_000  # 2023-11
+    month = 31 * 86400 * 1_000_000
+    service.add_messages([
+        Message(new_id(), sender, 'tom', f'{sender} {i}', start + i * month, 'read')
+        for i in range(6) for sender in ('alice', 'bob', 'carol')
+    ])
+    service.archive = MessageArchive(str(tmp_path))
+    service.archive_cold(start + 5 * month)
+    assert service.archive.stats()['segments'] > 0
+
+    def no_full_scan():
+        raise AssertionError('walked every hot message')
+
+    monkeypatch.setattr(service, '_hot_messages', no_full_scan)
+    monkeypatch.setattr(service.archive, 'iter_messages', no_full_scan)
+    reads = service.archive.stats()['block_reads']
+    exported = _export(client, 'alice')
+    assert [msg['message'] for msg in exported] == [f'alice {i}' for i in range(6)]
+    assert service.archive.stats()['block_reads'] - reads == len(service.archive.blocks_of(('alice', 'tom')))
@@ -0,0 +1,49 @@
+import os
+
+from call_service import CallService
+from messaging_service import MessagingService
+from notification_service import NotificationService
+from persistence import SNAPSHOT_MAGIC, Store, WriteAheadLog, _frame, encode_notification
+from records import Notification, new_id, now_us
+
+
+def _services():
+    return MessagingService(), CallService(), NotificationService()
+
+
+def test_mark_all_read_during_a_snapshot_leaves_later_notifications_unread(tmp_path):
+    # mark_all_as_read(u) and then a new notification N both land while snapshot 2 is
+    # being written: the snapshot holds N unread, and wal 2 has both changes
+    old = Notification(new_id(), 'u', 'message', 'Old', 'old one', None, now_us(), read=True)
+    new = Notification(new_id(), 'u', 'message', 'New', 'new one', None, now_us())
+    with open(tmp_path / 'snapshot-00000002.bin', 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + _frame(encode_notification(old)) + _frame(encode_notification(new)))
+    wal = WriteAheadLog(os.path.join(tmp_path, 'wal-00000002.log'))
+    wal.notifications_read('u', [old])
+    wal.notification_added(new)
+    wal.close()
+
+    messaging, calls, notifications = _services()
+    store = Store(str(tmp_path), messaging, calls, notifications)
+    try:
+        assert [n.title for n in notifications.get_notifications('u', unread_only=True)] == ['New']
+    finally:
+        store.close()
+
+
+def test_mark_all_read_is_recovered(tmp_path):
+    messaging, calls, notifications = _services()
+    store = Store(str(tmp_path), messaging, calls, notifications)
+    for i in range(3):
+        notifications.create_notification('u', 'message', f'n{i}', 'hello')
+    assert notifications.mark_all_as_read('u') == 3
+    notifications.create_notification('u', 'message', 'later', 'hello')
+    store.close()
+
+    messaging, calls, notifications = _services()
+    store = Store(str(tmp_path), messaging, calls, notifications)
+    try:
+        assert [n.title for n in notifications.get_notifications('u', unread_only=True)] == ['later']
+        assert len(notifications.get_notifications('u')) == 4
+    finally:
+        store.close()
@@ -0,0 +1,48 @@
+import pytest
+
+import app as backend
+from rate_limiter import RateLimiter, parse_limits
+
+
+def _limiter():
+    return RateLimiter(
+        limits=parse_limits('default=100/60:100,request_call=5/60:3'),
+        client_limits=parse_limits('request_call=10/60:5', default=None),
+        redis_url='',
+        enabled=True,
+    )
+
+
+def test_each_user_has_their_own_bucket():
+    limiter = _limiter()
+    assert [limiter.check('request_call', 'alice', '10.0.0.1').allowed for _ in range(4)] == [True] * 3 + [False]
+    assert limiter.check('request_call', 'bob', '10.0.0.1').allowed
+
+
+def test_a_new_user_per_request_still_runs_out_per_client():
+    limiter = _limiter()
+    allowed = [limiter.check('request_call', f'caller-{i}', '10.0.0.1').allowed for i in range(8)]
+    assert allowed == [True] * 5 + [False] * 3
+    # Another address has its own bucket; routes without a client limit don't use one
+    assert limiter.check('request_call', 'caller-x', '10.0.0.2').allowed
+    assert all(limiter.check('search_messages', f'u{i}', '10.0.0.1').allowed for i in range(20))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, 'messaging_service', backend.MessagingService())
+    monkeypatch.setattr(backend, 'rate_limiter', RateLimiter(
+        limits=parse_limits('default=100/60:100,send_message=20/60:10'),
+        client_limits=parse_limits('send_message=10/60:4', default=None),
+        redis_url='',
+        enabled=True,
+    ))
+    return backend.app.test_client()
+
+
+def test_rotating_senders_get_429(client):
+    statuses = [
+        client.post('/api/messages/send', json={'sender': f'sender-{i}', 'contact': 'tom', 'message': 'hi'}).status_code
+        for i in range(6)
+    ]
+    assert statuses == [200] * 4 + [429] * 2
@@ -0,0 +1,201 @@
+/**
+ * Client side of the /ws voice framing (see frontend/audio_protocol.py).
+ *
+ * - `json.v1`: base64 PCM16 inside JSON text messages (original format).
+ * - `pcm16.v1`: binary messages with an 8 byte header + raw PCM16.
+ * - `opus.v1`: same header, payload is u16 length-prefixed Opus packets (20 ms each).
+ *
+ * The format is negotiated with the WebSocket subprotocol; the server picks the
+ * first one it supports from the list we offer and `ws.protocol` tells us which.
+ * Control messages (anything that isn't audio) are JSON in every format.
+ */
+
+export const PROTOCOL_JSON = 'json.v1';
+export const PROTOCOL_PCM16 = 'pcm16.v1';
+export const PROTOCOL_OPUS = 'opus.v1';
+
+export const PROTOCOL_VERSION = 1;
+export const KIND_CONTROL = 0;
+export const KIND_PCM16 = 1;
+export const KIND_OPUS = 2;
+
+const HEADER_SIZE = 8;
+const OPUS_FRAME_MS = 20;
+
+/** Opus needs a native module in React Native; plug one in through this interface. */
+export interface OpusCodec {
+	encode(pcm: Int16Array): Uint8Array;
+	decode(packet: Uint8Array): Int16Array;
+}
+
+export type AudioMessage = {
+	version: number;
+	kind: number;
+	seq: number;
+	sampleRate: number;
+	payload: Uint8Array;
+};
+
+/** Prefix a payload with the protocol header (network byte order). */
+export function packMessage(kind: number, seq: number, sampleRate: number, payload: Uint8Array): Uint8Array {
+	const out = new Uint8Array(HEADER_SIZE + payload.byteLength);
+	const view = new DataView(out.buffer);
+	view.setUint8(0, PROTOCOL_VERSION);
+	view.setUint8(1, kind);
+	view.setUint16(2, seq & 0xffff);
+	view.setUint32(4, sampleRate);
+	out.set(payload, HEADER_SIZE);
+	return out;
+}
+
+export function unpackMessage(data: ArrayBuffer): AudioMessage {
+	if (data.byteLength < HEADER_SIZE) throw new Error('message shorter than header');
+	const view = new DataView(data);
+	return {
+		version: view.getUint8(0),
+		kind: view.getUint8(1),
+		seq: view.getUint16(2),
+		sampleRate: view.getUint32(4),
+		payload: new Uint8Array(data, HEADER_SIZE),
+	};
+}
+
+export function packPackets(packets: Uint8Array[]): Uint8Array {
+	const total = packets.reduce((n, p) => n + 2 + p.byteLength, 0);
+	const out = new Uint8Array(total);
+	const view = new DataView(out.buffer);
+	let offset = 0;
+	for (const p of packets) {
+		view.setUint16(offset, p.byteLength);
+		out.set(p, offset + 2);
+		offset += 2 + p.byteLength;
+	}
+	return out;
+}
+
+export function unpackPackets(payload: Uint8Array): Uint8Array[] {
+	const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+	const packets: Uint8Array[] = [];
+	let offset = 0;
+	while (offset + 2 <= payload.byteLength) {
+		const length = view.getUint16(offset);
+		packets.push(payload.subarray(offset + 2, offset + 2 + length));
+		offset += 2 + length;
+	}
+	return packets;
+}
+
+function pcmToBytes(pcm: Int16Array): Uint8Array {
+	// PCM16 on the wire is little-endian, which matches every platform RN runs on
+	return new Uint8Array(pcm.buffer, pcm.byteOffset, pcm.byteLength);
+}
+
+function bytesToBase64(bytes: Uint8Array): string {
+	let binary = '';
+	for (let i = 0; i < bytes.byteLength; i++) binary += String.fromCharCode(bytes[i]);
+	return btoa(binary);
+}
+
+function base64ToPcm(b64: string): Int16Array {
+	const binary = atob(b64);
+	const bytes = new Uint8Array(binary.length);
+	for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+	return new Int16Array(bytes.buffer);
+}
+
+export type AudioSocketOptions = {
+	sampleRate?: number;
+	/** Supplying a codec adds `opus.v1` to the offered protocols. */
+	opus?: OpusCodec;
+	onAudio?: (pcm: Int16Array, sampleRate: number) => void;
+	onControl?: (message: unknown) => void;
+	onOpen?: (protocol: string) => void;
+	onClose?: () => void;
+};
+
+/** A /ws connection that speaks whichever framing the server agreed to. */
+export class AudioSocket {
+	private ws: WebSocket;
+	private seq = 0;
+	private pending: Int16Array = new Int16Array(0);
+	private readonly sampleRate: number;
+	protocol: string = PROTOCOL_JSON;
+
+	constructor(url: string, private options: AudioSocketOptions = {}) {
+		this.sampleRate = options.sampleRate ?? 16000;
+		const offered = [...(options.opus ? [PROTOCOL_OPUS] : []), PROTOCOL_PCM16, PROTOCOL_JSON];
+
+		this.ws = new WebSocket(url, offered);
+		this.ws.binaryType = 'arraybuffer';
+		this.ws.onopen = () => {
+			this.protocol = this.ws.protocol || PROTOCOL_JSON;
+			options.onOpen?.(this.protocol);
+		};
+		this.ws.onclose = () => options.onClose?.();
+		this.ws.onmessage = (e) => this.handleMessage(e.data);
+	}
+
+	/** Send a chunk of microphone PCM16. */
+	sendPcm(pcm: Int16Array) {
+		if (this.ws.readyState !== WebSocket.OPEN) return;
+
+		if (this.protocol === PROTOCOL_OPUS && this.options.opus) {
+			// Opus wants whole 20 ms frames; keep the remainder for the next chunk
+			const merged = new Int16Array(this.pending.length + pcm.length);
+			merged.set(this.pending);
+			merged.set(pcm, this.pending.length);
+			const frame = (this.sampleRate * OPUS_FRAME_MS) / 1000;
+			const packets: Uint8Array[] = [];
+			let offset = 0;
+			for (; offset + frame <= merged.length; offset += frame) {
+				packets.push(this.options.opus.encode(merged.subarray(offset, offset + frame)));
+			}
+			this.pending = merged.slice(offset);
+			if (packets.length) {
+				this.ws.send(packMessage(KIND_OPUS, ++this.seq, this.sampleRate, packPackets(packets)));
+			}
+		} else if (this.protocol === PROTOCOL_PCM16) {
+			this.ws.send(packMessage(KIND_PCM16, ++this.seq, this.sampleRate, pcmToBytes(pcm)));
+		} else {
+			this.ws.send(JSON.stringify({ audio: bytesToBase64(pcmToBytes(pcm)), sample_rate: this.sampleRate }));
+		}
+	}
+
+	sendControl(message: unknown) {
+		if (this.ws.readyState !== WebSocket.OPEN) return;
+		const body = JSON.stringify(message);
+		if (this.protocol === PROTOCOL_JSON) {
+			this.ws.send(body);
+		} else {
+			this.ws.send(packMessage(KIND_CONTROL, ++this.seq, 0, new TextEncoder().encode(body)));
+		}
+	}
+
+	close() {
+		this.ws.close();
+	}
+
+	private handleMessage(data: ArrayBuffer | string) {
+		if (typeof data === 'string') {
+			const message = JSON.parse(data);
+			if (message && typeof message.audio === 'string') {
+				this.options.onAudio?.(base64ToPcm(message.audio), message.sample_rate ?? this.sampleRate);
+			} else {
+				this.options.onControl?.(message);
+			}
+			return;
+		}
+
+		const msg = unpackMessage(data);
+		if (msg.kind === KIND_PCM16) {
+			const copy = msg.payload.slice(); // realign to an even offset
+			this.options.onAudio?.(new Int16Array(copy.buffer), msg.sampleRate);
+		} else if (msg.kind === KIND_OPUS && this.options.opus) {
+			for (const packet of unpackPackets(msg.payload)) {
+				this.options.onAudio?.(this.options.opus.decode(packet), msg.sampleRate);
+			}
+		} else if (msg.kind === KIND_CONTROL) {
+			this.options.onControl?.(JSON.parse(new TextDecoder().decode(msg.payload)));
+		}
+	}
+}
@@ -1,6 +1,8 @@
 import { PermissionsAndroid, Platform } from 'react-native';
+import { AudioSocket, AudioSocketOptions } from './audioProtocol';
 
 let ws: WebSocket | null = null;
+let audioSocket: AudioSocket | null = null;
 
 let ws_endpoint = 'wss://8387f03c1ca7.ngrok-free.app/ws';
 async function requestAudioPermission(){
@@ -116,6 +118,39 @@ export async function startStreaming() {
   }
 }
 
+/**
+ * Open a raw /ws audio socket to the FastAPI server (no Daily).
+ * Offers Opus when `options.opus` is given (~24 kbps instead of ~256 kbps
+ * each way on cellular), then binary PCM16, then the legacy JSON framing.
+ */
+export async function openAudioSocket(options: AudioSocketOptions = {}) {
+  if (audioSocket) return audioSocket;
+
+  const hasPermission = await requestAudioPermission();
+  if (!hasPermission) {
+    console.warn('Microphone permission denied');
+    return null;
+  }
+
+  audioSocket = new AudioSocket(ws_endpoint, {
+    ...options,
+    onOpen: (protocol) => {
+      console.log('WebSocket connected using', protocol);
+      options.onOpen?.(protocol);
+    },
+    onClose: () => {
+      audioSocket = null;
+      options.onClose?.();
+    },
+  });
+  return audioSocket;
+}
+
+export function closeAudioSocket() {
+  audioSocket?.close();
+  audioSocket = null;
+}
+
 /**
  * Stop streaming and clean up
  */
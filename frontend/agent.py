@@ -15,8 +15,6 @@ from pipecat.pipeline.task import PipelineTask
 # from pipecat.services.cartesia import CartesiaTTSService
 # from pipecat.transports.services.daily import DailyTransport, DailyParams
 # from pipecat.vad.silero import SileroVADAnalyzer
-from pipecat.services.deepgram.stt import DeepgramSTTService
-from pipecat.services.deepgram.tts import DeepgramTTSService
 # from pipecat.services.openai.llm import OpenAILLMService
 # Prefer OpenAI-style context aggregator; fall back to legacy aggregators if not available in this environment
 try:
@@ -28,14 +26,15 @@ except Exception:  # pragma: no cover - fallback for environments without the mo
         LLMAssistantResponseAggregator,
         LLMUserResponseAggregator,
     )
-from pipecat.services.cartesia.tts import CartesiaTTSService
 from pipecat.transports.daily.transport import DailyTransport, DailyParams
 from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.services.perplexity.llm import PerplexityLLMService
 
 import aiohttp
 from loguru import logger
 from dotenv import load_dotenv
+from context_window import ContextWindowManager
+from daily_token import create_daily_token, token_cache
+from service_factory import LatencyTracker, create_context_aggregator, create_services
 
 load_dotenv()
 
@@ -92,35 +91,14 @@ class ElderlyVoiceAgent:
             return False
 
 
-async def create_daily_token(room_name: str, api_key: str) -> str:
-    """Create a Daily meeting token for the given room."""
-    if not room_name or not api_key:
-        raise ValueError("DAILY_ROOM_NAME or DAILY_API_KEY missing.")
-    url = "https://api.daily.co/v1/meeting-tokens"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "properties": {
-            "room_name": room_name,
-            "is_owner": True
-        }
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=headers) as resp:
-            data = await resp.json()
-            if resp.status != 200:
-                raise RuntimeError(f"Daily token error {resp.status}: {data}")
-            return data["token"]
-
-
 async def main():
     """Main entry point for the voice agent"""
 
     daily_api_key = os.getenv("DAILY_API_KEY")
     daily_room_name = os.getenv("DAILY_ROOM_NAME")
+    # Cached on disk; only hits the Daily API when the token is close to expiry
     token = await create_daily_token(daily_room_name, daily_api_key)
+    token_cache.start_refresher(daily_room_name, daily_api_key)
     DAILY_ROOM_URL = "https://eldervoiceagent.daily.co/ElderlyVoiceAssistantRoom"
     #DAILY_ROOM_URL = f"https://{daily_room_name}.daily.co"
 
@@ -139,25 +117,10 @@ async def main():
         bot_name="ElderlyVoiceAssistant"
     )
 
-    # Initialize STT service (Deepgram)
-    stt = DeepgramSTTService(
-        api_key=os.getenv("DEEPGRAM_API_KEY"),
-        model="nova-2",
-        language="en"
-    )
-
-    # Initialize LLM service (OpenAI)
-    llm = PerplexityLLMService(api_key=os.getenv("PERPLEXITY_API_KEY"), model="sonar")
-    # llm = OpenAILLMService(
-    #     api_key=os.getenv("OPENAI_API_KEY"),
-    #     model="gpt-4o",
-    # )
-
-    # Initialize TTS service (Deepgram)
-    tts = DeepgramTTSService(
-        api_key=os.getenv("DEEPGRAM_API_KEY"),
-        voice="aura-2-andromeda-en"
-    )
+    # STT, LLM and TTS come from Config (<STAGE>_PROVIDER, <STAGE>_FALLBACK_PROVIDER);
+    # a stage with a fallback fails over when its p95 time to first byte is too slow
+    latency_tracker = LatencyTracker()
+    stt, llm, tts = create_services(tracker=latency_tracker)
 
     # Define system prompt for elderly-friendly interaction
     system_prompt = """You are a friendly and patient voice assistant for elderly users. Respond ONLY with your direct reply. 
@@ -191,14 +154,18 @@ async def main():
             }
         ]
         context = OpenAILLMContext(messages)
-        context_aggregator = llm.create_context_aggregator(context)
+        context_aggregator = create_context_aggregator(llm, context)
+        # Keeps the prompt to the system prompt + rolling summary + recent turns
+        context_window = ContextWindowManager()
 
         # Create pipeline (context-aware)
         pipeline = Pipeline([
             transport.input(),
             stt,
             context_aggregator.user(),
+            context_window,
             llm,
+            context_window.latency_meter(),
             tts,
             transport.output(),
             context_aggregator.assistant(),
@@ -222,10 +189,12 @@ async def main():
     task = PipelineTask(
         pipeline,
         params = PipelineParams(
-                system_prompt= system_prompt
+                system_prompt= system_prompt,
+                enable_metrics=True,
         ),
-        observers=[]
+        observers=[latency_tracker]
     )
+    latency_tracker.attach(task)
 
     # Start the agent
     runner = PipelineRunner()
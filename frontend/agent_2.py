@@ -4,37 +4,21 @@ Uses Pipecat framework to create a voice-controlled communication assistant
 """
 
 import os
+import time
 import asyncio
-from pipecat.frames.frames import TextFrame, EndFrame
-from pipecat.pipeline.pipeline import Pipeline
-from pipecat.pipeline.task import PipelineParams
-from pipecat.pipeline.runner import PipelineRunner
-from pipecat.pipeline.task import PipelineTask
-# from pipecat.services.deepgram import DeepgramSTTService
-# from pipecat.services.openai import OpenAILLMService
-# from pipecat.services.cartesia import CartesiaTTSService
-# from pipecat.transports.services.daily import DailyTransport, DailyParams
-# from pipecat.vad.silero import SileroVADAnalyzer
-from pipecat.services.deepgram.stt import DeepgramSTTService
-try:
-    from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext  # type: ignore
-    HAS_OPENAI_CTX = True
-except Exception:  # pragma: no cover - fallback for environments without the module
-    HAS_OPENAI_CTX = False
-    from pipecat.processors.aggregators.llm_response import (
-        LLMAssistantResponseAggregator,
-        LLMUserResponseAggregator,
-    )
-from pipecat.services.openai.llm import OpenAILLMService
-from pipecat.services.cartesia.tts import CartesiaTTSService
-from pipecat.transports.daily.transport import DailyTransport, DailyParams
-from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.services.perplexity.llm import PerplexityLLMService
+import importlib
+import argparse
+import threading
+from contextlib import contextmanager
 
 import aiohttp
 from loguru import logger
 from dotenv import load_dotenv
-from tools import get_tools
+from daily_token import create_daily_token, token_cache
+
+# Pipecat and the provider SDKs are imported inside main() and only for the
+# providers that are configured, so TEXT_SIMULATION=1 never loads them and a
+# voice start only pays for what it uses.
 
 # Optional: run a text-only simulator when TEXT_SIMULATION is enabled
 def _maybe_run_text_simulation():
@@ -46,8 +30,8 @@ def _maybe_run_text_simulation():
             print("TEXT_SIMULATION requested but simulate_text could not be imported.")
             print(f"Reason: {e}")
             raise
-        # Run the text simulator and exit
-        simulate_main()
+        # Run the text simulator and exit (its own CLI flags don't apply here)
+        simulate_main([])
         return True
     return False
 
@@ -106,35 +90,45 @@ class ElderlyVoiceAgent:
             return False
 
 
-async def create_daily_token(room_name: str, api_key: str) -> str:
-    """Create a Daily meeting token for the given room."""
-    if not room_name or not api_key:
-        raise ValueError("DAILY_ROOM_NAME or DAILY_API_KEY missing.")
-    url = "https://api.daily.co/v1/meeting-tokens"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "properties": {
-            "room_name": room_name,
-            "is_owner": True
-        }
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=headers) as resp:
-            data = await resp.json()
-            if resp.status != 200:
-                raise RuntimeError(f"Daily token error {resp.status}: {data}")
-            return data["token"]
-
-
-async def main():
-    """Main entry point for the voice agent"""
-    # If text simulation is requested, run it and skip the voice pipeline
-    if _maybe_run_text_simulation():
-        return
+class StartupProfile:
+    """Wall time of each import and initialization step during startup"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = []  # (component, phase, ms); appended from worker threads too
+
+    @contextmanager
+    def step(self, component: str, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((component, phase, (time.perf_counter() - started) * 1000))
 
+    def report(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        lines = [f"{'component':<12} {'phase':<8} {'ms':>9}"]
+        for component, phase, ms in sorted(self.steps, key=lambda s: -s[2]):
+            lines.append(f"{component:<12} {phase:<8} {ms:>9.1f}")
+        # Steps overlap, so the rows add up to more than this
+        lines.append(f"startup took {total:.1f} ms wall")
+        return "\n".join(lines)
+
+
+# Imports of packages that share dependencies (openai, pipecat.services) can
+# see half-initialized modules when run in parallel threads, so imports take
+# turns; what overlaps is the network, model loading and construction.
+_IMPORT_LOCK = threading.Lock()
+
+
+def _load(profile: StartupProfile, component: str, module: str, *names: str):
+    """Import ``names`` from ``module``, timed as ``component``'s import step."""
+    with _IMPORT_LOCK, profile.step(component, "import"):
+        mod = importlib.import_module(module)
+    return [getattr(mod, name) for name in names]
+
+
+async def build_transport(profile: StartupProfile):
     # Gather Daily-related configuration
     daily_api_key = os.getenv("DAILY_API_KEY")
     daily_room_name = os.getenv("DAILY_ROOM_NAME")  # actual room name
@@ -147,7 +141,24 @@ async def main():
             "Missing DAILY_API_KEY or DAILY_ROOM_NAME. Set these or enable TEXT_SIMULATION=1 to run text-only."
         )
 
-    token = await create_daily_token(daily_room_name, daily_api_key)
+    async def token():
+        # Cached on disk; only hits the Daily API when the token is close to expiry
+        with profile.step("daily", "token"):
+            value = await create_daily_token(daily_room_name, daily_api_key)
+        token_cache.start_refresher(daily_room_name, daily_api_key)
+        return value
+
+    def vad():
+        (SileroVADAnalyzer,) = _load(profile, "silero", "pipecat.audio.vad.silero", "SileroVADAnalyzer")
+        with profile.step("silero", "init"):
+            return SileroVADAnalyzer()
+
+    # Token round trip, Daily import and VAD model load overlap
+    token_value, (DailyTransport, DailyParams), vad_analyzer = await asyncio.gather(
+        token(),
+        asyncio.to_thread(_load, profile, "daily", "pipecat.transports.daily.transport", "DailyTransport", "DailyParams"),
+        asyncio.to_thread(vad),
+    )
 
     # Resolve room URL preference order:
     # 1) Explicit DAILY_ROOM_URL
@@ -161,42 +172,46 @@ async def main():
         room_url = f"https://example.daily.co/{daily_room_name}"
 
     # Initialize transport (Daily for WebRTC)
-    transport = DailyTransport(
-        params = DailyParams(
-            api_key=os.getenv("DAILY_API_KEY"),
-            audio_in_enabled=True,
-            audio_out_enabled=True,
-            transcription_enabled=True,
-            vad_enabled=True,
-            vad_analyzer=SileroVADAnalyzer()
-        ),
-        token=token,
-        room_url=room_url,
-        bot_name="ElderlyVoiceAssistant"
-    )
+    with profile.step("daily", "init"):
+        return DailyTransport(
+            params = DailyParams(
+                api_key=daily_api_key,
+                audio_in_enabled=True,
+                audio_out_enabled=True,
+                transcription_enabled=True,
+                vad_enabled=True,
+                vad_analyzer=vad_analyzer
+            ),
+            token=token_value,
+            room_url=room_url,
+            bot_name="ElderlyVoiceAssistant"
+        )
 
-    # Initialize STT service (Deepgram)
-    stt = DeepgramSTTService(
-        api_key=os.getenv("DEEPGRAM_API_KEY"),
-        model="nova-2",
-        language="en"
-    )
 
-    # Initialize LLM service (OpenAI)
-    llm = PerplexityLLMService(api_key=os.getenv("PERPLEXITY_API_KEY"), model="sonar")
-    # llm = OpenAILLMService(
-    #     api_key=os.getenv("OPENAI_API_KEY"),
-    #     model="gpt-4",
-    #)
-
-    # Initialize TTS service (Cartesia)
-    tts = CartesiaTTSService(
-        api_key=os.getenv("CARTESIA_API_KEY"),
-        voice_id="a0e99841-438c-4a64-b679-ae501e7d6091"  # Friendly, clear voice
-    )
+def build_stage(profile: StartupProfile, stage: str, tracker):
+    """One of stt/llm/tts from Config, importing only its configured providers."""
+    from service_factory import create_stage, provider_classes
+
+    with _IMPORT_LOCK, profile.step(stage, "import"):
+        provider_classes(stage)
+    with profile.step(stage, "init"):
+        return create_stage(stage, tracker=tracker)
+
+
+def load_pipeline_modules(profile: StartupProfile):
+    """Pipecat core plus this package's processors (everything that isn't a provider)."""
+    with _IMPORT_LOCK, profile.step("pipeline", "import"):
+        import pipecat.pipeline.pipeline  # noqa: F401
+        import pipecat.pipeline.runner  # noqa: F401
+        import pipecat.pipeline.task  # noqa: F401
+        import context_window  # noqa: F401
+        import event_announcer  # noqa: F401
+        import intent_fast_path  # noqa: F401
+        import session_bootstrap  # noqa: F401
+        import tools  # noqa: F401
 
-    # Define system prompt for elderly-friendly interaction
-    system_prompt = """You are a friendly and patient voice assistant designed specifically for elderly users. 
+
+SYSTEM_PROMPT = """You are a friendly and patient voice assistant designed specifically for elderly users.
 Your role is to help them communicate with family and friends without needing to use phones or computers directly.
 
 You can help them:
@@ -227,23 +242,87 @@ For incoming notifications, clearly announce:
 
 Be warm, friendly, and respectful at all times."""
 
+
+async def main(profile_startup: bool = False):
+    """Main entry point for the voice agent"""
+    # If text simulation is requested, run it and skip the voice pipeline
+    if _maybe_run_text_simulation():
+        return
+
+    profile = StartupProfile()
+    with profile.step("factory", "import"):
+        from service_factory import LatencyTracker, create_context_aggregator
+    latency_tracker = LatencyTracker()
+
+    # Transport, STT, LLM, TTS and the pipeline modules don't depend on each
+    # other; build them concurrently. Work runs in threads (imports one at a
+    # time, see _IMPORT_LOCK) so the Daily token request, the VAD model load
+    # and service construction overlap with the imports.
+    results = await asyncio.gather(
+        build_transport(profile),
+        asyncio.to_thread(build_stage, profile, "stt", latency_tracker),
+        asyncio.to_thread(build_stage, profile, "llm", latency_tracker),
+        asyncio.to_thread(build_stage, profile, "tts", latency_tracker),
+        asyncio.to_thread(load_pipeline_modules, profile),
+        return_exceptions=profile_startup,
+    )
+
+    if profile_startup:
+        print(profile.report())
+        for name, result in zip(("transport", "stt", "llm", "tts", "pipeline"), results):
+            if isinstance(result, BaseException):
+                print(f"{name} failed: {result}")
+        await token_cache.stop()
+        return
+
+    transport, stt, llm, tts, _ = results
+
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.pipeline.task import PipelineParams, PipelineTask
+    from context_window import ContextWindowManager
+    from event_announcer import BackendEventAnnouncer
+    from intent_fast_path import IntentFastPath
+    from session_bootstrap import RESIDENT_USER_ID, inject_user_state
+    from tools import get_tools, register_function_handlers
+
+    try:
+        from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext  # type: ignore
+        HAS_OPENAI_CTX = True
+    except Exception:  # pragma: no cover - fallback for environments without the module
+        HAS_OPENAI_CTX = False
+        from pipecat.processors.aggregators.llm_response import (
+            LLMAssistantResponseAggregator,
+            LLMUserResponseAggregator,
+        )
+
     if HAS_OPENAI_CTX:
         # Build an OpenAI-compatible conversational context to enforce proper turn alternation
         messages = [
             {
                 "role": "system",
-                "content": system_prompt,
+                "content": SYSTEM_PROMPT,
             }
         ]
-        context = OpenAILLMContext(messages)
-        context_aggregator = llm.create_context_aggregator(context)
+        context = OpenAILLMContext(messages, tools=get_tools())
+        context_aggregator = create_context_aggregator(llm, context)
+        # Backend tools; a turn's calls run concurrently, with a filler phrase if slow
+        register_function_handlers(llm)
+        # Unread messages and pending calls, fetched while the pipeline starts
+        state_task = asyncio.create_task(inject_user_state(context, RESIDENT_USER_ID))
+        # Keeps the prompt to the system prompt + rolling summary + recent turns
+        context_window = ContextWindowManager()
 
         # Create pipeline (context-aware)
         pipeline = Pipeline([
             transport.input(),
             stt,
             context_aggregator.user(),
+            context_window,
+            IntentFastPath(),  # obvious send/call requests skip the LLM
             llm,
+            context_window.latency_meter(),
+            BackendEventAnnouncer(context, RESIDENT_USER_ID),  # new messages / incoming calls
             tts,
             transport.output(),
             context_aggregator.assistant(),
@@ -267,15 +346,29 @@ Be warm, friendly, and respectful at all times."""
     task = PipelineTask(
         pipeline,
         params = PipelineParams(
-                system_prompt= system_prompt
+                system_prompt= SYSTEM_PROMPT,
+                enable_metrics=True,
         ),
-        observers=[]
+        observers=[latency_tracker]
     )
+    latency_tracker.attach(task)
+    logger.info(f"Agent ready in {(time.perf_counter() - profile.started) * 1000:.0f}ms")
 
     # Start the agent
     runner = PipelineRunner()
-    await runner.run(task)
+    try:
+        await runner.run(task)
+    finally:
+        if HAS_OPENAI_CTX and not state_task.done():
+            state_task.cancel()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Elderly voice agent (Daily transport)")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="build every component, print import/init time per component and exit",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(profile_startup=args.profile_startup))
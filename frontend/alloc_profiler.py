@@ -0,0 +1,123 @@
+"""
+Allocation and GC profiling for voice sessions
+
+Enabled with ALLOC_PROFILE=1. When on, tracemalloc runs for the whole
+process and every session records:
+- the top allocation sites that grew between session start and end
+- traced memory at start/end and the peak while it ran
+- garbage collections per generation and the time spent in them
+
+tracemalloc is process-wide, so with several concurrent sessions the
+numbers describe the process while that session was running rather than
+that session alone. Run one session at a time for clean attribution.
+"""
+
+import gc
+import os
+import time
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+class AllocationProfiler:
+    """Per-session tracemalloc snapshots plus GC pause accounting"""
+
+    def __init__(self, enabled: bool = False, top: int = 10, frames: int = 5, keep: int = 20):
+        self.enabled = enabled
+        self.top = top
+        self.frames = frames
+        self.reports = deque(maxlen=keep)
+
+        self._gc_started: Optional[float] = None
+        self.gc_pause_total = 0.0
+        self.gc_pauses = 0
+        self._recent_pauses = deque(maxlen=10000)  # (ended_at, seconds)
+
+        if enabled:
+            self.start()
+
+    @classmethod
+    def from_env(cls) -> "AllocationProfiler":
+        val = os.getenv("ALLOC_PROFILE", "").strip().lower()
+        return cls(
+            enabled=val in {"1", "true", "yes", "y"},
+            top=int(os.getenv("ALLOC_PROFILE_TOP", "10")),
+        )
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+        logger.info("Allocation profiling enabled")
+
+    def _on_gc(self, phase: str, info: Dict):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            pause = time.perf_counter() - self._gc_started
+            self._gc_started = None
+            self.gc_pauses += 1
+            self.gc_pause_total += pause
+            self._recent_pauses.append((time.perf_counter(), pause))
+
+    @asynccontextmanager
+    async def session(self, session_id: str):
+        """Profile the enclosed block; a no-op when profiling is disabled."""
+        if not self.enabled:
+            yield None
+            return
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        traced_start, _ = tracemalloc.get_traced_memory()
+        collections_start = [s["collections"] for s in gc.get_stats()]
+        pauses_start = (self.gc_pauses, self.gc_pause_total)
+        started = time.perf_counter()
+
+        try:
+            yield self
+        finally:
+            duration = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            traced_end, traced_peak = tracemalloc.get_traced_memory()
+            collections = [s["collections"] - c for s, c in zip(gc.get_stats(), collections_start)]
+
+            report = {
+                'session_id': session_id,
+                'duration_s': round(duration, 2),
+                'traced_start_kb': traced_start // 1024,
+                'traced_end_kb': traced_end // 1024,
+                'traced_peak_kb': traced_peak // 1024,
+                'gc_collections': collections,
+                'gc_collections_per_min': round(sum(collections) / max(duration, 1e-9) * 60, 1),
+                'gc_pauses': self.gc_pauses - pauses_start[0],
+                'gc_pause_ms': round((self.gc_pause_total - pauses_start[1]) * 1000, 2),
+                'gc_pause_max_ms': round(max(
+                    (p for t, p in self._recent_pauses if t >= started), default=0.0) * 1000, 2),
+                'top_growth': self._top_growth(before, after),
+            }
+            self.reports.append(report)
+            logger.info(
+                f"Session {session_id} alloc profile: peak={report['traced_peak_kb']}KB "
+                f"gc={collections} pause={report['gc_pause_ms']}ms"
+            )
+
+    def _top_growth(self, before, after) -> List[Dict]:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        return [
+            {
+                'site': str(stat.traceback[0]),
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'count_diff': stat.count_diff,
+            }
+            for stat in stats[:self.top]
+        ]
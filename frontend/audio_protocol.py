@@ -0,0 +1,335 @@
+"""
+WebSocket framing for the /ws voice endpoint
+
+Two wire formats are supported and picked per connection at accept time:
+
+- ``json.v1`` (default, text messages): the original format. Audio travels
+  as base64 inside JSON, e.g. ``{"audio": "<base64 pcm16>"}``; plain text or
+  ``{"text": ...}`` becomes a TextFrame.
+- ``pcm16.v1`` (binary messages): every message starts with an 8 byte
+  header followed by the payload. Audio payloads are raw little-endian PCM16;
+  control payloads are UTF-8 JSON, used for anything that is not audio.
+- ``opus.v1`` (binary messages, needs opuslib + libopus): same envelope, but
+  length. Inbound packets are decoded to PCM16 before VAD/STT and TTS output
+  is encoded in 20 ms packets, cutting bandwidth from ~256 kbps to
+  OPUS_BITRATE (24 kbps by default) each way. The last partial packet of a
+  reply is padded with silence and sent when TTS stops (put
+  ``EndOfSpeechFlush`` just before ``transport.output()``), and dropped on
+  an interruption.
+
+Header layout (network byte order)::
+
+    version  u8   PROTOCOL_VERSION
+    kind     u8   KIND_CONTROL | KIND_PCM16 | KIND_OPUS
+    seq      u16  per-direction counter, wraps
+    rate     u32  sample rate in Hz (0 for control messages)
+
+Clients ask for a format with the WebSocket subprotocol header
+(``Sec-WebSocket-Protocol: pcm16.v1``) or, where the client library cannot
+set it, with ``?protocol=pcm16.v1`` on the URL.
+"""
+
+import base64
+import json
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InputAudioRawFrame,
+    InputTransportMessageFrame,
+    InterruptionFrame,
+    OutputAudioRawFrame,
+    OutputTransportMessageFrame,
+    OutputTransportMessageUrgentFrame,
+    StartFrame,
+    TextFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.serializers.base_serializer import FrameSerializer, FrameSerializerType
+
+try:
+    import opuslib  # type: ignore
+except Exception:  # missing package or missing libopus
+    opuslib = None  # type: ignore
+
+PROTOCOL_JSON = "json.v1"
+PROTOCOL_PCM16 = "pcm16.v1"
+PROTOCOL_OPUS = "opus.v1"
+
+# Preference order when a client offers several
+SUPPORTED_PROTOCOLS = ((PROTOCOL_OPUS,) if opuslib else ()) + (PROTOCOL_PCM16, PROTOCOL_JSON)
+
+PROTOCOL_VERSION = 1
+KIND_CONTROL = 0
+KIND_PCM16 = 1
+KIND_OPUS = 2
+
+HEADER = struct.Struct("!BBHI")
+PACKET_LENGTH = struct.Struct("!H")
+
+OPUS_FRAME_MS = 20
+OPUS_BITRATE = int(os.getenv("OPUS_BITRATE", "24000"))
+
+
+def pack_message(kind: int, seq: int, sample_rate: int, payload: bytes) -> bytes:
+    """Prefix a payload with the binary protocol header."""
+    return HEADER.pack(PROTOCOL_VERSION, kind, seq & 0xFFFF, sample_rate) + payload
+
+
+def unpack_header(data: bytes) -> Tuple[int, int, int, int]:
+    """Return (version, kind, seq, sample_rate) without copying the payload."""
+    if len(data) < HEADER.size:
+        raise ValueError(f"message shorter than {HEADER.size} byte header")
+    return HEADER.unpack_from(data)
+
+
+def pack_packets(packets: List[bytes]) -> bytes:
+    """Join Opus packets as u16 length-prefixed records."""
+    return b"".join(PACKET_LENGTH.pack(len(p)) + p for p in packets)
+
+
+def unpack_packets(data: bytes, offset: int = 0) -> List[bytes]:
+    """Split u16 length-prefixed records starting at ``offset``."""
+    view = memoryview(data)
+    packets = []
+    while offset + PACKET_LENGTH.size <= len(view):
+        (length,) = PACKET_LENGTH.unpack_from(view, offset)
+        offset += PACKET_LENGTH.size
+        packets.append(view[offset:offset + length].tobytes())
+        offset += length
+    return packets
+
+
+def negotiate_protocol(websocket) -> Tuple[str, Optional[str]]:
+    """Pick the wire format for a connection.
+
+    Returns (protocol, subprotocol) where subprotocol is what should be echoed
+    back in ``websocket.accept(subprotocol=...)`` (None if the client did not
+    offer one).
+    """
+    offered = list(websocket.scope.get("subprotocols") or [])
+    for proto in SUPPORTED_PROTOCOLS:
+        if proto in offered:
+            return proto, proto
+
+    requested = websocket.query_params.get("protocol")
+    if requested in SUPPORTED_PROTOCOLS:
+        return requested, None
+
+    return PROTOCOL_JSON, None
+
+
+def create_serializer(protocol: str) -> FrameSerializer:
+    if protocol == PROTOCOL_OPUS:
+        return OpusAudioSerializer()
+    if protocol == PROTOCOL_PCM16:
+        return BinaryAudioSerializer()
+    return JsonAudioSerializer()
+
+
+def _control_frame(message) -> Optional[Frame]:
+    """Map a decoded control message onto a pipeline frame."""
+    if isinstance(message, dict) and "text" in message:
+        return TextFrame(str(message["text"]))
+    return InputTransportMessageFrame(message=message)
+
+
+def _decode_control(payload: str | bytes) -> Optional[Frame]:
+    """Parse a JSON control payload; a malformed one is logged and dropped."""
+    try:
+        message = json.loads(payload)
+    except ValueError as e:
+        logger.warning(f"Dropping malformed control message: {e}")
+        return None
+    return _control_frame(message)
+
+
+class AudioFlushFrame(OutputTransportMessageFrame):
+    """End of a reply's audio: serializers send whatever audio they hold back.
+
+    A transport message frame, so the output transport hands it to the
+    serializer in order, after the audio queued before it. Nothing is sent
+    to the client for it when nothing is buffered.
+    """
+
+    def __init__(self):
+        super().__init__(message=None)
+
+
+class EndOfSpeechFlush(FrameProcessor):
+    """Follows every TTSStoppedFrame with an AudioFlushFrame"""
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+        if isinstance(frame, TTSStoppedFrame) and direction == FrameDirection.DOWNSTREAM:
+            await self.push_frame(AudioFlushFrame())
+
+
+class JsonAudioSerializer(FrameSerializer):
+    """Text framing: base64 audio inside JSON (the original RN client format)"""
+
+    def __init__(self):
+        self._sample_rate = 16000
+
+    @property
+    def type(self) -> FrameSerializerType:
+        return FrameSerializerType.TEXT
+
+    async def setup(self, frame: StartFrame):
+        self._sample_rate = frame.audio_in_sample_rate
+
+    async def serialize(self, frame: Frame) -> str | bytes | None:
+        if isinstance(frame, OutputAudioRawFrame):
+            return json.dumps({
+                "audio": base64.b64encode(frame.audio).decode("ascii"),
+                "sample_rate": frame.sample_rate,
+            })
+        if isinstance(frame, AudioFlushFrame):
+            return None
+        if isinstance(frame, (OutputTransportMessageFrame, OutputTransportMessageUrgentFrame)):
+            return json.dumps(frame.message)
+        return None
+
+    async def deserialize(self, data: str | bytes) -> Frame | None:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            text = data.decode("utf-8", "replace") if isinstance(data, bytes) else data
+            return TextFrame(text)
+
+        if isinstance(message, dict) and "audio" in message:
+            try:
+                audio = base64.b64decode(message["audio"])
+                sample_rate = int(message.get("sample_rate", self._sample_rate))
+            except (ValueError, TypeError, OverflowError) as e:  # binascii.Error is a ValueError
+                logger.warning(f"Dropping malformed audio message: {e}")
+                return None
+            return InputAudioRawFrame(audio=audio, sample_rate=sample_rate, num_channels=1)
+        return _control_frame(message)
+
+
+class BinaryAudioSerializer(FrameSerializer):
+    """Binary framing: header + raw PCM16, JSON only for control messages"""
+
+    def __init__(self):
+        self._sample_rate = 16000
+        self._seq = 0
+
+    @property
+    def type(self) -> FrameSerializerType:
+        return FrameSerializerType.BINARY
+
+    async def setup(self, frame: StartFrame):
+        self._sample_rate = frame.audio_in_sample_rate
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    async def serialize(self, frame: Frame) -> str | bytes | None:
+        if isinstance(frame, OutputAudioRawFrame):
+            return pack_message(KIND_PCM16, self._next_seq(), frame.sample_rate, frame.audio)
+        if isinstance(frame, AudioFlushFrame):
+            return None
+        if isinstance(frame, (OutputTransportMessageFrame, OutputTransportMessageUrgentFrame)):
+            body = json.dumps(frame.message).encode("utf-8")
+            return pack_message(KIND_CONTROL, self._next_seq(), 0, body)
+        return None
+
+    async def deserialize(self, data: str | bytes) -> Frame | None:
+        if isinstance(data, str):
+            return _decode_control(data)
+
+        try:
+            version, kind, _seq, sample_rate = unpack_header(data)
+        except ValueError as e:
+            logger.warning(f"Dropping malformed message: {e}")
+            return None
+
+        if version != PROTOCOL_VERSION:
+            logger.warning(f"Dropping message with unsupported protocol version {version}")
+            return None
+
+        if kind == KIND_PCM16:
+            return InputAudioRawFrame(
+                audio=data[HEADER.size:],
+                sample_rate=sample_rate or self._sample_rate,
+                num_channels=1,
+            )
+        if kind == KIND_CONTROL:
+            return _decode_control(data[HEADER.size:])
+
+        logger.warning(f"Dropping message of unknown kind {kind}")
+        return None
+
+
+class OpusAudioSerializer(BinaryAudioSerializer):
+    """Binary framing with Opus-compressed audio in both directions"""
+
+    def __init__(self, bitrate: int = OPUS_BITRATE):
+        super().__init__()
+        if opuslib is None:
+            raise RuntimeError("opus.v1 requires the opuslib package and libopus")
+        self._bitrate = bitrate
+        self._encoder = None
+        self._decoder = None
+        self._out_rate = 16000
+        self._pending = bytearray()
+
+    async def setup(self, frame: StartFrame):
+        await super().setup(frame)
+        self._out_rate = frame.audio_out_sample_rate
+        self._encoder = opuslib.Encoder(self._out_rate, 1, opuslib.APPLICATION_VOIP)
+        self._encoder.bitrate = self._bitrate
+        self._decoder = opuslib.Decoder(self._sample_rate, 1)
+
+    async def serialize(self, frame: Frame) -> str | bytes | None:
+        if isinstance(frame, (InterruptionFrame, CancelFrame)):
+            # The rest of the interrupted reply must not lead the next one
+            self._pending.clear()
+            return await super().serialize(frame)
+        if isinstance(frame, (AudioFlushFrame, EndFrame)):
+            return self._encode(flush=True)
+        if not isinstance(frame, OutputAudioRawFrame):
+            return await super().serialize(frame)
+
+        # Opus needs whole frames; carry any remainder into the next chunk
+        self._pending += frame.audio
+        return self._encode()
+
+    def _encode(self, flush: bool = False) -> bytes | None:
+        samples = self._out_rate * OPUS_FRAME_MS // 1000
+        step = samples * 2
+        if flush and self._pending:
+            # Pad the tail with silence to a whole frame
+            self._pending += bytes(-len(self._pending) % step)
+        packets = []
+        while len(self._pending) >= step:
+            packets.append(self._encoder.encode(bytes(self._pending[:step]), samples))
+            del self._pending[:step]
+        if not packets:
+            return None
+        return pack_message(KIND_OPUS, self._next_seq(), self._out_rate, pack_packets(packets))
+
+    async def deserialize(self, data: str | bytes) -> Frame | None:
+        if isinstance(data, str) or len(data) < HEADER.size or data[1] != KIND_OPUS:
+            return await super().deserialize(data)
+
+        max_samples = self._sample_rate * 120 // 1000
+        try:
+            pcm = b"".join(
+                self._decoder.decode(packet, max_samples) for packet in unpack_packets(data, HEADER.size)
+            )
+        except opuslib.OpusError as e:
+            logger.warning(f"Dropping undecodable Opus message: {e}")
+            return None
+        if not pcm:
+            return None
+        return InputAudioRawFrame(audio=pcm, sample_rate=self._sample_rate, num_channels=1)
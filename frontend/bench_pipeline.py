@@ -0,0 +1,451 @@
+"""
+Offline benchmark for the /ws voice pipeline (twilio.py)
+
+Starts the FastAPI app in-process on a local port with the mock STT/LLM/TTS
+providers (mock_services.py) and talks to it like the mobile client would:
+one WebSocket per session, 20 ms PCM16 chunks at 16 kHz, a short
+utterance, then silence until the bot has finished answering, a pause,
+then the next utterance. Nothing leaves the machine: provider API keys are
+removed from the environment and the backend URL points at a closed local
+port.
+
+Per run it reports:
+- per-stage queueing: time each frame spends inside each processor, from
+  being pushed to it until it pushes the frame on (pipeline clock)
+- end-to-end turn latency, server side (user stopped speaking -> bot started
+  speaking) and client side (last utterance chunk sent -> first bot audio)
+- provider TTFB as the mocks reported it
+- CPU seconds per session and per simulated minute (the in-process client
+  is included)
+- RSS over the run and its growth per simulated hour
+- with ALLOC_PROFILE=1, the allocation profiler's report for each session
+
+"Simulated" time is the audio the client has sent. --speed sends the
+resident's side (the pause before speaking and the utterance) faster than
+real time. Provider latency and the bot's replies still take real time, and
+the silence sent while waiting for a reply is paced to match, so how far an
+hour compresses depends mostly on --think-s and --tts-ms-per-char.
+
+Usage:
+  python bench_pipeline.py                                # 1 session, 1 simulated hour
+  python bench_pipeline.py --sessions 8 --sim-minutes 10 --out bench.json
+  python bench_pipeline.py --pcm hello.wav --vad silero   # recorded speech, real VAD
+  python bench_pipeline.py --distribution lognormal --llm-ms 600 --jitter-ms 300
+
+Without --pcm a 1.2 s tone burst stands in for speech; it needs the energy
+VAD (the default here), since Silero won't take a tone for a voice.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import websockets
+from loguru import logger
+
+from audio_protocol import (
+    HEADER,
+    KIND_OPUS,
+    OPUS_BITRATE,
+    OPUS_FRAME_MS,
+    PROTOCOL_JSON,
+    PROTOCOL_OPUS,
+    PROTOCOL_PCM16,
+    SUPPORTED_PROTOCOLS,
+    opuslib,
+    unpack_packets,
+)
+from loadgen import CHUNK_BYTES, CHUNK_MS, SAMPLE_RATE, encode_chunk, load_pcm
+from session_manager import _current_rss_bytes
+
+# Keys whose presence would let some component call out to a hosted service
+SECRET_ENV = (
+    "PERPLEXITY_API_KEY", "OPENAI_API_KEY", "DEEPGRAM_API_KEY", "CARTESIA_API_KEY", "DAILY_API_KEY",
+)
+
+
+def synthetic_utterance(seconds: float = 1.2) -> bytes:
+    """A loud 220 Hz tone: speech as far as the energy VAD is concerned"""
+    tone = load_pcm(None)  # 2 s tone + 1 s silence
+    return tone[: int(SAMPLE_RATE * seconds) * 2]
+
+
+def percentiles(samples: List[float]) -> Dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return round(ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class Reservoir:
+    """Uniform sample of at most ``size`` values, so hour-long runs stay bounded"""
+
+    def __init__(self, size: int = 2000, seed: int = 0):
+        self.size = size
+        self.count = 0
+        self.values: List[float] = []
+        self._rng = random.Random(seed)
+
+    def add(self, value: float):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            i = self._rng.randrange(self.count)
+            if i < self.size:
+                self.values[i] = value
+
+
+# ---------------- Server side ---------------- #
+
+def _stage(processor) -> str:
+    # "MockSTTService#3" -> "MockSTTService"; sessions are aggregated per stage
+    return processor.name.split("#", 1)[0]
+
+
+def make_stage_observer(results: "BenchResults"):
+    from pipecat.frames.frames import (
+        BotStartedSpeakingFrame,
+        MetricsFrame,
+        UserStoppedSpeakingFrame,
+    )
+    from pipecat.metrics.metrics import TTFBMetricsData
+    from pipecat.observers.base_observer import BaseObserver, FramePushed
+
+    class StageObserver(BaseObserver):
+        """Frame dwell time per processor, turn latency and TTFB for one session"""
+
+        def __init__(self):
+            super().__init__()
+            self._arrivals: Dict[tuple, int] = {}  # (frame id, processor id) -> ns
+            self._seen = set()
+            self._user_stopped: Optional[int] = None
+
+        async def on_push_frame(self, data: FramePushed):
+            frame, ts = data.frame, data.timestamp
+
+            arrived = self._arrivals.pop((frame.id, data.source.id), None)
+            if arrived is not None:
+                results.dwell(_stage(data.source), (ts - arrived) / 1e6)
+            self._arrivals[(frame.id, data.destination.id)] = ts
+            if len(self._arrivals) > 20000:
+                # Frames a processor consumed never leave it; drop the oldest entries
+                for key in list(self._arrivals)[:5000]:
+                    del self._arrivals[key]
+
+            # Turn boundaries travel both ways; count each frame once
+            if isinstance(frame, (UserStoppedSpeakingFrame, BotStartedSpeakingFrame)):
+                if frame.id in self._seen:
+                    return
+                self._seen.add(frame.id)
+                if isinstance(frame, UserStoppedSpeakingFrame):
+                    self._user_stopped = ts
+                elif self._user_stopped is not None:
+                    results.server_turns.append((ts - self._user_stopped) / 1e6)
+                    self._user_stopped = None
+            elif isinstance(frame, MetricsFrame) and frame.id not in self._seen:
+                self._seen.add(frame.id)
+                for metric in frame.data:
+                    if isinstance(metric, TTFBMetricsData) and metric.value:
+                        results.ttfb.setdefault(metric.processor.split("#", 1)[0], []).append(metric.value * 1000)
+
+    return StageObserver()
+
+
+class BenchResults:
+    def __init__(self):
+        self.stages: Dict[str, Reservoir] = {}
+        self.server_turns: List[float] = []
+        self.client_turns: List[float] = []
+        self.ttfb: Dict[str, List[float]] = {}
+        self.memory: List[Dict] = []
+        self.sessions: List[Dict] = []
+
+    def dwell(self, stage: str, ms: float):
+        reservoir = self.stages.get(stage)
+        if reservoir is None:
+            reservoir = self.stages[stage] = Reservoir()
+        reservoir.add(ms)
+
+
+# ---------------- Client side ---------------- #
+
+def bot_audio_bytes(message, protocol: str) -> int:
+    if protocol == PROTOCOL_JSON:
+        try:
+            return len(base64.b64decode(json.loads(message).get("audio", "")))
+        except (ValueError, AttributeError):
+            return 0
+    if protocol == PROTOCOL_PCM16 and isinstance(message, bytes):
+        return max(len(message) - HEADER.size, 0)
+    if protocol == PROTOCOL_OPUS and isinstance(message, bytes) and len(message) > HEADER.size and message[1] == KIND_OPUS:
+        # PCM16 bytes the packets decode to; the server sends whole OPUS_FRAME_MS packets
+        return len(unpack_packets(message, HEADER.size)) * SAMPLE_RATE * OPUS_FRAME_MS // 1000 * 2
+    return 0
+
+
+async def run_conversation(index: int, url: str, utterance: bytes, args, results: BenchResults):
+    silence = b"\x00" * CHUNK_BYTES
+    real_time = CHUNK_MS / 1000
+    chunk_wall = real_time / args.speed
+    think_chunks = int(args.think_s * 1000 / CHUNK_MS)
+    target_chunks = int(args.sim_minutes * 60 * 1000 / CHUNK_MS)
+    stats = {
+        "session": index, "turns": 0, "unanswered": 0, "sent_s": 0.0, "bot_audio_s": 0.0,
+        "wire_bytes_sent": 0, "wire_bytes_received": 0, "error": None,
+    }
+    results.sessions.append(stats)
+    encoder = None
+    if args.protocol == PROTOCOL_OPUS:
+        encoder = opuslib.Encoder(SAMPLE_RATE, 1, opuslib.APPLICATION_VOIP)
+        encoder.bitrate = OPUS_BITRATE
+
+    last_received = 0.0
+    utterance_ended: Optional[float] = None
+    seq = 0
+    sent = 0
+
+    async def send(ws, chunk: bytes, interval: float):
+        nonlocal seq, sent, next_send
+        seq += 1
+        sent += 1
+        stats["sent_s"] = sent * CHUNK_MS / 1000
+        message = encode_chunk(chunk, args.protocol, seq, encoder)
+        stats["wire_bytes_sent"] += len(message)
+        await ws.send(message)
+        next_send = max(next_send + interval, time.perf_counter() - interval)
+        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=30, subprotocols=[args.protocol]) as ws:
+
+            async def receiver():
+                nonlocal last_received, utterance_ended
+                async for message in ws:
+                    stats["wire_bytes_received"] += len(message)
+                    audio = bot_audio_bytes(message, args.protocol)
+                    if not audio:
+                        continue
+                    now = time.perf_counter()
+                    if utterance_ended is not None:
+                        results.client_turns.append((now - utterance_ended) * 1000)
+                        utterance_ended = None
+                    last_received = now
+                    stats["bot_audio_s"] += audio / (SAMPLE_RATE * 2)
+
+            recv_task = asyncio.create_task(receiver())
+            next_send = time.perf_counter()
+            started = next_send
+            while sent < target_chunks and not recv_task.done():
+                # Keep the microphone open with silence until the bot has been quiet a while
+                # (the first time round that is the greeting, or a few seconds without one)
+                while not recv_task.done():
+                    now = time.perf_counter()
+                    if utterance_ended is not None and now - utterance_ended > args.answer_timeout:
+                        stats["unanswered"] += 1
+                        utterance_ended = None
+                    quiet_since = now - (last_received or started)
+                    if utterance_ended is None and quiet_since >= args.turn_gap and (last_received or quiet_since > 5):
+                        break
+                    # The reply is produced and played in real time; so is the silence while it is
+                    await send(ws, silence, real_time)
+
+                # The resident's pause before speaking, and the speaking, go at --speed
+                for _ in range(think_chunks):
+                    await send(ws, silence, chunk_wall)
+                for offset in range(0, len(utterance) - CHUNK_BYTES + 1, CHUNK_BYTES):
+                    await send(ws, utterance[offset:offset + CHUNK_BYTES], chunk_wall)
+                utterance_ended = time.perf_counter()
+                stats["turns"] += 1
+
+            recv_task.cancel()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        stats["error"] = f"{e.__class__.__name__}: {e}"
+
+    stats["sent_s"] = round(sent * CHUNK_MS / 1000, 1)
+    stats["bot_audio_s"] = round(stats["bot_audio_s"], 1)
+
+
+async def sample_memory(results: BenchResults, every: float, started: float):
+    while True:
+        sim_s = sum(s.get("sent_s", 0) for s in results.sessions)
+        results.memory.append({
+            "wall_s": round(time.perf_counter() - started, 1),
+            "rss_mb": round(_current_rss_bytes() / 1e6, 1),
+            "server_turns": len(results.server_turns),
+            "sim_s": round(sim_s, 1),
+        })
+        await asyncio.sleep(every)
+
+
+# ---------------- Runner ---------------- #
+
+def configure_environment(args):
+    os.environ.update({
+        "STT_PROVIDER": "mock", "LLM_PROVIDER": "mock", "TTS_PROVIDER": "mock",
+        "STT_FALLBACK_PROVIDER": "", "LLM_FALLBACK_PROVIDER": "", "TTS_FALLBACK_PROVIDER": "",
+        "MOCK_STT_TTFB_MS": str(args.stt_ms),
+        "MOCK_LLM_TTFB_MS": str(args.llm_ms),
+        "MOCK_TTS_TTFB_MS": str(args.tts_ms),
+        "MOCK_JITTER_MS": str(args.jitter_ms),
+        "MOCK_LATENCY_DISTRIBUTION": args.distribution,
+        "MOCK_SEED": str(args.seed),
+        "MOCK_TTS_MS_PER_CHAR": str(args.tts_ms_per_char),
+        "VAD_ANALYZER": args.vad,
+        # Discard port: session bootstrap and backend tools fail fast, locally
+        "BACKEND_URL": "http://127.0.0.1:9",
+        "STATE_WAIT": "0",
+    })
+    for key in SECRET_ENV:
+        os.environ.pop(key, None)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run(args) -> Dict:
+    configure_environment(args)
+    import uvicorn
+
+    import twilio
+
+    # twilio.py loads .env with override=True; take the keys back out
+    configure_environment(args)
+
+    results = BenchResults()
+    twilio.session_observer_factories.append(lambda: make_stage_observer(results))
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(twilio.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    utterance = load_pcm(args.pcm) if args.pcm else synthetic_utterance()
+    url = f"ws://127.0.0.1:{port}/ws"
+
+    started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    rss_started = _current_rss_bytes()
+    sampler = asyncio.create_task(sample_memory(results, args.sample_every, started))
+    await asyncio.gather(*(run_conversation(i, url, utterance, args, results) for i in range(args.sessions)))
+    sampler.cancel()
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_started
+    rss_ended = _current_rss_bytes()
+
+    server.should_exit = True
+    await server_task
+
+    sim_s = sum(s["sent_s"] for s in results.sessions)
+    # Growth after the first sample, when every session is set up
+    warm = next((m["rss_mb"] for m in results.memory if m["server_turns"] > 0), rss_started / 1e6)
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "sim_minutes": args.sim_minutes,
+            "speed": args.speed,
+            "protocol": args.protocol,
+            "vad": args.vad,
+            "input": args.pcm or "synthetic tone",
+            "mock_ms": {"stt": args.stt_ms, "llm": args.llm_ms, "tts": args.tts_ms, "jitter": args.jitter_ms},
+            "distribution": args.distribution,
+            "seed": args.seed,
+        },
+        "wall_s": round(elapsed, 1),
+        "simulated_s": round(sim_s, 1),
+        "turns": sum(s["turns"] for s in results.sessions),
+        "unanswered_turns": sum(s["unanswered"] for s in results.sessions),
+        "turn_latency_ms": {
+            "server": percentiles(results.server_turns),
+            "client": percentiles(results.client_turns),
+        },
+        "stage_dwell_ms": {
+            stage: {**percentiles(r.values), "frames": r.count}
+            for stage, r in sorted(results.stages.items(), key=lambda item: -sum(item[1].values))
+        },
+        "ttfb_ms": {name: percentiles(values) for name, values in results.ttfb.items()},
+        "cpu": {
+            "total_s": round(cpu, 2),
+            "per_session_s": round(cpu / max(args.sessions, 1), 2),
+            "per_sim_minute_s": round(cpu / max(sim_s / 60, 1e-9), 3),
+            "cores_busy": round(cpu / max(elapsed, 1e-9), 2),
+        },
+        "memory": {
+            "rss_start_mb": round(rss_started / 1e6, 1),
+            "rss_end_mb": round(rss_ended / 1e6, 1),
+            "growth_mb_per_sim_hour": round((rss_ended / 1e6 - warm) / max(sim_s / 3600, 1e-9), 1),
+            "samples": results.memory,
+        },
+        "sessions": sorted(results.sessions, key=lambda s: s["session"]),
+        # Per-session tracemalloc / GC reports, with ALLOC_PROFILE=1
+        "alloc_profile": list(twilio.allocation_profiler.reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the /ws voice pipeline with mock providers")
+    parser.add_argument("--pcm", help="recorded utterance, 16 kHz mono PCM16 (.raw or .wav)")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--sim-minutes", type=float, default=60, help="simulated conversation length per session")
+    parser.add_argument("--speed", type=float, default=20, help="how much faster than real time the client sends audio")
+    parser.add_argument("--turn-gap", type=float, default=0.4, help="seconds of bot silence before the next utterance")
+    parser.add_argument("--think-s", type=float, default=5, help="simulated pause before each utterance")
+    parser.add_argument("--answer-timeout", type=float, default=10, help="seconds to wait for a reply to an utterance")
+    parser.add_argument("--protocol", choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON)
+    parser.add_argument("--vad", choices=("energy", "silero"), default="energy")
+    parser.add_argument("--stt-ms", type=float, default=150)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    parser.add_argument("--tts-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--distribution", choices=("uniform", "normal", "lognormal"), default="uniform")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tts-ms-per-char", type=float, default=10, help="length of the mock TTS audio")
+    parser.add_argument("--sample-every", type=float, default=10, help="seconds between RSS samples")
+    parser.add_argument("--log-level", default="WARNING", help="pipeline log level (DEBUG logs every frame)")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    report = asyncio.run(run(args))
+    print(json.dumps({k: v for k, v in report.items() if k != "memory"} | {
+        "memory": {k: v for k, v in report["memory"].items() if k != "samples"}
+    }, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
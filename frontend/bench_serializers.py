@@ -0,0 +1,93 @@
+"""
+Serializer benchmark: JSON/base64 vs binary PCM16 vs Opus framing
+
+Round-trips synthetic 16 kHz PCM16 frames through each serializer in
+audio_protocol.py and reports bytes on the wire, throughput and CPU time
+per frame in both directions. Opus is included when opuslib is installed;
+its frames are decoded lossy, so only lengths are checked for it.
+
+Usage:
+  python bench_serializers.py --frames 20000 --frame-ms 20
+  python bench_serializers.py --out serializers.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from pipecat.frames.frames import OutputAudioRawFrame, StartFrame
+
+from audio_protocol import PROTOCOL_OPUS, SUPPORTED_PROTOCOLS, create_serializer
+
+SAMPLE_RATE = 16000
+
+
+async def bench(protocol: str, frames: int, frame_ms: int) -> dict:
+    serializer = create_serializer(protocol)
+    await serializer.setup(StartFrame(audio_in_sample_rate=SAMPLE_RATE, audio_out_sample_rate=SAMPLE_RATE))
+
+    pcm = os.urandom(SAMPLE_RATE * 2 * frame_ms // 1000)
+    out_frame = OutputAudioRawFrame(audio=pcm, sample_rate=SAMPLE_RATE, num_channels=1)
+
+    # Downlink: frames the server sends
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(frames):
+        payload = await serializer.serialize(out_frame)
+    encode_cpu, encode_wall = time.process_time() - cpu, time.perf_counter() - wall
+    wire_bytes = len(payload)
+
+    # Uplink: the same payload shape arriving from a client
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(frames):
+        frame = await serializer.deserialize(payload)
+    decode_cpu, decode_wall = time.process_time() - cpu, time.perf_counter() - wall
+    if protocol == PROTOCOL_OPUS:
+        assert len(frame.audio) == len(pcm)
+    else:
+        assert bytes(frame.audio) == pcm
+
+    audio_seconds = frames * frame_ms / 1000
+    return {
+        'protocol': protocol,
+        'frames': frames,
+        'frame_ms': frame_ms,
+        'pcm_bytes_per_frame': len(pcm),
+        'wire_bytes_per_frame': wire_bytes,
+        'overhead_pct': round((wire_bytes / len(pcm) - 1) * 100, 1),
+        'wire_kbps': round(wire_bytes * 8 / (frame_ms / 1000) / 1000, 1),
+        'encode_us_per_frame': round(encode_cpu / frames * 1e6, 2),
+        'decode_us_per_frame': round(decode_cpu / frames * 1e6, 2),
+        'encode_frames_per_s': round(frames / max(encode_wall, 1e-9)),
+        'decode_frames_per_s': round(frames / max(decode_wall, 1e-9)),
+        # How many real-time streams one core could frame in both directions
+        'streams_per_core': round(audio_seconds / max(encode_cpu + decode_cpu, 1e-9)),
+    }
+
+
+async def run(args) -> list:
+    return [await bench(p, args.frames, args.frame_ms) for p in reversed(SUPPORTED_PROTOCOLS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare WebSocket audio serializers")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for r in results:
+        print(
+            f"{r['protocol']:>9}: {r['wire_bytes_per_frame']} B/frame ({r['overhead_pct']}% overhead, "
+            f"{r['wire_kbps']} kbps)  encode {r['encode_us_per_frame']} us  "
+            f"decode {r['decode_us_per_frame']} us  ~{r['streams_per_core']} streams/core"
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
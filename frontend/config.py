@@ -15,6 +15,7 @@ class Config:
     DAILY_API_KEY = os.getenv('DAILY_API_KEY', '')
     DEEPGRAM_API_KEY = os.getenv('DEEPGRAM_API_KEY', '')
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+    PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY', '')
     CARTESIA_API_KEY = os.getenv('CARTESIA_API_KEY', '')
 
     # Backend URL
@@ -27,6 +28,39 @@ class Config:
     AGENT_VOICE_ID = os.getenv('AGENT_VOICE_ID', 'a0e99841-438c-4a64-b679-ae501e7d6091')
     AGENT_LANGUAGE = os.getenv('AGENT_LANGUAGE', 'en')
 
-    # LLM settings
-    LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4')
+    # Providers per stage (see service_factory.PROVIDERS); the fallback is
+    # switched to when the primary's p95 time to first byte gets too slow
+    STT_PROVIDER = os.getenv('STT_PROVIDER', 'deepgram')
+    STT_FALLBACK_PROVIDER = os.getenv('STT_FALLBACK_PROVIDER', '')
+    LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'perplexity')
+    LLM_FALLBACK_PROVIDER = os.getenv('LLM_FALLBACK_PROVIDER', '')
+    TTS_PROVIDER = os.getenv('TTS_PROVIDER', 'deepgram')
+    TTS_FALLBACK_PROVIDER = os.getenv('TTS_FALLBACK_PROVIDER', '')
+
+    # LLM settings (empty model = the provider's default)
+    LLM_MODEL = os.getenv('LLM_MODEL', '')
     LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.7'))
+
+    # STT/TTS settings
+    STT_MODEL = os.getenv('STT_MODEL', 'nova-2')
+    DEEPGRAM_VOICE = os.getenv('DEEPGRAM_VOICE', 'aura-2-andromeda-en')
+
+    # Failover: p95 TTFB (ms) over the last FAILOVER_WINDOW responses
+    STT_MAX_P95_MS = float(os.getenv('STT_MAX_P95_MS', '1000'))
+    LLM_MAX_P95_MS = float(os.getenv('LLM_MAX_P95_MS', '2500'))
+    TTS_MAX_P95_MS = float(os.getenv('TTS_MAX_P95_MS', '1000'))
+    FAILOVER_WINDOW = int(os.getenv('FAILOVER_WINDOW', '20'))
+    FAILOVER_MIN_SAMPLES = int(os.getenv('FAILOVER_MIN_SAMPLES', '5'))
+    FAILOVER_MAX_ERRORS = int(os.getenv('FAILOVER_MAX_ERRORS', '3'))
+    # Seconds on the fallback before the primary gets another chance
+    FAILOVER_COOLDOWN = float(os.getenv('FAILOVER_COOLDOWN', '300'))
+
+    # Mock providers (offline testing)
+    MOCK_STT_TTFB_MS = float(os.getenv('MOCK_STT_TTFB_MS', '150'))
+    MOCK_LLM_TTFB_MS = float(os.getenv('MOCK_LLM_TTFB_MS', '400'))
+    MOCK_TTS_TTFB_MS = float(os.getenv('MOCK_TTS_TTFB_MS', '200'))
+    MOCK_JITTER_MS = float(os.getenv('MOCK_JITTER_MS', '50'))
+    # uniform (ttfb ± jitter), normal (jitter = std dev) or lognormal (ttfb = median, long tail)
+    MOCK_LATENCY_DISTRIBUTION = os.getenv('MOCK_LATENCY_DISTRIBUTION', 'uniform')
+    MOCK_SEED = int(os.getenv('MOCK_SEED')) if os.getenv('MOCK_SEED') else None
+    MOCK_TTS_MS_PER_CHAR = float(os.getenv('MOCK_TTS_MS_PER_CHAR', '60'))
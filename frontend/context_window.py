@@ -0,0 +1,236 @@
+"""
+Bounded LLM context for long-running conversations
+
+`OpenAILLMContext` keeps every turn forever, so a resident who chats all
+afternoon sends an ever-growing prompt to the LLM. `ContextWindowManager`
+sits between the user context aggregator and the LLM and, on every turn,
+keeps:
+
+  1. the leading system message(s) (SYSTEM_PROMPT and any injected state)
+  2. one rolling summary of everything older than the window
+  3. the most recent turns that fit in CONTEXT_MAX_TOKENS
+
+Turns that fall out of the window are removed from the shared context right
+away and folded into the summary by a background task, so the LLM call is
+never blocked on summarization. `latency_meter()` returns a companion
+processor to place after the LLM that reports time to first token.
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+from loguru import logger
+from pipecat.frames.frames import Frame, LLMFullResponseEndFrame, LLMTextFrame
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+def estimate_tokens(message: Dict) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    extra = sum(len(str(c.get("function", ""))) for c in message.get("tool_calls") or [])
+    return (len(content) + extra) // 4 + 4
+
+
+def _transcript(messages: List[Dict]) -> str:
+    lines = []
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str) and content and m.get("role") in ("user", "assistant"):
+            lines.append(f"{m['role']}: {content}")
+    return "\n".join(lines)
+
+
+async def extractive_summary(previous: str, dropped: List[Dict]) -> str:
+    """Fallback summarizer: keep what the user asked for, newest last, bounded."""
+    asks = [m["content"] for m in dropped if m.get("role") == "user" and isinstance(m.get("content"), str)]
+    summary = (previous + " " if previous else "") + " ".join(f"User said: {a}." for a in asks)
+    return summary[-1200:]
+
+
+def make_llm_summarizer(api_key: str, base_url: str, model: str) -> Summarizer:
+    """Summarize with any OpenAI-compatible chat completions endpoint."""
+
+    async def summarize(previous: str, dropped: List[Dict]) -> str:
+        prompt = (
+            "Update the running summary of a conversation between an elderly user and their "
+            "voice assistant. Keep names, pending requests, messages sent and calls made. "
+            "At most 120 words.\n\n"
+            f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{_transcript(dropped)}"
+        )
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{base_url.rstrip('/')}/chat/completions",
+                headers={"Authorization": f"Bearer {api_key}"},
+                json={"model": model, "messages": [{"role": "user", "content": prompt}]},
+                timeout=aiohttp.ClientTimeout(total=30),
+            ) as resp:
+                data = await resp.json()
+                if resp.status != 200:
+                    raise RuntimeError(f"summary request failed {resp.status}: {data}")
+                return data["choices"][0]["message"]["content"].strip()
+
+    return summarize
+
+
+def default_summarizer() -> Summarizer:
+    api_key = os.getenv("PERPLEXITY_API_KEY")
+    if not api_key:
+        return extractive_summary
+    return make_llm_summarizer(
+        api_key,
+        os.getenv("SUMMARY_API_URL", "https://api.perplexity.ai"),
+        os.getenv("SUMMARY_MODEL", "sonar"),
+    )
+
+
+class TurnStats:
+    """Prompt size and latency of the most recent turns"""
+
+    def __init__(self, keep: int = 50):
+        self.keep = keep
+        self.turns: List[Dict] = []
+        self._pending: Optional[Dict] = None
+
+    def start(self, prompt_tokens: int, messages: int, dropped: int):
+        self._pending = {
+            'prompt_tokens': prompt_tokens,
+            'messages': messages,
+            'dropped': dropped,
+            'started': time.perf_counter(),
+            'ttft_ms': None,
+        }
+
+    def first_token(self):
+        if self._pending and self._pending['ttft_ms'] is None:
+            self._pending['ttft_ms'] = round((time.perf_counter() - self._pending['started']) * 1000, 1)
+
+    def finish(self):
+        turn, self._pending = self._pending, None
+        if not turn:
+            return
+        turn['total_ms'] = round((time.perf_counter() - turn.pop('started')) * 1000, 1)
+        self.turns = (self.turns + [turn])[-self.keep:]
+        logger.info(
+            f"LLM turn: prompt≈{turn['prompt_tokens']} tokens / {turn['messages']} messages, "
+            f"ttft={turn['ttft_ms']}ms total={turn['total_ms']}ms"
+        )
+
+
+class ContextWindowManager(FrameProcessor):
+    """Trims the shared LLM context to system prompt + summary + recent turns"""
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        summarizer: Optional[Summarizer] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.max_tokens = max_tokens or int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+        self._summarizer = summarizer or default_summarizer()
+        self._summary = ""
+        self._backlog: List[Dict] = []
+        self._summary_task: Optional[asyncio.Task] = None
+        self.stats = TurnStats()
+
+    def latency_meter(self) -> "LLMLatencyMeter":
+        """Processor to place right after the LLM to time its responses."""
+        return LLMLatencyMeter(self.stats)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame) and direction == FrameDirection.DOWNSTREAM:
+            dropped = self._trim(frame.context)
+            messages = frame.context.messages
+            self.stats.start(sum(estimate_tokens(m) for m in messages), len(messages), dropped)
+
+        await self.push_frame(frame, direction)
+
+    def _trim(self, context) -> int:
+        messages = list(context.messages)
+
+        head = 0
+        while head < len(messages) and messages[head].get("role") == "system":
+            head += 1
+        system = [m for m in messages[:head] if not str(m.get("content", "")).startswith(SUMMARY_PREFIX)]
+        history = messages[head:]
+
+        # Walk back from the newest turn until the budget is spent
+        budget = self.max_tokens - sum(estimate_tokens(m) for m in system)
+        budget -= len(self._summary) // 4 + 4 if self._summary else 0
+        start = len(history)
+        used = 0
+        while start > 0 and used + estimate_tokens(history[start - 1]) <= budget:
+            start -= 1
+            used += estimate_tokens(history[start])
+
+        # Never start the window on an assistant reply or a tool result
+        while start < len(history) - 1 and history[start].get("role") != "user":
+            start += 1
+
+        # ...and always keep the latest user turn, however long it is
+        last_user = max((i for i, m in enumerate(history) if m.get("role") == "user"), default=start)
+        start = min(start, last_user)
+
+        dropped = history[:start]
+        if dropped:
+            self._backlog.extend(dropped)
+            self._schedule_summary()
+
+        summary = [{"role": "system", "content": SUMMARY_PREFIX + self._summary}] if self._summary else []
+        if dropped or summary != messages[len(system):head]:
+            context.set_messages(system + summary + history[start:])
+        return len(dropped)
+
+    def _schedule_summary(self):
+        if self._summary_task and not self._summary_task.done():
+            return  # the running task picks up the backlog when it finishes
+        self._summary_task = self.create_task(self._summarize_backlog())
+
+    async def _summarize_backlog(self):
+        while self._backlog:
+            batch, self._backlog = self._backlog, []
+            started = time.perf_counter()
+            try:
+                self._summary = await self._summarizer(self._summary, batch)
+            except Exception as e:
+                logger.warning(f"Context summary failed, keeping extractive summary: {e}")
+                self._summary = await extractive_summary(self._summary, batch)
+            logger.debug(
+                f"Folded {len(batch)} messages into summary in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+
+    async def cleanup(self):
+        await super().cleanup()
+        if self._summary_task:
+            await self.cancel_task(self._summary_task)
+            self._summary_task = None
+
+
+class LLMLatencyMeter(FrameProcessor):
+    """Records time to first token and total response time for each turn"""
+
+    def __init__(self, stats: TurnStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMTextFrame):
+            self._stats.first_token()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            self._stats.finish()
+
+        await self.push_frame(frame, direction)
@@ -0,0 +1,192 @@
+"""
+Daily meeting tokens, cached on disk
+
+Minting an owner token from the Daily REST API used to sit on every agent
+start. `DailyTokenCache` asks for tokens with an explicit expiry
+(DAILY_TOKEN_TTL, 24h by default), keeps them in a small JSON file
+(DAILY_TOKEN_CACHE) and hands the cached one out until it is within
+DAILY_TOKEN_REFRESH_MARGIN of expiring. A warm start therefore needs no
+Daily round trip at all, and `start_refresher` renews the token in the
+background so the next start stays warm.
+
+If the API is slow or down, a cached token that has not actually expired
+yet is still used rather than failing the start.
+
+DAILY_API_URL points the cache at another endpoint (e.g. a local fake
+serving POST /meeting-tokens) for testing.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+import aiohttp
+from loguru import logger
+
+DAILY_API_URL = os.getenv("DAILY_API_URL", "https://api.daily.co/v1").rstrip("/")
+DAILY_TOKEN_CACHE = os.path.expanduser(
+    os.getenv("DAILY_TOKEN_CACHE", "~/.cache/elder-voice/daily_tokens.json")
+)
+DAILY_TOKEN_TTL = int(os.getenv("DAILY_TOKEN_TTL", str(24 * 3600)))
+DAILY_TOKEN_REFRESH_MARGIN = int(os.getenv("DAILY_TOKEN_REFRESH_MARGIN", "600"))
+DAILY_TOKEN_TIMEOUT = float(os.getenv("DAILY_TOKEN_TIMEOUT", "5"))
+
+
+async def mint_daily_token(
+    room_name: str,
+    api_key: str,
+    ttl: int = DAILY_TOKEN_TTL,
+    api_url: str = DAILY_API_URL,
+    timeout: float = DAILY_TOKEN_TIMEOUT,
+) -> Dict:
+    """Create an owner token for room_name; returns {"token", "exp"}."""
+    exp = int(time.time()) + ttl
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "properties": {
+            "room_name": room_name,
+            "is_owner": True,
+            "exp": exp,
+        }
+    }
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{api_url}/meeting-tokens",
+            json=payload,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            data = await resp.json()
+            if resp.status != 200:
+                raise RuntimeError(f"Daily token error {resp.status}: {data}")
+            return {"token": data["token"], "exp": exp}
+
+
+class DailyTokenCache:
+    """Owner tokens per (API key, room), persisted with their expiry"""
+
+    def __init__(
+        self,
+        path: str = DAILY_TOKEN_CACHE,
+        ttl: int = DAILY_TOKEN_TTL,
+        margin: int = DAILY_TOKEN_REFRESH_MARGIN,
+        api_url: str = DAILY_API_URL,
+    ):
+        if margin >= ttl:
+            # Every token would be due for renewal as soon as it was minted
+            clamped = ttl // 2
+            logger.warning(
+                f"DAILY_TOKEN_REFRESH_MARGIN ({margin}s) is not below DAILY_TOKEN_TTL ({ttl}s); using {clamped}s"
+            )
+            margin = clamped
+        self.path = path
+        self.ttl = ttl
+        self.margin = margin
+        self.api_url = api_url
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = asyncio.Lock()
+        self._refreshers: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _key(room_name: str, api_key: str) -> str:
+        # Never write the API key itself to disk
+        return f"{hashlib.sha256(api_key.encode()).hexdigest()[:16]}:{room_name}"
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".daily_tokens")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist Daily tokens to {self.path}: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    async def get(self, room_name: str, api_key: str) -> str:
+        """A token for room_name, from the cache unless it is about to expire."""
+        if not room_name or not api_key:
+            raise ValueError("DAILY_ROOM_NAME or DAILY_API_KEY missing.")
+
+        key = self._key(room_name, api_key)
+        async with self._lock:
+            entry = self._load().get(key)
+            now = time.time()
+            if entry and entry["exp"] - now > self.margin:
+                return entry["token"]
+
+            try:
+                return await self._refresh(key, room_name, api_key)
+            except Exception as e:
+                if entry and entry["exp"] > now + 60:
+                    logger.warning(f"Daily token refresh failed, using cached token: {e}")
+                    return entry["token"]
+                raise
+
+    async def _refresh(self, key: str, room_name: str, api_key: str) -> str:
+        started = time.perf_counter()
+        entry = await mint_daily_token(room_name, api_key, self.ttl, self.api_url)
+        self._load()[key] = entry
+        self._save()
+        logger.info(f"Minted Daily token for {room_name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return entry["token"]
+
+    def start_refresher(self, room_name: str, api_key: str) -> asyncio.Task:
+        """Keep room_name's token renewed in the background (idempotent)."""
+        key = self._key(room_name, api_key)
+        task = self._refreshers.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh_loop(key, room_name, api_key))
+            self._refreshers[key] = task
+        return task
+
+    async def _refresh_loop(self, key: str, room_name: str, api_key: str):
+        while True:
+            entry = self._load().get(key)
+            delay = entry["exp"] - self.margin - time.time() if entry else 0
+            await asyncio.sleep(max(delay, 0))
+            try:
+                async with self._lock:
+                    # get() may have renewed it while this task waited for the lock
+                    entry = self._load().get(key)
+                    if entry and entry["exp"] - time.time() > self.margin:
+                        continue
+                    await self._refresh(key, room_name, api_key)
+            except Exception as e:
+                logger.warning(f"Background Daily token refresh failed: {e}")
+                await asyncio.sleep(60)
+
+    async def stop(self):
+        for task in self._refreshers.values():
+            task.cancel()
+        await asyncio.gather(*self._refreshers.values(), return_exceptions=True)
+        self._refreshers.clear()
+
+
+token_cache = DailyTokenCache()
+
+
+async def create_daily_token(room_name: str, api_key: str) -> str:
+    """Create a Daily meeting token for the given room (cached, see DailyTokenCache)."""
+    return await token_cache.get(room_name, api_key)
@@ -0,0 +1,167 @@
+"""
+Announce backend events (new messages, incoming calls) in a running session
+
+`BackendEventAnnouncer` listens for the resident's Socket.IO events through
+the shared `backend_events` client (see session_bootstrap.py) and speaks
+them as soon as the conversation allows:
+
+- nothing is said while the user is talking, the bot is talking or the LLM
+  is producing a reply; the announcement waits for the next quiet moment
+  (ANNOUNCE_GRACE seconds after it, 0.3 by default)
+- when the conversation is idle it is spoken right away, so a message is
+  announced well within a second of the backend emitting it
+- every event is also noted in the LLM context (including the call_id), so
+  "yes, answer it" can be acted on with the tools. Notes go into the leading
+  system message, the last ANNOUNCE_NOTES of them: sonar only takes system
+  messages at the start, followed by strict user/assistant alternation
+
+Place it after the LLM and before the TTS so the announcement goes through
+the normal TTS path and is cut off like any reply if the user barges in.
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InterruptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartFrame,
+    TTSSpeakFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from session_bootstrap import RESIDENT_USER_ID, backend_events, watch_user
+
+ANNOUNCE_GRACE = float(os.getenv("ANNOUNCE_GRACE", "0.3"))
+ANNOUNCE_NOTES = int(os.getenv("ANNOUNCE_NOTES", "10"))
+
+EVENTS_MARK = "\n\nAnnounced to the user in this session:\n"
+
+
+def describe_event(event: str, data: Dict) -> Optional[Dict[str, str]]:
+    """Return the spoken announcement and the context note for an event."""
+    sender = data.get("from") or "someone"
+    if event == "new_message":
+        return {
+            "speech": f"You have a new message from {sender}. They said: {data.get('message', '')}",
+            "note": f"New message from {sender} (message_id {data.get('message_id')}): "
+                    f"\"{data.get('message', '')}\". It has been read out to the user.",
+        }
+    if event == "incoming_call":
+        call_type = data.get("type", "voice")
+        return {
+            "speech": f"{sender} is calling you on {call_type}. Would you like to answer?",
+            "note": f"Incoming {call_type} call from {sender} (call_id {data.get('call_id')}). "
+                    f"The user was asked whether to answer; use respond_to_call with this call_id.",
+        }
+    return None
+
+
+def add_event_note(context, note: str, keep: int = ANNOUNCE_NOTES):
+    """Record ``note`` at the end of the leading system message, keeping the last ``keep`` notes."""
+    messages = list(context.messages)
+    if messages and messages[0].get("role") == "system":
+        prompt, _, section = str(messages[0].get("content", "")).partition(EVENTS_MARK)
+    else:
+        messages.insert(0, {"role": "system", "content": ""})
+        prompt, section = "", ""
+    notes = (section.splitlines() + [f"- {note}"])[-keep:]
+    messages[0] = {**messages[0], "content": prompt + EVENTS_MARK + "\n".join(notes)}
+    context.set_messages(messages)
+
+
+class BackendEventAnnouncer(FrameProcessor):
+    """Queues backend events and speaks them between turns"""
+
+    def __init__(self, context=None, user_id: str = RESIDENT_USER_ID, grace: float = ANNOUNCE_GRACE, **kwargs):
+        super().__init__(**kwargs)
+        self._context = context
+        self._user_id = user_id
+        self._grace = grace
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._user_speaking = False
+        self._bot_speaking = False
+        self._llm_responding = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self.announced = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            await self._start()
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._stop()
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            self._user_speaking = True
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._user_speaking = False
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_speaking = True
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_speaking = False
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._llm_responding = True
+        elif isinstance(frame, (LLMFullResponseEndFrame, InterruptionFrame)):
+            self._llm_responding = False
+        self._update_idle()
+
+        await self.push_frame(frame, direction)
+
+    def _update_idle(self):
+        if self._user_speaking or self._bot_speaking or self._llm_responding:
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    async def _start(self):
+        if self._task:
+            return
+        backend_events.add_listener(self._user_id, self._on_event)
+        watch_user(self._user_id)
+        self._task = self.create_task(self._announce_loop())
+
+    async def _stop(self):
+        backend_events.remove_listener(self._user_id, self._on_event)
+        if self._task:
+            await self.cancel_task(self._task)
+            self._task = None
+
+    async def _on_event(self, event: str, data: Dict):
+        item = describe_event(event, data)
+        if item:
+            logger.info(f"Queued {event} announcement for {self._user_id}")
+            await self._queue.put(item)
+
+    async def _announce_loop(self):
+        while True:
+            item = await self._queue.get()
+            if self._context is not None:
+                add_event_note(self._context, item["note"])
+
+            # Wait for a quiet moment that lasts at least the grace period
+            while True:
+                await self._idle.wait()
+                if self._grace > 0:
+                    await asyncio.sleep(self._grace)
+                if self._idle.is_set():
+                    break
+
+            await self.push_frame(TTSSpeakFrame(item["speech"]))
+            self.announced += 1
+
+    async def cleanup(self):
+        await super().cleanup()
+        await self._stop()
@@ -0,0 +1,160 @@
+"""
+Memoized LLM command extractions
+
+Residents repeat themselves ("call my daughter", "tell Tom goodnight"), and
+each repeat used to cost a full LLM round trip. `ExtractionCache` maps the
+normalized utterance to the command the LLM extracted for it:
+
+- entries expire after EXTRACTION_CACHE_TTL seconds (7 days by default) and
+  the least recently used are evicted beyond EXTRACTION_CACHE_SIZE
+- entries are persisted to a local SQLite file (EXTRACTION_CACHE_PATH), so
+  the cache survives restarts
+- keys are namespaced by the model and a hash of the system prompt; changing
+  either starts from an empty cache and old namespaces age out by TTL
+
+Only real commands are cached; failed extractions and "help" answers are
+asked again next time. ``stats()`` reports hits, misses and evictions.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+EXTRACTION_CACHE_PATH = os.path.expanduser(
+    os.getenv("EXTRACTION_CACHE_PATH", "~/.cache/elder-voice/extractions.sqlite")
+)
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "1000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    command TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+def normalize_utterance(text: str) -> str:
+    """Case, punctuation and spacing don't change what was asked."""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+def cache_namespace(model: str, system_prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{system_prompt}".encode()).hexdigest()[:16]
+
+
+class ExtractionCache:
+    """normalized utterance -> extracted command, LRU + TTL, backed by SQLite"""
+
+    def __init__(
+        self,
+        model: str,
+        system_prompt: str,
+        path: str = EXTRACTION_CACHE_PATH,
+        ttl: float = EXTRACTION_CACHE_TTL,
+        max_entries: int = EXTRACTION_CACHE_SIZE,
+    ):
+        self.namespace = cache_namespace(model, system_prompt)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()  # key -> (command, created)
+        self._lock = threading.Lock()
+        self._db = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(_SCHEMA)
+        # Expired rows from any namespace (old prompts and models included) go now
+        db.execute("DELETE FROM extractions WHERE created < ?", (time.time() - self.ttl,))
+        rows = db.execute(
+            "SELECT key, command, created FROM extractions WHERE namespace = ? ORDER BY last_used DESC LIMIT ?",
+            (self.namespace, self.max_entries),
+        ).fetchall()
+        for key, command, created in reversed(rows):
+            self._entries[key] = (json.loads(command), created)
+        return db
+
+    def get(self, text: str) -> Optional[Dict]:
+        key = normalize_utterance(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] > self.ttl:
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._db.execute(
+                "UPDATE extractions SET last_used = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+            )
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, text: str, command: Optional[Dict]):
+        if not command or command.get("action") in (None, "help"):
+            return
+        key = normalize_utterance(text)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (dict(command), now)
+            self._entries.move_to_end(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(command), now, now),
+            )
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _delete(self, key: str):
+        self._entries.pop(key, None)
+        self._db.execute("DELETE FROM extractions WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def extract(self, text: str, llm_extract: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+        """Cached command for ``text``, or ``llm_extract(text)`` remembered for next time."""
+        command = self.get(text)
+        if command is None:
+            command = llm_extract(text)
+            self.put(text, command)
+        return command
+
+    async def extract_async(self, text: str, llm_extract: Callable[[str], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        """`extract` for an async LLM extractor."""
+        command = self.get(text)
+        if command is None:
+            command = await llm_extract(text)
+            self.put(text, command)
+        return command
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
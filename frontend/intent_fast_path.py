@@ -0,0 +1,135 @@
+"""
+Pre-LLM fast path for the voice pipelines
+
+`IntentFastPath` sits between the user context aggregator (or the
+ContextWindowManager) and the LLM. For every user turn it runs the
+rule-based `IntentParser` (intent_parser.py) on the latest user message:
+
+- confident send_message / request_call: a confirmation question ("Send
+  'goodnight' to Tom?") is spoken with a TTSSpeakFrame and recorded in the
+  context as the assistant turn; the LLM is never called for that turn
+- the next user turn a plain yes: the backend tool runs (tools.run_tool) and
+  the outcome is spoken the same way
+- anything else, including any answer but yes to a confirmation question:
+  the context frame goes on to the LLM untouched
+
+Nothing is sent or dialled without that yes: speech-to-text mishears, and a
+message can't be taken back.
+
+Set INTENT_FAST_PATH=0 to pass every turn to the LLM. Stats are on
+``processor.parser.stats`` (hits, fallbacks, latency saved).
+"""
+
+import os
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import Frame, TTSSpeakFrame
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from intent_parser import IntentParser, tool_call_for
+from session_bootstrap import RESIDENT_USER_ID
+from tools import TOOL_TIMEOUT, run_tool
+
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "1").lower() not in ("0", "false", "no")
+
+_YES = re.compile(
+    r"^(?:(?:yes|yeah|yep|yup|sure|okay|ok|correct|right|that's right|please|go ahead|do it|"
+    r"send it|call (?:him|her|them))[\s,.!]*)+(?:please|thanks|thank you)?[\s.!]*$",
+    re.IGNORECASE,
+)
+
+
+def is_yes(text: str) -> bool:
+    """Whether a user turn is a plain yes to a confirmation question"""
+    return bool(_YES.match(text.strip()))
+
+
+def question_for(command: Dict) -> str:
+    """What to ask before carrying out a fast-path command."""
+    if command["action"] == "send_message":
+        return f"Send '{command['message']}' to {command['contact']}?"
+    return f"Start a {command['call_type']} call with {command['contact']}?"
+
+
+def confirmation_for(command: Dict, result: Dict) -> str:
+    """What to say once the backend has handled a fast-path command."""
+    contact = command["contact"]
+    if result.get("status") != "success":
+        if command["action"] == "send_message":
+            return f"Sorry, I couldn't send your message to {contact}. Please try again in a moment."
+        return f"Sorry, I couldn't reach {contact} right now. Please try again in a moment."
+    if command["action"] == "send_message":
+        return f"Okay, I've sent your message to {contact}."
+    return f"Okay, I'm starting a {command['call_type']} call with {contact} now."
+
+
+class IntentFastPath(FrameProcessor):
+    """Handles obvious send/call requests without an LLM round trip"""
+
+    def __init__(
+        self,
+        parser: Optional[IntentParser] = None,
+        enabled: bool = INTENT_FAST_PATH,
+        user_id: str = RESIDENT_USER_ID,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.parser = parser or IntentParser()
+        self.enabled = enabled
+        self.user_id = user_id
+        # (command, question) while the question is waiting for an answer
+        self._pending: Optional[Tuple[Dict, str]] = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if (
+            self.enabled
+            and isinstance(frame, OpenAILLMContextFrame)
+            and direction == FrameDirection.DOWNSTREAM
+            and await self._try_fast_path(frame.context)
+        ):
+            return
+
+        await self.push_frame(frame, direction)
+
+    async def _try_fast_path(self, context) -> bool:
+        messages = context.get_messages()
+        last = messages[-1] if messages else None
+        if not last or last.get("role") != "user" or not isinstance(last.get("content"), str):
+            return False
+
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            command, question = pending
+            asked = len(messages) > 1 and messages[-2].get("content") == question
+            if not asked or not is_yes(last["content"]):
+                # "No", "to Tim, not Tom", ...: the LLM sees the question and the answer
+                return False
+            started = time.perf_counter()
+            name, args = tool_call_for(command)
+            result = await run_tool(name, args, TOOL_TIMEOUT, self.user_id)
+            logger.info(f"Fast path: {name}({args}) in {(time.perf_counter() - started) * 1000:.0f}ms")
+            await self._say(context, confirmation_for(command, result))
+            return True
+
+        match = self.parser.parse(last["content"])
+        if not self.parser.confident(match):
+            # The LLM call itself isn't timed here; savings use INTENT_LLM_ESTIMATE_MS
+            self.parser.stats.record_llm(match.elapsed_us)
+            return False
+
+        self.parser.stats.record_fast(match.elapsed_us)
+        logger.info(f"Fast path: confirming {match.command} (parse {match.elapsed_us:.0f}us)")
+        question = question_for(match.command)
+        self._pending = (match.command, question)
+        await self._say(context, question)
+        return True
+
+    async def _say(self, context, reply: str):
+        context.add_message({"role": "assistant", "content": reply})
+        await self.push_frame(TTSSpeakFrame(reply))
@@ -0,0 +1,247 @@
+"""
+Rule-based fast path for command extraction
+
+Most requests are one of a handful of shapes ("call Sarah on video", "send
+a message to John saying hi", "text John saying hi", "tell my daughter
+goodnight", "let Emma know I'm home"). `IntentParser`
+matches those with precompiled patterns, resolves the contact against a
+`ContactDirectory` and returns the same command dict the LLM extractor
+produces, in microseconds. Only when it is not confident (no pattern, an
+unknown contact, a pronoun for a contact, a negation) does the caller fall
+back to the LLM.
+
+The directory comes from CONTACTS ("John, Sarah, Emma=my daughter|daughter")
+and/or CONTACTS_FILE (JSON: {"Emma": ["my daughter", "daughter"]}). With an
+empty directory any name is accepted, but below INTENT_MIN_CONFIDENCE: only
+contacts found in the directory are acted on without the LLM.
+
+`IntentStats` counts fast-path hits and LLM fallbacks and estimates the
+latency saved from the LLM calls actually observed (INTENT_LLM_ESTIMATE_MS
+until there is one). For the voice pipelines see intent_fast_path.py.
+"""
+
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.75"))
+INTENT_LLM_ESTIMATE_MS = float(os.getenv("INTENT_LLM_ESTIMATE_MS", "700"))
+
+CONFIDENT = 0.95  # pattern matched and the contact is in the directory
+UNVERIFIED = 0.6  # pattern matched, no directory to check the name against
+UNKNOWN_CONTACT = 0.4  # pattern matched but the name is not a known contact
+
+_POLITE = r"(?:(?:please|could you|can you|would you|will you|i want to|i'd like to|i would like to)\s+)*"
+_CONTACT = r"(?P<contact>(?:my\s+)?[\w'-]+(?:\s+[\w'-]+)??)"
+# "tell me a joke", "let us know", "send a message saying...": never a contact
+_NOT_CONTACTS = frozenset("i me myself us we him her them it you a an the".split())
+
+_SEND_PATTERNS = [
+    re.compile(
+        rf"^{_POLITE}(?:send|text|write)\s+(?:a\s+)?(?:message|text|note)?\s*to\s+{_CONTACT}\s*"
+        r"(?:,\s*|\s+)(?:saying|that says|and say|and tell (?:him|her|them)|that)\s+(?P<message>.+)$",
+        re.IGNORECASE,
+    ),
+    re.compile(
+        rf"^{_POLITE}(?:send|text|write)\s+{_CONTACT}\s+(?:a\s+)?(?:message|text|note)\s*"
+        r"(?:,\s*|\s+)(?:saying|that says|that)\s+(?P<message>.+)$",
+        re.IGNORECASE,
+    ),
+    re.compile(
+        rf"^{_POLITE}(?:send|text|message|write)\s+{_CONTACT}\s*(?:,\s*|\s+)(?:saying|that says)\s+(?P<message>.+)$",
+        re.IGNORECASE,
+    ),
+    re.compile(rf"^{_POLITE}tell\s+{_CONTACT}\s+(?:that\s+)?(?P<message>.+)$", re.IGNORECASE),
+    re.compile(rf"^{_POLITE}let\s+{_CONTACT}\s+know\s+(?:that\s+)?(?P<message>.+)$", re.IGNORECASE),
+]
+_CALL_PATTERNS = [
+    re.compile(
+        rf"^{_POLITE}(?:make\s+|start\s+|place\s+)?(?:an?\s+)?(?P<pre>video|voice)?\s*(?:call|ring|phone)\s+"
+        rf"(?:to\s+|with\s+)?{_CONTACT}(?:\s+(?:on|by|with|over|using)\s+(?:a\s+)?(?P<post>video|voice|phone))?"
+        r"(?:\s+call)?\s*(?:please|now)?$",
+        re.IGNORECASE,
+    ),
+    re.compile(rf"^{_POLITE}(?P<pre>video)\s+(?:chat\s+(?:with\s+)?)?{_CONTACT}\s*(?:please|now)?$", re.IGNORECASE),
+]
+_NEGATION = re.compile(r"\b(?:don'?t|do not|never|not|cancel|stop)\b", re.IGNORECASE)
+_TRAILING = re.compile(r"[\s.!?]+$")
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(re.sub(r"[^\w\s'-]", " ", name.lower()).split())
+
+
+class ContactDirectory:
+    """Known contacts and the phrases that refer to them"""
+
+    def __init__(self, contacts: Optional[Dict[str, Iterable[str]]] = None):
+        self._lookup: Dict[str, str] = {}
+        for name, aliases in (contacts or {}).items():
+            self.add(name, aliases)
+
+    def add(self, name: str, aliases: Iterable[str] = ()):
+        for phrase in [name, *aliases]:
+            key = normalize_name(phrase)
+            if key:
+                self._lookup[key] = name
+
+    def resolve(self, spoken: str) -> Optional[str]:
+        key = normalize_name(spoken)
+        return self._lookup.get(key) or self._lookup.get(key.removeprefix("my "))
+
+    def __len__(self) -> int:
+        return len(set(self._lookup.values()))
+
+    @classmethod
+    def from_env(cls) -> "ContactDirectory":
+        directory = cls()
+        path = os.getenv("CONTACTS_FILE")
+        if path:
+            with open(os.path.expanduser(path)) as f:
+                for name, aliases in json.load(f).items():
+                    directory.add(name, aliases)
+        for entry in filter(None, (e.strip() for e in os.getenv("CONTACTS", "").split(","))):
+            name, _, aliases = entry.partition("=")
+            directory.add(name.strip(), [a.strip() for a in aliases.split("|") if a.strip()])
+        return directory
+
+
+@dataclass
+class IntentMatch:
+    command: Optional[Dict]
+    confidence: float
+    elapsed_us: float
+
+
+class IntentStats:
+    """Fast-path hits vs LLM fallbacks and the latency that saved"""
+
+    def __init__(self, llm_estimate_ms: float = INTENT_LLM_ESTIMATE_MS):
+        self.llm_estimate_ms = llm_estimate_ms
+        self.fast_hits = 0
+        self.llm_fallbacks = 0
+        self.parse_us = 0.0
+        self.llm_ms = 0.0
+        self.llm_timed = 0
+
+    def record_fast(self, elapsed_us: float):
+        self.fast_hits += 1
+        self.parse_us += elapsed_us
+
+    def record_llm(self, elapsed_us: float, llm_ms: Optional[float] = None):
+        """A fallback to the LLM; ``llm_ms`` if the caller timed the LLM call."""
+        self.llm_fallbacks += 1
+        self.parse_us += elapsed_us
+        if llm_ms is not None:
+            self.llm_ms += llm_ms
+            self.llm_timed += 1
+
+    @property
+    def avg_llm_ms(self) -> float:
+        return self.llm_ms / self.llm_timed if self.llm_timed else self.llm_estimate_ms
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.fast_hits + self.llm_fallbacks
+        return self.fast_hits / total if total else 0.0
+
+    @property
+    def latency_saved_ms(self) -> float:
+        return self.fast_hits * self.avg_llm_ms - self.parse_us / 1000
+
+    def snapshot(self) -> Dict:
+        total = self.fast_hits + self.llm_fallbacks
+        return {
+            "fast_hits": self.fast_hits,
+            "llm_fallbacks": self.llm_fallbacks,
+            "hit_rate": round(self.hit_rate, 3),
+            "avg_parse_us": round(self.parse_us / total, 1) if total else 0.0,
+            "avg_llm_ms": round(self.avg_llm_ms, 1),
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+        }
+
+
+class IntentParser:
+    """Deterministic send_message / request_call extraction"""
+
+    def __init__(
+        self,
+        directory: Optional[ContactDirectory] = None,
+        min_confidence: float = INTENT_MIN_CONFIDENCE,
+        stats: Optional[IntentStats] = None,
+    ):
+        self.directory = directory if directory is not None else ContactDirectory.from_env()
+        self.min_confidence = min_confidence
+        self.stats = stats or IntentStats()
+
+    def _contact(self, spoken: str):
+        if normalize_name(spoken).split()[0] in _NOT_CONTACTS:
+            return None, 0.0
+        if not len(self.directory):
+            return spoken.strip(), UNVERIFIED
+        resolved = self.directory.resolve(spoken)
+        return (resolved, CONFIDENT) if resolved else (spoken.strip(), UNKNOWN_CONTACT)
+
+    def _match(self, text: str) -> Tuple[Optional[Dict], float]:
+        if _NEGATION.search(text):
+            return None, 0.0
+        for pattern in _CALL_PATTERNS:
+            m = pattern.match(text)
+            if m:
+                contact, confidence = self._contact(m["contact"])
+                if contact is None:
+                    return None, 0.0
+                kind = (m["pre"] or m["post"] or "voice").lower()
+                call_type = "video" if kind == "video" else "voice"
+                return {"action": "request_call", "contact": contact, "call_type": call_type}, confidence
+        for pattern in _SEND_PATTERNS:
+            m = pattern.match(text)
+            if m:
+                contact, confidence = self._contact(m["contact"])
+                if contact is None:
+                    return None, 0.0
+                return {"action": "send_message", "contact": contact, "message": m["message"].strip()}, confidence
+        return None, 0.0
+
+    def parse(self, text: str) -> IntentMatch:
+        """Best rule-based reading of ``text``; check ``confidence`` before trusting it."""
+        started = time.perf_counter()
+        command, confidence = self._match(_TRAILING.sub("", text.strip()))
+        return IntentMatch(command, confidence, (time.perf_counter() - started) * 1e6)
+
+    def confident(self, match: IntentMatch) -> bool:
+        return match.command is not None and match.confidence >= self.min_confidence
+
+    def extract(self, text: str, llm_extract: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+        """The fast-path command if confident, otherwise ``llm_extract(text)``."""
+        match = self.parse(text)
+        if self.confident(match):
+            self.stats.record_fast(match.elapsed_us)
+            return match.command
+        started = time.perf_counter()
+        try:
+            return llm_extract(text)
+        finally:
+            self.stats.record_llm(match.elapsed_us, (time.perf_counter() - started) * 1000)
+
+    async def extract_async(self, text: str, llm_extract: Callable[[str], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        """`extract` for an async LLM extractor."""
+        match = self.parse(text)
+        if self.confident(match):
+            self.stats.record_fast(match.elapsed_us)
+            return match.command
+        started = time.perf_counter()
+        try:
+            return await llm_extract(text)
+        finally:
+            self.stats.record_llm(match.elapsed_us, (time.perf_counter() - started) * 1000)
+
+
+def tool_call_for(command: Dict) -> Tuple[str, Dict]:
+    """Tool name and arguments (see tools.py) for a parsed command."""
+    if command["action"] == "send_message":
+        return "send_message", {"contact": command["contact"], "message": command["message"]}
+    return "request_call", {"contact": command["contact"], "call_type": command["call_type"]}
@@ -0,0 +1,206 @@
+"""
+Load generator for the /ws voice endpoint
+
+Replays a recorded 16 kHz mono PCM16 file over many parallel WebSocket
+connections at real-time pace and reports how many sessions the server
+sustained, per-session first-response latency and throughput.
+
+Usage:
+  python loadgen.py --pcm sample.raw --sessions 40 --ramp 10 --duration 60 --workers 4
+  python loadgen.py --url ws://voice-host:8765/ws --sessions 100 --out results.json
+  python loadgen.py --protocol pcm16.v1 --sessions 40
+
+Without --pcm, a synthetic tone is streamed instead.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import statistics
+import struct
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from audio_protocol import (
+    KIND_OPUS,
+    KIND_PCM16,
+    OPUS_BITRATE,
+    PROTOCOL_JSON,
+    PROTOCOL_OPUS,
+    PROTOCOL_PCM16,
+    SUPPORTED_PROTOCOLS,
+    opuslib,
+    pack_message,
+    pack_packets,
+)
+
+SAMPLE_RATE = 16000
+CHUNK_MS = 20
+CHUNK_BYTES = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+
+
+def load_pcm(path: Optional[str]) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            data = f.read()
+        if path.endswith(".wav"):
+            data = data[44:]  # canonical PCM header
+        return data
+
+    # Two seconds of a 220 Hz tone followed by one second of silence
+    tone = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)))
+        for i in range(SAMPLE_RATE * 2)
+    )
+    return tone + b"\x00\x00" * SAMPLE_RATE
+
+
+def encode_chunk(chunk: bytes, protocol: str, seq: int, encoder=None) -> str | bytes:
+    """Frame audio the way the negotiated serializer expects it."""
+    if protocol == PROTOCOL_OPUS:
+        packet = encoder.encode(chunk, len(chunk) // 2)
+        return pack_message(KIND_OPUS, seq, SAMPLE_RATE, pack_packets([packet]))
+    if protocol == PROTOCOL_PCM16:
+        return pack_message(KIND_PCM16, seq, SAMPLE_RATE, chunk)
+    return json.dumps({"audio": base64.b64encode(chunk).decode("ascii")})
+
+
+class SessionResult:
+    def __init__(self, index: int):
+        self.index = index
+        self.connected = False
+        self.connect_time: Optional[float] = None
+        self.first_response: Optional[float] = None
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.received_messages = 0
+        self.error: Optional[str] = None
+
+
+async def run_session(
+    index: int, url: str, pcm: bytes, duration: float, protocol: str, result: SessionResult
+):
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(
+            url, max_size=None, open_timeout=30, subprotocols=[protocol]
+        ) as ws:
+            result.connected = True
+            result.connect_time = time.perf_counter() - started
+            first_sent: Optional[float] = None
+
+            async def receiver():
+                async for message in ws:
+                    if result.first_response is None and first_sent is not None:
+                        result.first_response = time.perf_counter() - first_sent
+                    result.received_messages += 1
+                    result.received_bytes += len(message)
+
+            recv_task = asyncio.create_task(receiver())
+            deadline = time.perf_counter() + duration
+            offset = 0
+            seq = 0
+            encoder = None
+            if protocol == PROTOCOL_OPUS:
+                encoder = opuslib.Encoder(SAMPLE_RATE, 1, opuslib.APPLICATION_VOIP)
+                encoder.bitrate = OPUS_BITRATE
+            next_send = time.perf_counter()
+            while time.perf_counter() < deadline and not recv_task.done():
+                chunk = pcm[offset:offset + CHUNK_BYTES]
+                if len(chunk) < CHUNK_BYTES:
+                    offset = 0
+                    continue
+                offset += CHUNK_BYTES
+
+                seq += 1
+                payload = encode_chunk(chunk, protocol, seq, encoder)
+                await ws.send(payload)
+                if first_sent is None:
+                    first_sent = time.perf_counter()
+                result.sent_bytes += len(payload)
+
+                # Pace at real time so VAD and STT see a live stream
+                next_send += CHUNK_MS / 1000
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+            recv_task.cancel()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        result.error = f"{e.__class__.__name__}: {e}"
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def summarize(results: List[SessionResult], elapsed: float, workers: int, protocol: str) -> Dict:
+    ok = [r for r in results if r.connected and not r.error]
+    responded = [r for r in ok if r.first_response is not None]
+    first = [r.first_response for r in responded]
+    connect = [r.connect_time for r in ok if r.connect_time is not None]
+    return {
+        'protocol': protocol,
+        'sessions_requested': len(results),
+        'sessions_ok': len(ok),
+        'sessions_responded': len(responded),
+        'sessions_failed': len(results) - len(ok),
+        'sessions_per_core': round(len(responded) / max(1, workers), 2),
+        'elapsed_s': round(elapsed, 2),
+        'connect_p50_ms': round(statistics.median(connect) * 1000, 1) if connect else None,
+        'first_response_p50_ms': round(percentile(first, 50) * 1000, 1) if first else None,
+        'first_response_p95_ms': round(percentile(first, 95) * 1000, 1) if first else None,
+        'uplink_kbps': round(sum(r.sent_bytes for r in ok) * 8 / 1000 / max(elapsed, 1e-9) / max(1, len(ok)), 1),
+        'downlink_kbps': round(sum(r.received_bytes for r in ok) * 8 / 1000 / max(elapsed, 1e-9) / max(1, len(ok)), 1),
+        'errors': sorted({r.error for r in results if r.error})[:10],
+    }
+
+
+async def run(args) -> Dict:
+    pcm = load_pcm(args.pcm)
+    if len(pcm) < CHUNK_BYTES:
+        raise SystemExit("PCM input is shorter than one 20 ms chunk")
+    results = [SessionResult(i) for i in range(args.sessions)]
+    delay = args.ramp / args.sessions if args.sessions else 0
+
+    started = time.perf_counter()
+    tasks = []
+    for r in results:
+        tasks.append(asyncio.create_task(run_session(r.index, args.url, pcm, args.duration, args.protocol, r)))
+        if delay:
+            await asyncio.sleep(delay)
+    await asyncio.gather(*tasks)
+
+    return summarize(results, time.perf_counter() - started, args.workers, args.protocol)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay PCM over many parallel /ws connections")
+    parser.add_argument("--url", default=os.getenv("LOADGEN_URL", "ws://localhost:8765/ws"))
+    parser.add_argument("--pcm", help="16 kHz mono PCM16 file (.raw or .wav)")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which to open connections")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of audio per session")
+    parser.add_argument("--protocol", choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON)
+    parser.add_argument("--workers", type=int, default=1, help="server worker count, for sessions per core")
+    parser.add_argument("--out", help="write the JSON summary to this file")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
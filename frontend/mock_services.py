@@ -0,0 +1,224 @@
+"""
+Local mock STT/LLM/TTS providers
+
+Drop-in stand-ins for the hosted services so pipelines can run offline:
+no API keys, no network, deterministic output and a configurable time to
+first byte that shows up in Pipecat's TTFB metrics exactly like a real
+provider's would. The delay is drawn from a uniform, normal or lognormal
+distribution around ``ttfb_ms``; with a ``seed`` the sequence of delays
+(and failures) repeats exactly from run to run. Select them with
+STT_PROVIDER=mock, LLM_PROVIDER=mock or TTS_PROVIDER=mock (see
+service_factory.py).
+"""
+
+import asyncio
+import math
+import os
+import random
+import re
+from typing import AsyncGenerator, Optional
+
+from pipecat.frames.frames import (
+    ErrorFrame,
+    Frame,
+    LLMTextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.services.openai.llm import OpenAILLMService
+from pipecat.services.stt_service import SegmentedSTTService
+from pipecat.services.tts_service import TTSService
+from pipecat.utils.text.base_text_aggregator import BaseTextAggregator
+from pipecat.utils.time import time_now_iso8601
+
+
+DISTRIBUTIONS = ("uniform", "normal", "lognormal")
+
+
+class LatencyModel:
+    """Seconds to wait before the first byte"""
+
+    def __init__(self, ttfb_ms: float, jitter_ms: float = 0, distribution: str = "uniform", seed: Optional[int] = None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution!r}; expected one of {DISTRIBUTIONS}")
+        self.ttfb_ms = ttfb_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.distribution == "normal":
+            ms = self.rng.gauss(self.ttfb_ms, self.jitter_ms)
+        elif self.distribution == "lognormal" and self.ttfb_ms > 0:
+            # ttfb_ms is the median; jitter_ms sets the spread (sigma = jitter / ttfb)
+            ms = self.ttfb_ms * math.exp(self.rng.gauss(0, self.jitter_ms / self.ttfb_ms))
+        else:
+            ms = self.ttfb_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(ms, 0) / 1000
+
+    def fails(self, rate: float) -> bool:
+        return rate > 0 and self.rng.random() < rate
+
+
+class MockSTTService(SegmentedSTTService):
+    """Transcribes every VAD speech segment as ``text`` after ``ttfb_ms``"""
+
+    def __init__(
+        self,
+        ttfb_ms: float = 150,
+        jitter_ms: float = 0,
+        text: Optional[str] = None,
+        fail_rate: float = 0.0,
+        distribution: str = "uniform",
+        seed: Optional[int] = None,
+        **kwargs,
+    ):
+        # Accept (and ignore) provider-specific options such as audio_passthrough
+        # so the factory can pass the same overrides to any STT
+        super().__init__(**{k: v for k, v in kwargs.items() if k in ("sample_rate", "audio_passthrough")})
+        self.ttfb_ms = ttfb_ms
+        self.jitter_ms = jitter_ms
+        self.text = text or os.getenv("MOCK_STT_TEXT", "Do I have any new messages?")
+        self.fail_rate = fail_rate
+        self.latency = LatencyModel(ttfb_ms, jitter_ms, distribution, seed)
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def run_stt(self, audio: bytes) -> AsyncGenerator[Frame, None]:
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self.latency.sample())
+        await self.stop_ttfb_metrics()
+        if self.latency.fails(self.fail_rate):
+            yield ErrorFrame("mock STT failure")
+            return
+        yield TranscriptionFrame(self.text, "", time_now_iso8601())
+
+
+class MockLLMService(OpenAILLMService):
+    """Streams a canned reply that echoes the last user turn.
+
+    Built on OpenAILLMService so context aggregators, function registration
+    and switchers work exactly as with the real providers; only the
+    completion itself is replaced.
+    """
+
+    def __init__(
+        self,
+        ttfb_ms: float = 400,
+        jitter_ms: float = 0,
+        token_ms: float = 15,
+        fail_rate: float = 0.0,
+        distribution: str = "uniform",
+        seed: Optional[int] = None,
+        **kwargs,
+    ):
+        kwargs.setdefault("model", "mock")
+        super().__init__(api_key="mock", **kwargs)
+        self.ttfb_ms = ttfb_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.fail_rate = fail_rate
+        self.latency = LatencyModel(ttfb_ms, jitter_ms, distribution, seed)
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    @staticmethod
+    def reply_for(messages) -> str:
+        last = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+        if not isinstance(last, str) or not last:
+            return "Hello! How can I help you today?"
+        return f"You said: {last}. How else can I help?"
+
+    async def _process_context(self, context):
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self.latency.sample())
+        await self.stop_ttfb_metrics()
+        if self.latency.fails(self.fail_rate):
+            await self.push_error(ErrorFrame("mock LLM failure"))
+            return
+
+        messages = context.get_messages() if hasattr(context, "get_messages") else context.messages
+        for i, word in enumerate(self.reply_for(messages).split(" ")):
+            if i and self.token_ms:
+                await asyncio.sleep(self.token_ms / 1000)
+            await self.push_frame(LLMTextFrame(word if i == 0 else " " + word))
+
+
+class PunctuationTextAggregator(BaseTextAggregator):
+    """Sentence splitting on . ! ? without NLTK's punkt data (which needs a download)"""
+
+    _END = re.compile(r"[.!?]+(?=\s|$)")
+
+    def __init__(self):
+        self._text = ""
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def aggregate(self, text: str) -> Optional[str]:
+        self._text += text
+        match = None
+        for match in self._END.finditer(self._text):
+            pass
+        if match is None or match.end() == len(self._text):
+            # Wait for the next token: "Dr." or "3.5" may not be the end yet
+            return None
+        sentence, self._text = self._text[:match.end()], self._text[match.end():]
+        return sentence
+
+    async def handle_interruption(self):
+        self._text = ""
+
+    async def reset(self):
+        self._text = ""
+
+
+class MockTTSService(TTSService):
+    """Synthesizes silence: ~60 ms of audio per character, after ``ttfb_ms``"""
+
+    def __init__(
+        self,
+        ttfb_ms: float = 200,
+        jitter_ms: float = 0,
+        ms_per_char: float = 60,
+        chunk_ms: int = 20,
+        fail_rate: float = 0.0,
+        distribution: str = "uniform",
+        seed: Optional[int] = None,
+        **kwargs,
+    ):
+        super().__init__(
+            text_aggregator=PunctuationTextAggregator(),
+            **{k: v for k, v in kwargs.items() if k == "sample_rate"},
+        )
+        self.ttfb_ms = ttfb_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_char = ms_per_char
+        self.chunk_ms = chunk_ms
+        self.fail_rate = fail_rate
+        self.latency = LatencyModel(ttfb_ms, jitter_ms, distribution, seed)
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self.latency.sample())
+        if self.latency.fails(self.fail_rate):
+            await self.stop_ttfb_metrics()
+            yield ErrorFrame("mock TTS failure")
+            return
+
+        yield TTSStartedFrame()
+        chunk = b"\x00\x00" * (self.sample_rate * self.chunk_ms // 1000)
+        chunks = max(int(len(text) * self.ms_per_char // self.chunk_ms), 1)
+        for i in range(chunks):
+            if i == 0:
+                await self.stop_ttfb_metrics()
+            yield TTSAudioRawFrame(audio=chunk, sample_rate=self.sample_rate, num_channels=1)
+        yield TTSStoppedFrame()
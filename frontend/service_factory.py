@@ -0,0 +1,285 @@
+"""
+Config-driven STT/LLM/TTS construction with latency-based failover
+
+Each stage is built from `Config` (config.py): ``<STAGE>_PROVIDER`` picks the
+primary and ``<STAGE>_FALLBACK_PROVIDER`` an optional secondary. Providers
+are imported lazily, so only the configured SDKs are loaded.
+
+With a fallback configured the stage is a Pipecat ServiceSwitcher (an
+LLMSwitcher for the LLM) and `LatencyTracker`, a pipeline observer, watches
+the TTFB metrics and errors each service reports. When the active
+provider's p95 TTFB over the last FAILOVER_WINDOW responses exceeds
+``<STAGE>_MAX_P95_MS``, or it errors FAILOVER_MAX_ERRORS times in a row,
+the stage switches to the other provider. After FAILOVER_COOLDOWN seconds
+the primary is tried again. Metrics must be enabled on the PipelineTask
+(``enable_metrics=True``) for TTFB samples to exist.
+
+Usage::
+
+    tracker = LatencyTracker()
+    stt, llm, tts = create_services(tracker=tracker)
+    context_aggregator = create_context_aggregator(llm, context)
+    ...
+    task = PipelineTask(pipeline, params=PipelineParams(enable_metrics=True), observers=[tracker])
+    tracker.attach(task)
+"""
+
+import importlib
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import ErrorFrame, ManuallySwitchServiceFrame, MetricsFrame
+from pipecat.metrics.metrics import TTFBMetricsData
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+
+from config import Config
+
+STAGES = ("stt", "llm", "tts")
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    module: str
+    cls: str
+    options: Callable[[type], Dict]
+
+
+def _deepgram_stt_options(c) -> Dict:
+    # DeepgramSTTService reads model and language from LiveOptions only
+    from deepgram import LiveOptions
+
+    return {"api_key": c.DEEPGRAM_API_KEY, "live_options": LiveOptions(model=c.STT_MODEL, language=c.AGENT_LANGUAGE)}
+
+
+PROVIDERS: Dict[str, Dict[str, ProviderSpec]] = {
+    "stt": {
+        "deepgram": ProviderSpec("pipecat.services.deepgram.stt", "DeepgramSTTService", _deepgram_stt_options),
+        "mock": ProviderSpec(
+            "mock_services", "MockSTTService",
+            lambda c: {
+                "ttfb_ms": c.MOCK_STT_TTFB_MS, "jitter_ms": c.MOCK_JITTER_MS,
+                "distribution": c.MOCK_LATENCY_DISTRIBUTION, "seed": c.MOCK_SEED,
+            },
+        ),
+    },
+    "llm": {
+        "perplexity": ProviderSpec(
+            "pipecat.services.perplexity.llm", "PerplexityLLMService",
+            lambda c: {"api_key": c.PERPLEXITY_API_KEY, "model": c.LLM_MODEL or "sonar"},
+        ),
+        "openai": ProviderSpec(
+            "pipecat.services.openai.llm", "OpenAILLMService",
+            lambda c: {"api_key": c.OPENAI_API_KEY, "model": c.LLM_MODEL or "gpt-4o"},
+        ),
+        "mock": ProviderSpec(
+            "mock_services", "MockLLMService",
+            lambda c: {
+                "ttfb_ms": c.MOCK_LLM_TTFB_MS, "jitter_ms": c.MOCK_JITTER_MS,
+                "distribution": c.MOCK_LATENCY_DISTRIBUTION, "seed": c.MOCK_SEED,
+            },
+        ),
+    },
+    "tts": {
+        "deepgram": ProviderSpec(
+            "pipecat.services.deepgram.tts", "DeepgramTTSService",
+            lambda c: {"api_key": c.DEEPGRAM_API_KEY, "voice": c.DEEPGRAM_VOICE},
+        ),
+        "cartesia": ProviderSpec(
+            "pipecat.services.cartesia.tts", "CartesiaTTSService",
+            lambda c: {"api_key": c.CARTESIA_API_KEY, "voice_id": c.AGENT_VOICE_ID},
+        ),
+        "mock": ProviderSpec(
+            "mock_services", "MockTTSService",
+            lambda c: {
+                "ttfb_ms": c.MOCK_TTS_TTFB_MS, "jitter_ms": c.MOCK_JITTER_MS,
+                "distribution": c.MOCK_LATENCY_DISTRIBUTION, "seed": c.MOCK_SEED, "ms_per_char": c.MOCK_TTS_MS_PER_CHAR,
+            },
+        ),
+    },
+}
+
+
+def _spec(stage: str, provider: str) -> ProviderSpec:
+    try:
+        return PROVIDERS[stage][provider.lower()]
+    except KeyError:
+        choices = sorted(PROVIDERS.get(stage, {}))
+        raise ValueError(f"Unknown {stage} provider {provider!r}; expected one of {choices}") from None
+
+
+def _providers(stage: str, config) -> List[str]:
+    primary = getattr(config, f"{stage.upper()}_PROVIDER")
+    fallback = getattr(config, f"{stage.upper()}_FALLBACK_PROVIDER", "")
+    return [primary] + ([fallback] if fallback else [])
+
+
+def provider_classes(stage: str, config=Config) -> List[type]:
+    """Import the service classes configured for ``stage`` (and nothing else)."""
+    specs = [_spec(stage, p) for p in _providers(stage, config)]
+    return [getattr(importlib.import_module(s.module), s.cls) for s in specs]
+
+
+def create_service(stage: str, provider: str, config=Config, **overrides):
+    """Build one provider's service for ``stage``; ``overrides`` win over Config."""
+    spec = _spec(stage, provider)
+    service_cls = getattr(importlib.import_module(spec.module), spec.cls)
+    return service_cls(**{**spec.options(config), **overrides})
+
+
+def create_stage(stage: str, config=Config, tracker: Optional["LatencyTracker"] = None, **overrides):
+    """The service for ``stage``, wrapped in a switcher when a fallback is configured."""
+    services = [create_service(stage, p, config, **overrides) for p in _providers(stage, config)]
+    if len(services) == 1:
+        return services[0]
+
+    if stage == "llm":
+        from pipecat.pipeline.llm_switcher import LLMSwitcher as Switcher
+    else:
+        from pipecat.pipeline.service_switcher import ServiceSwitcher as Switcher
+    from pipecat.pipeline.service_switcher import ServiceSwitcherStrategyManual
+
+    switcher = Switcher(services, ServiceSwitcherStrategyManual)
+    if tracker is not None:
+        tracker.track(stage, services, getattr(config, f"{stage.upper()}_MAX_P95_MS"))
+    return switcher
+
+
+def create_services(
+    config=Config,
+    tracker: Optional["LatencyTracker"] = None,
+    stt_options: Optional[Dict] = None,
+    llm_options: Optional[Dict] = None,
+    tts_options: Optional[Dict] = None,
+):
+    """(stt, llm, tts) for a pipeline, all from Config."""
+    return (
+        create_stage("stt", config, tracker, **(stt_options or {})),
+        create_stage("llm", config, tracker, **(llm_options or {})),
+        create_stage("tts", config, tracker, **(tts_options or {})),
+    )
+
+
+def create_context_aggregator(llm, context):
+    """Context aggregators for ``llm``, which may be an LLMSwitcher.
+
+    Every provider here speaks the OpenAI message format, so the first
+    service's aggregators serve whichever one is active.
+    """
+    service = (getattr(llm, "llms", None) or [llm])[0]
+    return service.create_context_aggregator(context)
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class _StageHealth:
+    def __init__(self, services: List, max_p95_ms: float, window: int):
+        self.services = services
+        self.max_p95_ms = max_p95_ms
+        self.active = 0
+        self.switched_at = 0.0
+        self.ttfb: Dict[int, Deque[float]] = {i: deque(maxlen=window) for i in range(len(services))}
+        self.errors: Dict[int, int] = {i: 0 for i in range(len(services))}
+
+
+class LatencyTracker(BaseObserver):
+    """Per-provider TTFB/error tracking that drives ServiceSwitcher failover"""
+
+    def __init__(self, config=Config, **kwargs):
+        super().__init__(**kwargs)
+        self.window = config.FAILOVER_WINDOW
+        self.min_samples = config.FAILOVER_MIN_SAMPLES
+        self.max_errors = config.FAILOVER_MAX_ERRORS
+        self.cooldown = config.FAILOVER_COOLDOWN
+        self._stages: Dict[str, _StageHealth] = {}
+        self._by_name: Dict[str, Tuple[str, int]] = {}
+        self._task = None
+        self.switches: List[Dict] = []
+
+    def attach(self, task):
+        """The PipelineTask that switch frames are queued on."""
+        self._task = task
+
+    def track(self, stage: str, services: List, max_p95_ms: float):
+        self._stages[stage] = _StageHealth(services, max_p95_ms, self.window)
+        for index, service in enumerate(services):
+            self._by_name[service.name] = (stage, index)
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        # Only count a frame where it is produced, not at every hop it takes
+        source = self._by_name.get(getattr(data.source, "name", None))
+        if source is None:
+            return
+
+        if isinstance(frame, MetricsFrame):
+            for metric in frame.data:
+                if isinstance(metric, TTFBMetricsData) and metric.processor == data.source.name:
+                    await self.record(*source, ttfb_ms=metric.value * 1000)
+        elif isinstance(frame, ErrorFrame):
+            await self.record(*source, error=True)
+
+    async def record(self, stage: str, index: int, ttfb_ms: Optional[float] = None, error: bool = False):
+        health = self._stages[stage]
+        if error:
+            health.errors[index] += 1
+        else:
+            health.errors[index] = 0
+            health.ttfb[index].append(ttfb_ms)
+        await self._evaluate(stage, health)
+
+    async def _evaluate(self, stage: str, health: _StageHealth):
+        active = health.active
+        samples = health.ttfb[active]
+        p95 = percentile(samples, 95)
+
+        reason = None
+        if health.errors[active] >= self.max_errors:
+            reason = f"{health.errors[active]} consecutive errors"
+        elif len(samples) >= self.min_samples and p95 > health.max_p95_ms:
+            reason = f"p95 TTFB {p95:.0f}ms > {health.max_p95_ms:.0f}ms"
+        elif active != 0 and time.monotonic() - health.switched_at > self.cooldown:
+            reason = "cooldown over, retrying primary"
+
+        if reason:
+            target = 0 if active != 0 else 1
+            await self._switch(stage, health, target, reason)
+
+    async def _switch(self, stage: str, health: _StageHealth, target: int, reason: str):
+        if self._task is None:
+            return
+        old, new = health.services[health.active], health.services[target]
+        health.active = target
+        health.switched_at = time.monotonic()
+        # Start the new provider with a clean slate
+        health.ttfb[target].clear()
+        health.errors[target] = 0
+        self.switches.append({'stage': stage, 'from': old.name, 'to': new.name, 'reason': reason})
+        logger.warning(f"{stage}: switching {old.name} -> {new.name} ({reason})")
+        await self._task.queue_frame(ManuallySwitchServiceFrame(service=new))
+
+    def snapshot(self) -> Dict:
+        return {
+            stage: {
+                'active': health.services[health.active].name,
+                'providers': [
+                    {
+                        'name': service.name,
+                        'samples': len(health.ttfb[i]),
+                        'p50_ms': round(percentile(health.ttfb[i], 50), 1),
+                        'p95_ms': round(percentile(health.ttfb[i], 95), 1),
+                        'consecutive_errors': health.errors[i],
+                    }
+                    for i, service in enumerate(health.services)
+                ],
+            }
+            for stage, health in self._stages.items()
+        }
@@ -0,0 +1,259 @@
+"""
+Session bootstrap: what the resident has waiting when a voice session starts
+
+One backend call (GET /api/users/<user_id>/state) returns unread messages,
+pending calls and unread notifications. `inject_user_state` runs it in
+parallel with pipeline startup and adds the result to the LLM context as a
+system message, so "any messages for me?" is answered without a tool round
+trip.
+
+Results are cached per user for USER_STATE_TTL seconds (default 30). The
+cache is shared by every session in the process and, when python-socketio
+is installed, `BackendEventClient` subscribes to the backend's Socket.IO
+events and drops a user's entry as soon as a message or call arrives for
+them.
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from loguru import logger
+
+try:
+    import socketio  # type: ignore
+except ImportError:  # optional: the cache then only expires by TTL
+    socketio = None  # type: ignore
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+RESIDENT_USER_ID = os.getenv("RESIDENT_USER_ID", "user")
+USER_STATE_TTL = float(os.getenv("USER_STATE_TTL", "30"))
+USER_STATE_TIMEOUT = float(os.getenv("USER_STATE_TIMEOUT", "3"))
+
+STATE_PREFIX = "Current state for the user at the start of this conversation: "
+
+# Backend events that change what /state would return
+STATE_EVENTS = ("new_message", "incoming_call")
+
+EventListener = Callable[[str, Dict], Awaitable[None]]
+
+
+async def fetch_user_state(user_id: str, timeout: float = USER_STATE_TIMEOUT) -> Dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{BACKEND_URL}/api/users/{user_id}/state",
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            data = await resp.json()
+            if resp.status != 200:
+                raise RuntimeError(f"state request failed {resp.status}: {data}")
+            return data
+
+
+class UserStateCache:
+    """Per-user state with a short TTL; concurrent misses share one request"""
+
+    def __init__(self, ttl: float = USER_STATE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Dict]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Dict:
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(fetch_user_state(user_id))
+            self._inflight[user_id] = future
+            future.add_done_callback(lambda f, u=user_id: self._store(u, f))
+        return await asyncio.shield(future)
+
+    def _store(self, user_id: str, future: asyncio.Future):
+        if self._inflight.get(user_id) is future:
+            del self._inflight[user_id]
+            if not future.cancelled() and future.exception() is None:
+                self._entries[user_id] = (time.monotonic(), future.result())
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+        # A request already in flight may predate the event; don't cache its answer
+        self._inflight.pop(user_id, None)
+
+
+class BackendEventClient:
+    """Process-wide Socket.IO connection to the backend.
+
+    Subscribes to the events of every user a session has asked about and
+    fans them out to listeners. Without python-socketio it does nothing.
+    """
+
+    def __init__(self, url: str = BACKEND_URL):
+        self.url = url
+        self._client = None
+        self._connecting: Optional[asyncio.Task] = None
+        self._users: set = set()
+        self._listeners: Dict[str, List[EventListener]] = {}
+
+    @property
+    def available(self) -> bool:
+        return socketio is not None
+
+    def is_subscribed(self, user_id: str) -> bool:
+        return user_id in self._users and self._client is not None and self._client.connected
+
+    def add_listener(self, user_id: str, listener: EventListener):
+        self._listeners.setdefault(user_id, []).append(listener)
+
+    def remove_listener(self, user_id: str, listener: EventListener):
+        listeners = self._listeners.get(user_id, [])
+        if listener in listeners:
+            listeners.remove(listener)
+
+    async def subscribe(self, user_id: str):
+        if not self.available:
+            return
+        self._users.add(user_id)
+        try:
+            await self._ensure_connected()
+            await self._client.emit("subscribe", {"user_id": user_id})
+        except Exception as e:
+            logger.warning(f"Backend events unavailable for {user_id}: {e}")
+
+    async def _ensure_connected(self):
+        if self._client is not None and self._client.connected:
+            return
+        if self._connecting is None or self._connecting.done():
+            self._connecting = asyncio.ensure_future(self._connect())
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self):
+        http = aiohttp.ClientSession()
+        client = socketio.AsyncClient(reconnection=True, http_session=http)
+
+        @client.event
+        async def connect():
+            # Rooms are lost on reconnect; join them again
+            for user_id in self._users:
+                await client.emit("subscribe", {"user_id": user_id})
+
+        for event in STATE_EVENTS:
+            client.on(event, self._handler(event))
+
+        try:
+            await client.connect(self.url, transports=["websocket"])
+        except Exception:
+            await http.close()
+            raise
+        self._client = client
+
+    def _handler(self, event: str):
+        async def handle(data):
+            user_id = (data or {}).get("to")
+            # Older backends don't name the recipient; tell every subscribed user
+            targets = [user_id] if user_id else list(self._users)
+            for target in targets:
+                for listener in list(self._listeners.get(target, [])):
+                    try:
+                        await listener(event, data or {})
+                    except Exception as e:
+                        logger.warning(f"Backend event listener failed for {event}: {e}")
+        return handle
+
+
+user_state_cache = UserStateCache()
+backend_events = BackendEventClient()
+
+
+_watched: set = set()
+_background: set = set()
+
+
+def watch_user(user_id: str):
+    """Keep user_id's cache entry fresh from backend events.
+
+    Subscribing happens in the background so a slow or absent Socket.IO
+    server never delays the session; it is retried on the next call.
+    """
+    if user_id not in _watched:
+        _watched.add(user_id)
+
+        async def invalidate(event: str, data: Dict):
+            user_state_cache.invalidate(user_id)
+
+        backend_events.add_listener(user_id, invalidate)
+
+    if backend_events.available and not backend_events.is_subscribed(user_id):
+        task = asyncio.ensure_future(backend_events.subscribe(user_id))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+def format_user_state(state: Dict) -> str:
+    """Render the state as a short system message for the LLM."""
+    parts = []
+
+    messages = state.get("unread_messages") or []
+    if messages:
+        items = "; ".join(f"from {m.get('sender')}: \"{m.get('message')}\"" for m in messages[-10:])
+        parts.append(f"{len(messages)} unread message(s) ({items}).")
+    else:
+        parts.append("No unread messages.")
+
+    calls = state.get("pending_calls") or []
+    if calls:
+        items = "; ".join(
+            f"{c.get('type', 'voice')} call from {c.get('caller')} (call_id {c.get('id')})" for c in calls
+        )
+        parts.append(f"Waiting to be answered: {items}.")
+    else:
+        parts.append("No pending calls.")
+
+    notifications = state.get("notifications") or []
+    if notifications:
+        items = "; ".join(n.get("title") or n.get("message", "") for n in notifications[:5])
+        parts.append(f"{len(notifications)} unread notification(s): {items}.")
+
+    return STATE_PREFIX + " ".join(parts)
+
+
+async def load_user_state(user_id: str) -> Optional[Dict]:
+    """Cached state for user_id, or None if the backend can't be reached."""
+    watch_user(user_id)
+    try:
+        return await user_state_cache.get(user_id)
+    except Exception as e:
+        logger.warning(f"Could not load state for {user_id}: {e}")
+        return None
+
+
+async def inject_user_state(context, user_id: str = RESIDENT_USER_ID) -> bool:
+    """Add the user's state to ``context`` right after the system prompt.
+
+    Meant to run as a task alongside pipeline startup. Returns False (and
+    leaves the context alone) if the backend didn't answer.
+    """
+    started = time.perf_counter()
+    state = await load_user_state(user_id)
+    if state is None:
+        return False
+
+    messages = [m for m in context.messages if not str(m.get("content", "")).startswith(STATE_PREFIX)]
+    head = 0
+    while head < len(messages) and messages[head].get("role") == "system":
+        head += 1
+    messages.insert(head, {"role": "system", "content": format_user_state(state)})
+    context.set_messages(messages)
+
+    logger.info(
+        f"Loaded state for {user_id} in {(time.perf_counter() - started) * 1000:.0f}ms: "
+        f"{len(state.get('unread_messages') or [])} unread, {len(state.get('pending_calls') or [])} pending calls"
+    )
+    return True
@@ -0,0 +1,185 @@
+"""
+Session capacity management for the FastAPI voice bot server.
+
+Caps how many Pipecat pipelines run concurrently in one process, queues a
+bounded number of extra connections for a short while, and keeps rough
+per-session CPU and memory accounting so the live load is visible.
+"""
+
+import asyncio
+import itertools
+import os
+import resource
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from loguru import logger
+
+
+class CapacityError(Exception):
+    """Raised when a session cannot be admitted"""
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is a high-water mark (KiB on Linux), good enough as fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SessionStats:
+    """Resource accounting for a single voice session"""
+
+    def __init__(self, session_id: str, client: str = ""):
+        self.session_id = session_id
+        self.client = client
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cpu_seconds = 0.0
+        self.rss_start = 0
+        self.rss_peak = 0
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        return {
+            'session_id': self.session_id,
+            'client': self.client,
+            'queued_for': round((self.started_at or now) - self.queued_at, 3),
+            'running_for': round(now - self.started_at, 3) if self.started_at else 0.0,
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'rss_start_mb': round(self.rss_start / 2**20, 1),
+            'rss_peak_mb': round(self.rss_peak / 2**20, 1),
+        }
+
+
+class SessionManager:
+    """Admission control for concurrent voice pipelines.
+
+    Up to ``max_sessions`` pipelines run at once. Further connections wait in
+    a queue of at most ``max_queued`` entries for up to ``queue_timeout``
+    seconds; anything beyond that is rejected with :class:`CapacityError`.
+
+    CPU time is sampled for the whole process and split evenly across the
+    sessions that were running during each interval. All pipelines share one
+    event loop, so a finer attribution is not available without tracing.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 8,
+        max_queued: int = 16,
+        queue_timeout: float = 10.0,
+        sample_interval: float = 1.0,
+    ):
+        self.max_sessions = max_sessions
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.sample_interval = sample_interval
+
+        self._slots = asyncio.Semaphore(max_sessions)
+        self._ids = itertools.count(1)
+        self._active: Dict[str, SessionStats] = {}
+        self._queued: Dict[str, SessionStats] = {}
+        self._sampler: Optional[asyncio.Task] = None
+
+        # Lifetime counters
+        self.total_admitted = 0
+        self.total_rejected = 0
+        self.peak_active = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionManager":
+        """Build a manager from MAX_SESSIONS / MAX_QUEUED_SESSIONS / SESSION_QUEUE_TIMEOUT."""
+        return cls(
+            max_sessions=int(os.getenv("MAX_SESSIONS", "8")),
+            max_queued=int(os.getenv("MAX_QUEUED_SESSIONS", "16")),
+            queue_timeout=float(os.getenv("SESSION_QUEUE_TIMEOUT", "10")),
+        )
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._queued)
+
+    @asynccontextmanager
+    async def session(self, client: str = ""):
+        """Hold a pipeline slot for the duration of the ``async with`` block.
+
+        Raises CapacityError if the queue is full or the wait times out.
+        """
+        stats = SessionStats(f"s{next(self._ids)}", client)
+
+        if self._slots.locked():
+            if len(self._queued) >= self.max_queued:
+                self.total_rejected += 1
+                raise CapacityError("Session queue is full")
+
+            self._queued[stats.session_id] = stats
+            logger.info(f"Session {stats.session_id} queued ({self.queued_count} waiting)")
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.total_rejected += 1
+                raise CapacityError("Timed out waiting for a free session slot")
+            finally:
+                self._queued.pop(stats.session_id, None)
+        else:
+            await self._slots.acquire()
+
+        stats.started_at = time.monotonic()
+        stats.rss_start = stats.rss_peak = _current_rss_bytes()
+        self._active[stats.session_id] = stats
+        self.total_admitted += 1
+        self.peak_active = max(self.peak_active, self.active_count)
+        self._ensure_sampler()
+        logger.info(f"Session {stats.session_id} started ({self.active_count}/{self.max_sessions} active)")
+
+        try:
+            yield stats
+        finally:
+            self._active.pop(stats.session_id, None)
+            self._slots.release()
+            logger.info(
+                f"Session {stats.session_id} finished: cpu={stats.cpu_seconds:.2f}s "
+                f"rss_peak={stats.rss_peak / 2**20:.1f}MB"
+            )
+
+    def snapshot(self) -> Dict:
+        """Live session counts and per-session usage, suitable for JSON."""
+        return {
+            'active': self.active_count,
+            'queued': self.queued_count,
+            'max_sessions': self.max_sessions,
+            'max_queued': self.max_queued,
+            'peak_active': self.peak_active,
+            'total_admitted': self.total_admitted,
+            'total_rejected': self.total_rejected,
+            'rss_mb': round(_current_rss_bytes() / 2**20, 1),
+            'sessions': [s.to_dict() for s in self._active.values()],
+        }
+
+    def _ensure_sampler(self):
+        if self._sampler is None or self._sampler.done():
+            self._sampler = asyncio.create_task(self._sample_usage())
+
+    async def _sample_usage(self):
+        """Apportion process CPU time and track peak RSS while sessions run."""
+        last_cpu = time.process_time()
+        while self._active:
+            await asyncio.sleep(self.sample_interval)
+            cpu = time.process_time()
+            rss = _current_rss_bytes()
+            sessions = list(self._active.values())
+            if sessions:
+                share = (cpu - last_cpu) / len(sessions)
+                for stats in sessions:
+                    stats.cpu_seconds += share
+                    stats.rss_peak = max(stats.rss_peak, rss)
+            last_cpu = cpu
@@ -16,25 +16,55 @@ Usage:
   > call Sarah (voice)
   > make a video call to David
   > exit
+
+Replay mode (load test for the backend REST path):
+  python simulate_text.py --replay utterances.jsonl --concurrency 32
+  python simulate_text.py --replay utterances.jsonl --stub-llm --repeat 20 --out replay.json
+  python simulate_text.py --replay utterances.jsonl --stub-llm --users 500
+
+The replay file has one utterance per line, either a JSON string or an
+object with a "text" field. Utterances go through command extraction and
+the backend API concurrently (asyncio, one pooled HTTP session), and the
+run reports throughput and p50/p90/p95/p99 latencies. --stub-llm replaces
+the OpenAI call with a local pattern matcher (optionally delayed with
+--stub-latency-ms) so only the backend is under load. Utterances are
+spread round-robin over --users residents (X-User-Id replay-user-N,
+default 100), as many sessions would be, so the backend's per-user rate
+limits throttle only what a real resident would send too fast; 429s are
+counted as "throttled" in the report. Sends and calls are also limited per
+client address (RATE_LIMITS_PER_CLIENT on the backend), which one replay
+host reaches quickly at high rates.
+
+Utterances that the rule-based parser (intent_parser.py) reads confidently,
+to a contact listed in CONTACTS or CONTACTS_FILE, skip the LLM entirely, in
+both modes; --no-fast-path disables that. LLM
+extractions are remembered in a local SQLite cache (extraction_cache.py)
+so a repeated request is answered without the LLM; --no-cache disables it.
 """
 
 import os
 import json
 import sys
 import time
-from typing import Optional, Tuple
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
 
+from extraction_cache import ExtractionCache
+from intent_parser import IntentParser
+
 load_dotenv()
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
 
 try:
-    from openai import OpenAI  # type: ignore
+    from openai import AsyncOpenAI, OpenAI  # type: ignore
 except Exception:
-    OpenAI = None  # type: ignore
+    OpenAI = AsyncOpenAI = None  # type: ignore
 
 
 SYSTEM_PROMPT = (
@@ -106,10 +136,192 @@ def do_request_call(contact: str, call_type: str) -> Tuple[bool, str]:
         return False, f"Request failed: {e}"
 
 
-def main():
+# ---------------- Replay mode ---------------- #
+
+_stub_parser = IntentParser(min_confidence=0.0)
+
+
+def stub_extract_command(text: str) -> dict:
+    """Local stand-in for the LLM extractor: the rule-based parser, accepting any contact."""
+    match = _stub_parser.parse(text)
+    return match.command or {"action": "help", "reason": "No pattern matched"}
+
+
+async def extract_command_async(client, text: str) -> Optional[dict]:
+    completion = await client.chat.completions.create(
+        model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": text},
+        ],
+        temperature=float(os.getenv("LLM_TEMPERATURE", "0.2")),
+    )
+    return json.loads(completion.choices[0].message.content.strip())
+
+
+def load_utterances(path: str) -> List[str]:
+    utterances = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            utterances.append(item["text"] if isinstance(item, dict) else str(item))
+    return utterances
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(pct):
+        return round(ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)], 2)
+
+    return {
+        "p50": pick(50), "p90": pick(90), "p95": pick(95), "p99": pick(99),
+        "max": round(ordered[-1], 2), "mean": round(sum(ordered) / len(ordered), 2),
+    }
+
+
+async def replay_one(text: str, extractor, http, user_id: str) -> Dict:
+    result = {"text": text, "user": user_id, "status": "ok", "extract_ms": None, "backend_ms": None}
+    started = time.perf_counter()
+    try:
+        cmd = await extractor(text)
+    except Exception as e:
+        cmd, result["error"] = None, f"extract: {e}"
+    result["extract_ms"] = (time.perf_counter() - started) * 1000
+
+    action = (cmd or {}).get("action")
+    if action == "send_message":
+        path, payload = "/api/messages/send", {"contact": cmd.get("contact", ""), "message": cmd.get("message", "")}
+    elif action == "request_call":
+        call_type = cmd.get("call_type") if cmd.get("call_type") in ("voice", "video") else "voice"
+        path, payload = "/api/calls/request", {"contact": cmd.get("contact", ""), "type": call_type}
+    else:
+        result["status"] = "unparsed" if cmd is None else "help"
+        result["total_ms"] = result["extract_ms"]
+        return result
+
+    sent = time.perf_counter()
+    try:
+        async with http.post(f"{BACKEND_URL}{path}", json=payload, headers={"X-User-Id": user_id}) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status == 429:
+                result["status"] = "throttled"
+            elif resp.status != 200 or body.get("status") != "success":
+                result["status"], result["error"] = "error", f"backend {resp.status}: {body}"
+    except Exception as e:
+        result["status"], result["error"] = "error", f"backend: {e}"
+    result["backend_ms"] = (time.perf_counter() - sent) * 1000
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    result["action"] = action
+    return result
+
+
+async def replay(args) -> Dict:
+    import aiohttp
+
+    utterances = load_utterances(args.replay) * args.repeat
+    cache = None
+    if args.stub_llm:
+        async def extractor(text):
+            if args.stub_latency_ms:
+                await asyncio.sleep(random.uniform(0.5, 1.5) * args.stub_latency_ms / 1000)
+            return stub_extract_command(text)
+    else:
+        if AsyncOpenAI is None or not os.getenv("OPENAI_API_KEY"):
+            print("ERROR: replay without --stub-llm needs the openai package and OPENAI_API_KEY.", file=sys.stderr)
+            sys.exit(1)
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        cache = None if args.no_cache else ExtractionCache(os.getenv("LLM_MODEL", "gpt-4o-mini"), SYSTEM_PROMPT)
+
+        async def extractor(text):
+            if cache is None:
+                return await extract_command_async(client, text)
+            return await cache.extract_async(text, lambda t: extract_command_async(client, t))
+
+    intent_parser = IntentParser()
+    if not args.no_fast_path:
+        llm_extractor = extractor
+
+        async def extractor(text):
+            return await intent_parser.extract_async(text, llm_extractor)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, text in enumerate(utterances):
+        queue.put_nowait((text, f"replay-user-{i % args.users}"))
+    results: List[Dict] = []
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        async def worker():
+            while True:
+                try:
+                    text, user_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await replay_one(text, extractor, http, user_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    by_status: Dict[str, int] = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+    backend = [r["backend_ms"] for r in results if r["backend_ms"] is not None]
+    return {
+        "utterances": len(results),
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "llm": "stub" if args.stub_llm else os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        "elapsed_s": round(elapsed, 3),
+        "utterances_per_s": round(len(results) / max(elapsed, 1e-9), 1),
+        "backend_requests_per_s": round(len(backend) / max(elapsed, 1e-9), 1),
+        "status": by_status,
+        "extract_ms": percentiles([r["extract_ms"] for r in results]),
+        "backend_ms": percentiles(backend),
+        "total_ms": percentiles([r["total_ms"] for r in results]),
+        "extraction_cache": cache.stats() if cache else None,
+        "intent_fast_path": None if args.no_fast_path else intent_parser.stats.snapshot(),
+        "errors": [r["error"] for r in results if r.get("error")][:10],
+    }
+
+
+def print_report(report: Dict):
+    print(
+        f"{report['utterances']} utterances from {report['users']} users in {report['elapsed_s']}s "
+        f"at concurrency {report['concurrency']} "
+        f"({report['utterances_per_s']}/s, backend {report['backend_requests_per_s']} req/s, llm={report['llm']})"
+    )
+    print(f"status: {report['status']}")
+    for key in ("extract_ms", "backend_ms", "total_ms"):
+        p = report[key]
+        if p:
+            print(f"{key:>11}: p50={p['p50']} p90={p['p90']} p95={p['p95']} p99={p['p99']} max={p['max']}")
+    if report["extraction_cache"]:
+        print(f"extraction cache: {report['extraction_cache']}")
+    if report["intent_fast_path"]:
+        print(f"fast path: {report['intent_fast_path']}")
+    for error in report["errors"]:
+        print(f"  error: {error}")
+
+
+def interactive(args):
     print("Text simulation started. Type natural commands, or 'exit' to quit.")
     print(f"Backend: {BACKEND_URL}")
     client = ensure_openai()
+    intent_parser = None if args.no_fast_path else IntentParser()
+    cache = None if args.no_cache else ExtractionCache(os.getenv("LLM_MODEL", "gpt-4o-mini"), SYSTEM_PROMPT)
+
+    def llm_extract(text):
+        if cache is None:
+            return extract_command(client, text)
+        return cache.extract(text, lambda t: extract_command(client, t))
 
     while True:
         try:
@@ -124,7 +336,8 @@ def main():
             print("Goodbye.")
             break
 
-        cmd = extract_command(client, user)
+        # Obvious requests are parsed locally, repeats come from the cache; the rest go to the LLM
+        cmd = intent_parser.extract(user, llm_extract) if intent_parser else llm_extract(user)
         if not cmd:
             print("Sorry, I couldn't understand that.")
             continue
@@ -142,6 +355,39 @@ def main():
         else:
             print("I can send messages or request calls. Try e.g. 'Send a message to Emma saying hello'.")
 
+    if intent_parser:
+        print(f"Fast path: {intent_parser.stats.snapshot()}")
+    if cache:
+        print(f"Extraction cache: {cache.stats()}")
+        cache.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Text-only simulation of the voice agent")
+    parser.add_argument("--replay", help="JSON lines file of utterances to replay non-interactively")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the file this many times")
+    parser.add_argument("--users", type=int, default=100, help="residents (X-User-Id) to spread utterances over")
+    parser.add_argument("--stub-llm", action="store_true", help="extract commands locally instead of calling OpenAI")
+    parser.add_argument("--stub-latency-ms", type=float, default=0, help="simulated extractor latency (mean)")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every utterance to the extractor")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the extraction cache")
+    parser.add_argument("--timeout", type=float, default=10, help="per backend request, seconds")
+    parser.add_argument("--out", help="write the replay report as JSON to this file")
+    args = parser.parse_args(argv)
+    if args.users < 1:
+        parser.error("--users must be at least 1")
+
+    if not args.replay:
+        interactive(args)
+        return
+
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
 
 if __name__ == "__main__":
     main()
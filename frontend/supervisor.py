@@ -0,0 +1,128 @@
+"""
+Pre-fork supervisor for the FastAPI voice server (twilio.py)
+
+Runs N uvicorn worker processes that share one listening socket. Each
+WebSocket is accepted by exactly one worker and its whole pipeline lives
+there, so sessions are sticky for their lifetime while VAD inference,
+resampling and serialization spread across cores.
+
+The app, pipecat and the Silero VAD model are loaded once in the supervisor
+before forking, so workers start instantly and share those pages
+copy-on-write. Each worker enforces its own MAX_SESSIONS.
+
+Usage:
+  python supervisor.py --workers 4 --port 8765
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+from loguru import logger
+
+
+def preload():
+    """Import the app and warm read-only shared state before forking."""
+    import twilio
+    from vad import preload_vad_model
+
+    preload_vad_model()
+    return twilio.app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, index: int):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving")
+    config = uvicorn.Config(app, log_level=os.getenv("LOG_LEVEL", "info"))
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks and babysits the worker processes"""
+
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}  # pid -> worker index
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.app, self.sock, index)
+            finally:
+                os._exit(0)
+        self.children[pid] = index
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for i in range(self.workers):
+            self.spawn(i)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            self.spawn(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the voice server across several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8765")))
+    args = parser.parse_args()
+
+    app = preload()
+
+    if not hasattr(os, "fork") or args.workers <= 1:
+        import uvicorn
+
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Supervisor {os.getpid()} listening on {args.host}:{args.port} with {args.workers} workers")
+    Supervisor(app, sock, args.workers).run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,7 @@ COMMUNICATION RULES:
     2. Make calls: Ask for contact name and call type (voice/video), then confirm
     3. Notify of messages: Announce who messaged them
     4. Handle incoming calls: Ask if they want to accept or decline
+    5. Find past messages: Use search_messages for questions like "what did Emma say about Sunday?"
 
     WHEN EXTRACTING INFORMATION:
     - Confirm contact name
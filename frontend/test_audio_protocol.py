@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from pipecat.frames.frames import (
+    EndFrame,
+    InputAudioRawFrame,
+    InterruptionFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    TextFrame,
+    TTSAudioRawFrame,
+    TTSStoppedFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.frame_processor import FrameProcessor
+
+from audio_protocol import (
+    HEADER,
+    KIND_CONTROL,
+    KIND_PCM16,
+    AudioFlushFrame,
+    BinaryAudioSerializer,
+    EndOfSpeechFlush,
+    JsonAudioSerializer,
+    OpusAudioSerializer,
+    opuslib,
+    pack_message,
+    unpack_packets,
+)
+
+needs_opus = pytest.mark.skipif(opuslib is None, reason="opuslib and libopus are not installed")
+
+FRAME_BYTES = 16000 * 20 // 1000 * 2  # one 20 ms Opus frame of PCM16 at 16 kHz
+
+
+def _serializer(cls):
+    serializer = cls()
+    asyncio.run(serializer.setup(StartFrame(audio_in_sample_rate=16000, audio_out_sample_rate=16000)))
+    return serializer
+
+
+def _deserialize(serializer, data):
+    return asyncio.run(serializer.deserialize(data))
+
+
+def test_json_malformed_audio_is_dropped():
+    serializer = _serializer(JsonAudioSerializer)
+    audio = base64.b64encode(b"\x00\x01" * 160).decode()
+    for message in (
+        {"audio": audio, "sample_rate": "fast"},
+        {"audio": audio, "sample_rate": None},
+        {"audio": audio, "sample_rate": [16000]},
+        {"audio": "not base64!"},
+        {"audio": 12},
+    ):
+        assert _deserialize(serializer, json.dumps(message)) is None
+
+
+def test_json_audio_and_text_still_decode():
+    serializer = _serializer(JsonAudioSerializer)
+    frame = _deserialize(serializer, json.dumps({"audio": base64.b64encode(b"\x01\x02").decode(), "sample_rate": "8000"}))
+    assert isinstance(frame, InputAudioRawFrame)
+    assert frame.audio == b"\x01\x02" and frame.sample_rate == 8000
+    assert _deserialize(serializer, "{not json").text == "{not json"
+
+
+def test_binary_malformed_control_is_dropped():
+    serializer = _serializer(BinaryAudioSerializer)
+    assert _deserialize(serializer, "{not json") is None
+    assert _deserialize(serializer, pack_message(KIND_CONTROL, 1, 0, b"{not json")) is None
+    assert _deserialize(serializer, pack_message(KIND_CONTROL, 1, 0, b"\xff\xfe")) is None
+    assert _deserialize(serializer, b"\x01") is None
+
+
+def test_binary_after_malformed_message_keeps_decoding():
+    serializer = _serializer(BinaryAudioSerializer)
+    assert _deserialize(serializer, pack_message(KIND_CONTROL, 1, 0, b"{")) is None
+    frame = _deserialize(serializer, pack_message(KIND_CONTROL, 2, 0, b'{"text": "hi"}'))
+    assert isinstance(frame, TextFrame) and frame.text == "hi"
+    frame = _deserialize(serializer, pack_message(KIND_PCM16, 3, 16000, b"\x00\x00"))
+    assert isinstance(frame, InputAudioRawFrame) and frame.audio == b"\x00\x00"
+
+
+def _serialize(serializer, frame):
+    return asyncio.run(serializer.serialize(frame))
+
+
+def _audio(ms):
+    return OutputAudioRawFrame(audio=b"\x10\x00" * (16 * ms), sample_rate=16000, num_channels=1)
+
+
+def _packets(payload):
+    return unpack_packets(payload, HEADER.size) if payload else []
+
+
+@needs_opus
+def test_opus_flush_pads_the_tail_to_a_whole_frame():
+    serializer = _serializer(OpusAudioSerializer)
+    assert len(_packets(_serialize(serializer, _audio(50)))) == 2
+    assert len(serializer._pending) == FRAME_BYTES // 2
+
+    tail = _packets(_serialize(serializer, AudioFlushFrame()))
+    assert len(tail) == 1 and not serializer._pending
+    decoded = _deserialize(serializer, _serialize(serializer, _audio(20)))
+    assert len(decoded.audio) == FRAME_BYTES
+
+    assert _serialize(serializer, AudioFlushFrame()) is None
+    _serialize(serializer, _audio(10))
+    assert len(_packets(_serialize(serializer, EndFrame()))) == 1
+
+
+@needs_opus
+def test_opus_interruption_drops_the_tail():
+    serializer = _serializer(OpusAudioSerializer)
+    _serialize(serializer, _audio(30))
+    assert serializer._pending
+    assert _serialize(serializer, InterruptionFrame()) is None
+    assert not serializer._pending
+    # The next reply starts on a frame boundary of its own
+    assert len(_packets(_serialize(serializer, _audio(20)))) == 1
+    assert not serializer._pending
+
+
+def test_flush_frame_sends_nothing_for_pcm_and_json():
+    assert _serialize(_serializer(BinaryAudioSerializer), AudioFlushFrame()) is None
+    assert _serialize(_serializer(JsonAudioSerializer), AudioFlushFrame()) is None
+
+
+class _Collector(FrameProcessor):
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        self.frames.append(frame)
+        await self.push_frame(frame, direction)
+
+
+def test_end_of_speech_flush_follows_tts_stopped():
+    collector = _Collector()
+    task = PipelineTask(Pipeline([EndOfSpeechFlush(), collector]))
+
+    async def run():
+        await task.queue_frames([
+            TTSAudioRawFrame(audio=b"\x00\x00" * 160, sample_rate=16000, num_channels=1),
+            TTSStoppedFrame(),
+            EndFrame(),
+        ])
+        await PipelineRunner(handle_sigint=False).run(task)
+
+    asyncio.run(run())
+    kinds = [type(f) for f in collector.frames if isinstance(f, (TTSAudioRawFrame, TTSStoppedFrame, AudioFlushFrame))]
+    assert kinds == [TTSAudioRawFrame, TTSStoppedFrame, AudioFlushFrame]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from daily_token import DailyTokenCache
+
+
+class _FakeDaily:
+    """POST /meeting-tokens on a local port, counting calls; fails while ``failing`` is set"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+        self._runner = None
+        self.url = None
+
+    async def _mint(self, request):
+        self.calls += 1
+        if self.failing:
+            return web.json_response({"error": "unavailable"}, status=500)
+        body = await request.json()
+        assert request.headers["Authorization"] == "Bearer test-key"
+        return web.json_response({"token": f"token-{self.calls}-{body['properties']['room_name']}"})
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/meeting-tokens", self._mint)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+
+def _cache(daily, path, **kwargs):
+    return DailyTokenCache(path=str(path), ttl=3600, margin=600, api_url=daily.url, **kwargs)
+
+
+def test_cold_then_warm_start(tmp_path):
+    path = tmp_path / "tokens.json"
+
+    async def run():
+        async with _FakeDaily() as daily:
+            assert await _cache(daily, path).get("room", "test-key") == "token-1-room"
+            assert daily.calls == 1
+
+            # A new process: the token comes from disk, with no call to Daily
+            assert await _cache(daily, path).get("room", "test-key") == "token-1-room"
+            assert daily.calls == 1
+
+    asyncio.run(run())
+    assert "test-key" not in path.read_text()
+
+
+def test_refresh_near_expiry_and_fallback_when_daily_fails(tmp_path):
+    path = tmp_path / "tokens.json"
+
+    async def run():
+        async with _FakeDaily() as daily:
+            cache = _cache(daily, path)
+            await cache.get("room", "test-key")
+            key = cache._key("room", "test-key")
+
+            # Inside the refresh margin: a new token is minted
+            cache._entries[key]["exp"] = time.time() + 300
+            assert await cache.get("room", "test-key") == "token-2-room"
+            assert json.loads(path.read_text())[key]["token"] == "token-2-room"
+
+            # Daily down: the cached token is still good for a few minutes, so it is used
+            cache._entries[key]["exp"] = time.time() + 300
+            daily.failing = True
+            assert await cache.get("room", "test-key") == "token-2-room"
+            assert daily.calls == 3
+
+    asyncio.run(run())
+
+
+def test_refresher_renews_once_and_skips_what_get_renewed(tmp_path):
+    path = tmp_path / "tokens.json"
+
+    async def run():
+        async with _FakeDaily() as daily:
+            cache = _cache(daily, path)
+            await cache.get("room", "test-key")
+            key = cache._key("room", "test-key")
+            cache._entries[key]["exp"] = time.time() + 300
+
+            # The refresher wakes at once but has to wait for the lock get() holds
+            async with cache._lock:
+                cache.start_refresher("room", "test-key")
+                await asyncio.sleep(0.05)
+                await cache._refresh(key, "room", "test-key")
+            await asyncio.sleep(0.2)
+            assert daily.calls == 2
+            await cache.stop()
+
+    asyncio.run(run())
+
+
+def test_margin_not_below_ttl_is_clamped(tmp_path):
+    cache = DailyTokenCache(path=str(tmp_path / "tokens.json"), ttl=600, margin=600, api_url="http://unused")
+    assert cache.margin < cache.ttl
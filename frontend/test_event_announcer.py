@@ -0,0 +1,84 @@
+import asyncio
+
+from pipecat.frames.frames import EndFrame, TTSSpeakFrame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameProcessor
+
+from event_announcer import EVENTS_MARK, BackendEventAnnouncer, add_event_note
+
+
+def assert_sonar_order(messages):
+    """System messages only at the start, then user/assistant alternating from a user turn"""
+    head = 0
+    while head < len(messages) and messages[head]["role"] == "system":
+        head += 1
+    roles = [m["role"] for m in messages[head:]]
+    assert "system" not in roles, roles
+    assert roles == ["user", "assistant"] * (len(roles) // 2) + ["user"] * (len(roles) % 2), roles
+
+
+def _context():
+    return OpenAILLMContext([
+        {"role": "system", "content": "You are helpful."},
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "Hi, how can I help?"},
+    ])
+
+
+def test_notes_go_into_the_leading_system_message():
+    context = _context()
+    for i in range(12):
+        add_event_note(context, f"note {i}", keep=10)
+    messages = context.get_messages()
+    assert len(messages) == 3
+    prompt, _, section = messages[0]["content"].partition(EVENTS_MARK)
+    assert prompt == "You are helpful."
+    assert section.splitlines() == [f"- note {i}" for i in range(2, 12)]
+
+    context.add_message({"role": "user", "content": "Yes, answer it"})
+    assert_sonar_order(context.get_messages())
+
+
+def test_note_without_a_system_prompt_starts_one():
+    context = OpenAILLMContext([{"role": "user", "content": "Hello"}])
+    add_event_note(context, "Incoming call")
+    messages = context.get_messages()
+    assert messages[0]["role"] == "system" and messages[0]["content"].endswith("- Incoming call")
+    assert_sonar_order(messages)
+
+
+class _Collector(FrameProcessor):
+    def __init__(self):
+        super().__init__()
+        self.spoken = asyncio.Event()
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, TTSSpeakFrame):
+            self.spoken.set()
+        await self.push_frame(frame, direction)
+
+
+def test_announcement_keeps_the_context_in_sonar_order():
+    context = _context()
+    announcer = BackendEventAnnouncer(context, user_id="test-resident", grace=0)
+    collector = _Collector()
+    task = PipelineTask(Pipeline([announcer, collector]))
+
+    async def run():
+        runner = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+        while announcer._task is None:
+            await asyncio.sleep(0.01)
+        await announcer._on_event("incoming_call", {"from": "Sarah", "type": "video", "call_id": "c1"})
+        await asyncio.wait_for(collector.spoken.wait(), 5)
+        await task.queue_frame(EndFrame())
+        await runner
+
+    asyncio.run(run())
+    messages = context.get_messages()
+    assert "call_id c1" in messages[0]["content"]
+    context.add_message({"role": "user", "content": "Yes please"})
+    assert_sonar_order(context.get_messages())
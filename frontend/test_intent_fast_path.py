@@ -0,0 +1,92 @@
+import asyncio
+
+from pipecat.frames.frames import EndFrame, TTSSpeakFrame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameProcessor
+
+import intent_fast_path
+from intent_fast_path import IntentFastPath, is_yes
+from intent_parser import ContactDirectory, IntentParser
+
+
+class _Collector(FrameProcessor):
+    """Stands in for the LLM and TTS: records what reaches them"""
+
+    def __init__(self):
+        super().__init__()
+        self.spoken = []
+        self.to_llm = []
+        self.received = asyncio.Event()
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, TTSSpeakFrame):
+            self.spoken.append(frame.text)
+            self.received.set()
+        elif isinstance(frame, OpenAILLMContextFrame):
+            self.to_llm.append(frame.context.get_messages()[-1]["content"])
+            self.received.set()
+        await self.push_frame(frame, direction)
+
+
+def test_yes_only_for_a_plain_yes():
+    for text in ["yes", "Yes please.", "yeah, go ahead", "OK", "sure, thanks"]:
+        assert is_yes(text), text
+    for text in ["no", "yes but to Tim", "not yet", "send it to Sarah instead", ""]:
+        assert not is_yes(text), text
+
+
+def test_no_tool_runs_before_the_user_says_yes(monkeypatch):
+    calls = []
+
+    async def fake_run_tool(name, args, timeout, user_id):
+        calls.append((name, args, user_id))
+        return {"status": "success"}
+
+    monkeypatch.setattr(intent_fast_path, "run_tool", fake_run_tool)
+    parser = IntentParser(directory=ContactDirectory({"John": [], "Sarah": []}))
+    fast_path = IntentFastPath(parser=parser, enabled=True, user_id="test-resident")
+    collector = _Collector()
+    task = PipelineTask(Pipeline([fast_path, collector]))
+    context = OpenAILLMContext([{"role": "system", "content": "You are helpful."}])
+
+    async def turn(text):
+        context.add_message({"role": "user", "content": text})
+        collector.received.clear()
+        await task.queue_frame(OpenAILLMContextFrame(context))
+        await asyncio.wait_for(collector.received.wait(), 5)
+
+    async def run():
+        runner = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+
+        await turn("send a message to John saying goodnight")
+        assert collector.spoken == ["Send 'goodnight' to John?"]
+        assert calls == []
+
+        # Anything but yes goes to the LLM, and nothing is sent
+        await turn("no, to Sarah")
+        assert collector.to_llm == ["no, to Sarah"]
+        assert calls == []
+
+        await turn("call Sarah on video")
+        assert collector.spoken[-1] == "Start a video call with Sarah?"
+        assert calls == []
+
+        await turn("yes please")
+        assert calls == [("request_call", {"contact": "Sarah", "call_type": "video"}, "test-resident")]
+        assert collector.spoken[-1] == "Okay, I'm starting a video call with Sarah now."
+
+        # The yes was used up: another yes is just a turn for the LLM
+        await turn("yes")
+        assert collector.to_llm[-1] == "yes"
+        assert len(calls) == 1
+
+        await task.queue_frame(EndFrame())
+        await runner
+
+    asyncio.run(run())
+    roles = [m["role"] for m in context.get_messages()]
+    assert roles[-4:] == ["assistant", "user", "assistant", "user"]
@@ -0,0 +1,58 @@
+import pytest
+
+from intent_parser import INTENT_MIN_CONFIDENCE, ContactDirectory, IntentParser
+
+
+@pytest.fixture
+def no_directory():
+    return IntentParser(directory=ContactDirectory())
+
+
+@pytest.fixture
+def family():
+    return IntentParser(directory=ContactDirectory({"John": [], "Sarah": [], "Emma": ["my daughter"]}))
+
+
+@pytest.mark.parametrize("text", [
+    "tell me a joke",
+    "let me know the weather tomorrow",
+    "tell me about my messages",
+    "Tell us a story",
+    "let him know",
+    "tell her I'm coming",
+    "call them",
+    "send a message saying hi",
+    "let John call me",
+])
+def test_not_a_send_or_call(no_directory, family, text):
+    for parser in (no_directory, family, IntentParser(directory=ContactDirectory(), min_confidence=0.0)):
+        match = parser.parse(text)
+        assert match.command is None, (text, match.command)
+        assert not parser.confident(match)
+
+
+def test_unknown_names_need_the_llm_without_a_directory(no_directory):
+    match = no_directory.parse("send a message to John saying hi")
+    assert match.command == {"action": "send_message", "contact": "John", "message": "hi"}
+    assert match.confidence < INTENT_MIN_CONFIDENCE
+    assert not no_directory.confident(match)
+
+
+@pytest.mark.parametrize("text, command", [
+    ("text John saying hi", {"action": "send_message", "contact": "John", "message": "hi"}),
+    ("message Sarah, saying I'll be late.", {"action": "send_message", "contact": "Sarah", "message": "I'll be late"}),
+    ("send a message to John saying hi", {"action": "send_message", "contact": "John", "message": "hi"}),
+    ("tell my daughter goodnight", {"action": "send_message", "contact": "Emma", "message": "goodnight"}),
+    ("let Sarah know that I'm home", {"action": "send_message", "contact": "Sarah", "message": "I'm home"}),
+    ("call Sarah on video", {"action": "request_call", "contact": "Sarah", "call_type": "video"}),
+])
+def test_known_contacts_take_the_fast_path(family, text, command):
+    match = family.parse(text)
+    assert match.command == command
+    assert family.confident(match)
+
+
+def test_unknown_contact_falls_back(family):
+    match = family.parse("text Bob saying hi")
+    assert match.command["contact"] == "Bob"
+    assert not family.confident(match)
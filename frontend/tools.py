@@ -2,18 +2,29 @@
 Tool definitions and (optional) handlers for backend-linked functions.
 
 This exposes function-calling schemas for the LLM and async handlers that
-call the Flask backend endpoints.
+call the Flask backend endpoints, plus a ToolExecutor that registers them on
+a Pipecat LLM service and runs each turn's calls concurrently.
 """
 
+import asyncio
 import os
-from typing import Any, Dict, Callable, Awaitable
+from typing import Any, Dict, Callable, Awaitable, List, Optional, Tuple
 
 import aiohttp
+from loguru import logger
 from pipecat.adapters.schemas.function_schema import FunctionSchema
 from pipecat.adapters.schemas.tools_schema import ToolsSchema
+from pipecat.frames.frames import TTSSpeakFrame
+
+from session_bootstrap import RESIDENT_USER_ID
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
 
+# Per-tool timeout, and how long a turn's tools may run before we say something
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "8"))
+TOOL_FILLER_AFTER = float(os.getenv("TOOL_FILLER_AFTER", "1.5"))
+TOOL_FILLER_PHRASE = os.getenv("TOOL_FILLER_PHRASE", "One moment please, I'm working on that.")
+
 
 # ---- Tool Schemas (OpenAI-style function tools) ----
 
@@ -97,6 +108,30 @@ get_message_history_schema = FunctionSchema(
     required = ["contact"]
 )
 
+search_messages_schema = FunctionSchema(
+    name="search_messages",
+    description=(
+        "Search past messages by what was said, e.g. what a contact said about Sunday. "
+        "Returns only the best few matches."
+    ),
+    properties={
+            "query": {
+                "type": "string",
+                "description": "Words to look for in the messages."
+            },
+            "contact": {
+                "type": "string",
+                "description": "Only search the conversation with this contact."
+            },
+            "limit": {
+                "type": "integer",
+                "minimum": 1,
+                "maximum": 10,
+                "default": 5
+            }
+        },
+    required = ["query"]
+)
 
 
 tools = ToolsSchema(
@@ -106,64 +141,71 @@ tools = ToolsSchema(
         respond_to_call_schema,
         end_call_schema,
         get_message_history_schema,
+        search_messages_schema,
     ]
 )
 
 
 # ---- Optional: Async handlers that call the backend ----
+# Each call is made on behalf of the session's resident (X-User-Id), which is
+# also whose rate-limit buckets it spends on the backend.
+
+def _headers(function: str, user_id: str) -> Dict[str, str]:
+    return {"X-LLM-Function": function, "X-User-Id": user_id}
 
-async def handle_send_message(args: Dict[str, Any]) -> Dict[str, Any]:
+
+async def handle_send_message(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
     contact = args.get("contact", "")
     message = args.get("message", "")
     async with aiohttp.ClientSession() as session:
         async with session.post(
             f"{BACKEND_URL}/api/messages/send",
             json={"contact": contact, "message": message},
-            headers={"X-LLM-Function": "send_message"}
+            headers=_headers("send_message", user_id)
         ) as resp:
             data = await resp.json()
             return data
 
 
-async def handle_request_call(args: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_request_call(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
     contact = args.get("contact", "")
     call_type = args.get("call_type", "voice")
     async with aiohttp.ClientSession() as session:
         async with session.post(
             f"{BACKEND_URL}/api/calls/request",
             json={"contact": contact, "type": call_type},
-            headers={"X-LLM-Function": "request_call"}
+            headers=_headers("request_call", user_id)
         ) as resp:
             data = await resp.json()
             return data
 
 
-async def handle_respond_to_call(args: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_respond_to_call(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
     call_id = args.get("call_id", "")
     accept = bool(args.get("accept", False))
     async with aiohttp.ClientSession() as session:
         async with session.post(
             f"{BACKEND_URL}/api/calls/respond",
             json={"call_id": call_id, "accept": accept},
-            headers={"X-LLM-Function": "respond_to_call"}
+            headers=_headers("respond_to_call", user_id)
         ) as resp:
             data = await resp.json()
             return data
 
 
-async def handle_end_call(args: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_end_call(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
     call_id = args.get("call_id", "")
     async with aiohttp.ClientSession() as session:
         async with session.post(
             f"{BACKEND_URL}/api/calls/end",
             json={"call_id": call_id},
-            headers={"X-LLM-Function": "end_call"}
+            headers=_headers("end_call", user_id)
         ) as resp:
             data = await resp.json()
             return data
 
 
-async def handle_get_message_history(args: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_get_message_history(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
     contact = args.get("contact", "")
     limit = int(args.get("limit", 50))
     params = {"contact": contact, "limit": str(limit)}
@@ -171,7 +213,21 @@ async def handle_get_message_history(args: Dict[str, Any]) -> Dict[str, Any]:
         async with session.get(
             f"{BACKEND_URL}/api/messages/history",
             params=params,
-            headers={"X-LLM-Function": "get_message_history"}
+            headers=_headers("get_message_history", user_id)
+        ) as resp:
+            data = await resp.json()
+            return data
+
+
+async def handle_search_messages(args: Dict[str, Any], user_id: str = RESIDENT_USER_ID) -> Dict[str, Any]:
+    params = {"q": args.get("query", ""), "limit": str(min(int(args.get("limit", 5)), 10))}
+    if args.get("contact"):
+        params["contact"] = args["contact"]
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{BACKEND_URL}/api/messages/search",
+            params=params,
+            headers=_headers("search_messages", user_id)
         ) as resp:
             data = await resp.json()
             return data
@@ -182,11 +238,10 @@ def get_tools() -> ToolsSchema:
     return tools
 
 
-def get_tool_handlers() -> Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]]:
+def get_tool_handlers() -> Dict[str, Callable[..., Awaitable[Dict[str, Any]]]]:
     """Return a mapping from tool name to async handler that hits the backend.
 
-    Note: You still need to wire a tools-execution processor in the pipeline
-    if you want automatic execution of function calls returned by the LLM.
+    Use register_function_handlers() to have a Pipecat LLM service run them.
     """
     return {
         "send_message": handle_send_message,
@@ -194,12 +249,97 @@ def get_tool_handlers() -> Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[s
         "respond_to_call": handle_respond_to_call,
         "end_call": handle_end_call,
         "get_message_history": handle_get_message_history,
+        "search_messages": handle_search_messages,
     }
 
 
-def register_function_handlers(llm) -> None:
-    llm.register_function_handlers('send_message', handle_send_message)
-    llm.register_function_handlers('request_call', handle_request_call)
-    llm.register_function_handlers('respond_to_call', handle_respond_to_call)
-    llm.register_function_handlers('end_call', handle_end_call)
-    llm.register_function_handlers('get_message_history', handle_get_message_history)
\ No newline at end of file
+async def run_tool(
+    name: str, args: Dict[str, Any], timeout: float = TOOL_TIMEOUT, user_id: str = RESIDENT_USER_ID
+) -> Dict[str, Any]:
+    """Run one tool handler for ``user_id``, turning timeouts and errors into a result the LLM can read."""
+    handler = get_tool_handlers().get(name)
+    if handler is None:
+        return {"status": "error", "message": f"Unknown tool {name}"}
+    try:
+        return await asyncio.wait_for(handler(dict(args), user_id), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Tool {name} timed out after {timeout}s")
+        return {"status": "error", "message": f"{name} timed out, please try again"}
+    except Exception as e:
+        logger.error(f"Tool {name} failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+async def run_tools_concurrently(
+    calls: List[Tuple[str, Dict[str, Any]]], timeout: float = TOOL_TIMEOUT, user_id: str = RESIDENT_USER_ID
+) -> List[Dict[str, Any]]:
+    """Run several (name, args) tool calls at once; results keep the input order."""
+    return await asyncio.gather(*(run_tool(name, args, timeout, user_id) for name, args in calls))
+
+
+class ToolExecutor:
+    """Runs the backend tools for a Pipecat LLM service.
+
+    When the LLM asks for several functions in one turn (e.g. message two
+    relatives), all of them start together as soon as the turn's calls are
+    announced and are awaited with asyncio.gather, each under its own
+    timeout. If the batch is still running after ``filler_after`` seconds a
+    short filler phrase is spoken so the user isn't left in silence. Every
+    call is made on behalf of ``user_id``, the session's resident.
+    """
+
+    def __init__(
+        self,
+        timeout: float = TOOL_TIMEOUT,
+        filler_after: float = TOOL_FILLER_AFTER,
+        filler_phrase: str = TOOL_FILLER_PHRASE,
+        user_id: str = RESIDENT_USER_ID,
+    ):
+        self.timeout = timeout
+        self.user_id = user_id
+        self.filler_after = filler_after
+        self.filler_phrase = filler_phrase
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def attach(self, llm) -> None:
+        # An LLMSwitcher (see service_factory) wraps several services; attach to each
+        for service in getattr(llm, "llms", None) or [llm]:
+            for name in get_tool_handlers():
+                # Sending a message or placing a call must not be half-done by a barge-in
+                service.register_function(name, self._handle, cancel_on_interruption=False)
+            service.add_event_handler("on_function_calls_started", self._run_batch)
+
+    def _call_task(self, tool_call_id: str, name: str, args) -> asyncio.Task:
+        # Whichever of the batch runner or the per-call handler gets here first
+        # starts the tool; the other one awaits the same task.
+        task = self._calls.get(tool_call_id)
+        if task is None:
+            task = asyncio.create_task(run_tool(name, args or {}, self.timeout, self.user_id))
+            self._calls[tool_call_id] = task
+        return task
+
+    async def _run_batch(self, llm, function_calls) -> None:
+        tasks = [self._call_task(c.tool_call_id, c.function_name, c.arguments) for c in function_calls]
+        batch = asyncio.ensure_future(asyncio.gather(*tasks))
+        done, _ = await asyncio.wait({batch}, timeout=self.filler_after)
+        if not done:
+            await llm.push_frame(TTSSpeakFrame(self.filler_phrase))
+        await batch
+
+    async def _handle(self, params) -> None:
+        task = self._call_task(params.tool_call_id, params.function_name, params.arguments)
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._calls.pop(params.tool_call_id, None)
+        await params.result_callback(result)
+
+
+def register_function_handlers(
+    llm, executor: Optional[ToolExecutor] = None, user_id: str = RESIDENT_USER_ID
+) -> ToolExecutor:
+    """Register every backend tool on ``llm``, run for ``user_id``; returns the executor used."""
+    executor = executor or ToolExecutor(user_id=user_id)
+    executor.attach(llm)
+    return executor
\ No newline at end of file
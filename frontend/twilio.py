@@ -2,7 +2,7 @@ import os
 import json
 import asyncio
 import base64
-from typing import Optional
+from typing import Callable, List, Optional
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,66 +10,73 @@ from dotenv import load_dotenv
 from starlette.responses import HTMLResponse
 
 # Pipecat imports
-from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.frames.frames import LLMRunFrame, AudioRawFrame, TextFrame
+from pipecat.frames.frames import LLMRunFrame, AudioRawFrame, TextFrame, TTSSpeakFrame, EndFrame
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.processors.frame_processor import FrameProcessor
-from pipecat.services.perplexity.llm import PerplexityLLMService
-from pipecat.services.deepgram.stt import DeepgramSTTService
-from pipecat.services.deepgram.tts import DeepgramTTSService
 from pipecat.transports.network.fastapi_websocket import (
     FastAPIWebsocketTransport,
     FastAPIWebsocketParams,
 )
-from pipecat.transports.serializers.fastapi_websocket_serializer import FastAPIWebsocketSerializer
 
 
 from system_prompt import SYSTEM_PROMPT
-from tools import get_tools
+from tools import get_tools, register_function_handlers
+from session_manager import SessionManager, CapacityError
+from vad import create_vad_analyzer
+from context_window import ContextWindowManager
+from intent_fast_path import IntentFastPath
+from session_bootstrap import RESIDENT_USER_ID, inject_user_state
+from event_announcer import BackendEventAnnouncer
+from audio_protocol import PROTOCOL_JSON, PROTOCOL_OPUS, EndOfSpeechFlush, create_serializer, negotiate_protocol
+
+from alloc_profiler import AllocationProfiler
+from service_factory import LatencyTracker, create_context_aggregator, create_services, create_stage
+
+
+# ---------------- LOGGERS ---------------- #
+# Every processor is a hop each audio frame takes, so these only print
+# when FRAME_LOG is set and never copy or re-wrap the audio payload.
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in {"1", "true", "yes", "y"}
 
-from pipecat.processors.frame_processor import FrameProcessor
 
 class FrameLogger(FrameProcessor):
     async def process_frame(self, frame, direction):
-        # Print type of frame
-        print(f"[FRAME] {type(frame).__name__}")
+        await super().process_frame(frame, direction)
 
-        # Print additional info depending on frame type
+        # Print type of frame and additional info depending on frame type
         if isinstance(frame, TextFrame):
-            print(f"  Text: {frame.text}")
+            print(f"[FRAME] {type(frame).__name__} Text: {frame.text}")
         elif isinstance(frame, AudioRawFrame):
-            print(f"  Audio length: {len(frame.audio)} bytes, Sample rate: {frame.sample_rate}")
+            print(f"[FRAME] {type(frame).__name__} {len(frame.audio)} bytes @ {frame.sample_rate}")
         else:
-            print(f"  Other frame: {frame}")
+            print(f"[FRAME] {frame}")
 
-        return await super().process_frame(frame, direction)
-
-
-# ---------------- LOGGERS ---------------- #
-class InputLogger(FrameProcessor):
-    async def process_frame(self, frame, direction):
-        print(f"[INPUT] {type(frame).__name__}")
-        return await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
 
 
 class TranscriptionLogger(FrameProcessor):
     async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
         if isinstance(frame, TextFrame):
             print(f"[TRANSCRIPTION] {frame.text}")
-        return await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
 
 
 # ---------------- CUSTOM RN INTERCEPTOR ---------------- #
 class ReactNativeInputInterceptor(FrameProcessor):
     """
-    Handles base64 audio or text JSON *after* the transport receives them.
-    The transport converts WebSocket messages → TextFrame or AudioRawFrame automatically.
+    Handles audio or text control messages *after* the transport receives them.
+    The transport's serializer (see audio_protocol.py) converts WebSocket messages
+    → TextFrame or AudioRawFrame. Audio frames are forwarded untouched.
     """
 
     async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+
         if isinstance(frame, TextFrame):
             txt = frame.text.strip()
             if txt.lower() == "stop":
@@ -77,16 +84,32 @@ class ReactNativeInputInterceptor(FrameProcessor):
             else:
                 print(f"[RN TEXT] {txt}")
 
-        elif isinstance(frame, AudioRawFrame):
-            print(f"[RN AUDIO] {len(frame.audio)} bytes")
-
-        return await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
 
 
 # ---------------- MAIN APP ---------------- #
 load_dotenv(override=True)
 app = FastAPI()
 
+FRAME_LOG = _env_flag("FRAME_LOG")
+
+# tracemalloc / GC profiling per session (ALLOC_PROFILE=1)
+allocation_profiler = AllocationProfiler.from_env()
+
+# Caps concurrent pipelines in this process (MAX_SESSIONS, MAX_QUEUED_SESSIONS, SESSION_QUEUE_TIMEOUT)
+session_manager = SessionManager.from_env()
+
+BUSY_MESSAGE = os.getenv(
+    "BUSY_MESSAGE",
+    "I'm sorry, I'm helping a lot of people right now. Please try again in a few minutes.",
+)
+
+# How long the greeting waits for the resident's messages/calls to load
+STATE_WAIT = float(os.getenv("STATE_WAIT", "1.0"))
+
+# Extra observers for every session's PipelineTask, one per session (e.g. bench_pipeline.py)
+session_observer_factories: List[Callable[[], object]] = []
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -116,44 +139,100 @@ async def index():
     return HTMLResponse(content=html)
 
 
-# ---------------- BOT STREAM ---------------- #
-async def run_bot_stream(websocket_client: WebSocket):
-    print("Starting live audio stream bot...")
+@app.get("/sessions")
+async def sessions():
+    """Live session counts and per-session resource usage"""
+    return session_manager.snapshot()
+
+
+@app.get("/profile")
+async def profile():
+    """Allocation reports for recent sessions (requires ALLOC_PROFILE=1)"""
+    return {
+        "enabled": allocation_profiler.enabled,
+        "sessions": list(allocation_profiler.reports),
+    }
 
-    transport = FastAPIWebsocketTransport(
+
+# ---------------- BOT STREAM ---------------- #
+def create_transport(
+    websocket_client: WebSocket, protocol: str = PROTOCOL_JSON, vad: bool = True
+) -> FastAPIWebsocketTransport:
+    return FastAPIWebsocketTransport(
         websocket=websocket_client,
         params=FastAPIWebsocketParams(
-            audio_in_enabled=True,
+            audio_in_enabled=vad,
             audio_out_enabled=True,
             add_wav_header=False,
-            vad_analyzer=SileroVADAnalyzer(),
-            serializer=FastAPIWebsocketSerializer(),
+            vad_analyzer=create_vad_analyzer() if vad else None,
+            serializer=create_serializer(protocol),
         ),
     )
 
-    # AI services
-    llm = PerplexityLLMService(api_key=os.getenv("PERPLEXITY_API_KEY"), model="sonar")
-    stt = DeepgramSTTService(api_key=os.getenv("DEEPGRAM_API_KEY"), audio_passthrough=True)
-    tts = DeepgramTTSService(api_key=os.getenv("DEEPGRAM_API_KEY"), voice="aura-2-andromeda-en")
+
+def create_tts():
+    # Providers come from Config (TTS_PROVIDER / TTS_FALLBACK_PROVIDER)
+    return create_stage("tts")
+
+
+async def reject_with_message(
+    websocket_client: WebSocket, protocol: str = PROTOCOL_JSON, text: str = BUSY_MESSAGE
+):
+    """Speak a short apology to a connection we have no capacity for, then hang up."""
+    transport = create_transport(websocket_client, protocol, vad=False)
+    task = PipelineTask(
+        Pipeline([create_tts(), transport.output()]),
+        params=PipelineParams(audio_out_sample_rate=16000),
+    )
+    await task.queue_frames([TTSSpeakFrame(text), EndFrame()])
+    runner = PipelineRunner(handle_sigint=False)
+    try:
+        await asyncio.wait_for(runner.run(task), timeout=15)
+    except Exception as e:
+        print(f"Busy message failed: {e}")
+
+
+async def run_bot_stream(
+    websocket_client: WebSocket,
+    protocol: str = PROTOCOL_JSON,
+    user_id: str = RESIDENT_USER_ID,
+):
+    print(f"Starting live audio stream bot ({protocol}) for {user_id}...")
+
+    transport = create_transport(websocket_client, protocol)
+
+    # AI services from Config; stages with a fallback provider fail over on slow p95 TTFB
+    latency_tracker = LatencyTracker()
+    stt, llm, tts = create_services(tracker=latency_tracker, stt_options={"audio_passthrough": True})
 
     # Context
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    context = OpenAILLMContext(messages)
-    context_aggregator = llm.create_context_aggregator(context)
+    context = OpenAILLMContext(messages, tools=get_tools())
+    context_aggregator = create_context_aggregator(llm, context)
+    # Backend tools; a turn's calls run concurrently, with a filler phrase if slow
+    register_function_handlers(llm, user_id=user_id)
+    # Unread messages and pending calls, fetched while the pipeline starts
+    state_task = asyncio.create_task(inject_user_state(context, user_id))
+    # Keeps the prompt to SYSTEM_PROMPT + rolling summary + recent turns
+    context_window = ContextWindowManager()
 
     # Pipeline
     pipeline = Pipeline(
         [
             transport.input(),
-            FrameLogger(),
-            InputLogger(),
+            *([FrameLogger()] if FRAME_LOG else []),
             ReactNativeInputInterceptor(),   # ✅ Your custom handler
-            InputLogger(),
             stt,
             TranscriptionLogger(),
             context_aggregator.user(),
+            context_window,
+            IntentFastPath(user_id=user_id),  # obvious send/call requests skip the LLM
             llm,
+            context_window.latency_meter(),
+            BackendEventAnnouncer(context, user_id),  # new messages / incoming calls
             tts,
+            # Opus holds back a partial packet; sent once the reply's audio ends
+            *([EndOfSpeechFlush()] if protocol == PROTOCOL_OPUS else []),
             transport.output(),
             context_aggregator.assistant(),
         ]
@@ -167,17 +246,27 @@ async def run_bot_stream(websocket_client: WebSocket):
             allow_interruptions=True,
             enable_metrics=True,
             enable_usage_metrics=True,
-        )
+        ),
+        observers=[latency_tracker, *(factory() for factory in session_observer_factories)],
     )
+    latency_tracker.attach(task)
 
-    runner = PipelineRunner(handle_sigint=False, force_gc=True)
+    @transport.event_handler("on_client_disconnected")
+    async def on_client_disconnected(transport, client):
+        # Otherwise the session lingers until the pipeline's idle timeout
+        await task.cancel()
+
+    # No force_gc: a full collection per pipeline stalls every other session on this loop
+    runner = PipelineRunner(handle_sigint=False)
 
     # Start the pipeline (it now owns the websocket)
     print("✅ Starting pipeline...")
     pipeline_task = asyncio.create_task(runner.run(task))
 
-    # Warm-up: send initial message
+    # Warm-up: send initial message, giving the user's state a moment to land
+    # so the greeting can mention it (it is still added if it arrives later)
     await asyncio.sleep(0.5)
+    await asyncio.wait({state_task}, timeout=STATE_WAIT)
     messages.append({"role": "user", "content": "Hello, please introduce yourself."})
     await task.queue_frames([LLMRunFrame()])
 
@@ -195,9 +284,20 @@ async def run_bot_stream(websocket_client: WebSocket):
 # ---------------- ENDPOINT ---------------- #
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    print("✅ WebSocket connection accepted.")
-    await run_bot_stream(websocket)
+    # Wire format is fixed per connection: JSON/base64 or binary PCM16 frames
+    protocol, subprotocol = negotiate_protocol(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    print(f"✅ WebSocket connection accepted ({protocol}).")
+    client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else ""
+    user_id = websocket.query_params.get("user_id") or RESIDENT_USER_ID
+    try:
+        async with session_manager.session(client) as stats:
+            print(f"Session {stats.session_id} admitted ({session_manager.active_count} active)")
+            async with allocation_profiler.session(stats.session_id):
+                await run_bot_stream(websocket, protocol, user_id)
+    except CapacityError as e:
+        print(f"Rejecting connection from {client}: {e}")
+        await reject_with_message(websocket, protocol)
 
 
 # ---------------- MAIN ---------------- #
@@ -208,4 +308,5 @@ if __name__ == "__main__":
     print(f"PERPLEXITY API: {'Set' if os.getenv('PERPLEXITY_API_KEY') else 'NOT SET'}")
     print(f"DEEPGRAM API: {'Set' if os.getenv('DEEPGRAM_API_KEY') else 'NOT SET'}")
 
+    # For several worker processes use supervisor.py instead
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8765")))
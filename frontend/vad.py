@@ -0,0 +1,83 @@
+"""
+Silero VAD with one ONNX inference session per process.
+
+`SileroVADAnalyzer` loads the model and builds a new onnxruntime session for
+every pipeline. The session itself is stateless (the recurrent state lives in
+`SileroOnnxModel`), so all pipelines in a process can share it. Loading it
+before the supervisor forks workers also lets them share the pages
+copy-on-write.
+
+VAD_ANALYZER=energy swaps in `EnergyVADAnalyzer`, a model-free RMS threshold
+that makes synthetic test audio (tone bursts) produce deterministic turns;
+see bench_pipeline.py.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+_shared_model: Optional[SileroOnnxModel] = None
+
+
+def preload_vad_model() -> SileroOnnxModel:
+    """Load the Silero model once for this process (idempotent)."""
+    global _shared_model
+    if _shared_model is None:
+        # Building a throwaway analyzer resolves the packaged model path for us
+        _shared_model = SileroVADAnalyzer()._model
+        logger.debug("Silero VAD model preloaded")
+    return _shared_model
+
+
+class SharedSileroVADAnalyzer(SileroVADAnalyzer):
+    """Silero VAD analyzer that reuses the process-wide inference session"""
+
+    def __init__(self, *, sample_rate: Optional[int] = None, params: Optional[VADParams] = None):
+        VADAnalyzer.__init__(self, sample_rate=sample_rate, params=params)
+
+        # Per-pipeline recurrent state on top of the shared session
+        model = SileroOnnxModel.__new__(SileroOnnxModel)
+        model.session = preload_vad_model().session
+        model.sample_rates = [8000, 16000]
+        model.reset_states()
+
+        self._model = model
+        self._last_reset_time = 0
+
+
+class EnergyVADAnalyzer(VADAnalyzer):
+    """Voice = RMS above a threshold; deterministic, for offline benchmarks"""
+
+    def __init__(
+        self,
+        *,
+        threshold_rms: float = 500.0,
+        sample_rate: Optional[int] = None,
+        params: Optional[VADParams] = None,
+    ):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self.threshold_rms = threshold_rms
+
+    def num_frames_required(self) -> int:
+        # 32 ms windows, like Silero
+        return int((self.sample_rate or 16000) * 0.032)
+
+    def voice_confidence(self, buffer) -> float:
+        samples = np.frombuffer(buffer, dtype=np.int16).astype(np.float32)
+        if not samples.size:
+            return 0.0
+        return 1.0 if float(np.sqrt(np.mean(samples * samples))) >= self.threshold_rms else 0.0
+
+
+def create_vad_analyzer() -> VADAnalyzer:
+    """The analyzer selected by VAD_ANALYZER (silero by default, or energy)."""
+    kind = os.getenv("VAD_ANALYZER", "silero").lower()
+    if kind == "energy":
+        return EnergyVADAnalyzer()
+    if kind != "silero":
+        raise ValueError(f"Unknown VAD_ANALYZER {kind!r}; expected silero or energy")
+    return SharedSileroVADAnalyzer()